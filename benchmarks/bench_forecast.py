@@ -0,0 +1,45 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+from forecast_engine import monte_carlo_bands
+
+# Throughput of the Monte Carlo forecast engine in simulated path-steps per second.
+# Run from the project root:
+#   python benchmarks/bench_forecast.py
+#   python benchmarks/bench_forecast.py --sizes 1000x500 1000000x2500 --out bench_forecast.json
+
+TRANSMAT = np.array([[0.99, 0.01], [0.03, 0.97]])
+MEANS = np.array([0.0006, -0.0008])
+STDS = np.array([0.011, 0.028])
+
+def bench(n_sims, n_steps, workers=None, max_chunk_mb=256, seed=0):
+  start = time.perf_counter()
+  monte_carlo_bands(100.0, [0.9, 0.1], TRANSMAT, MEANS, STDS, n_steps=n_steps, n_sims=n_sims, seed=seed, max_chunk_mb=max_chunk_mb, workers=workers)
+  elapsed = time.perf_counter() - start
+  return {"n_sims": n_sims, "n_steps": n_steps, "seconds": elapsed, "path_steps_per_sec": n_sims * n_steps / elapsed}
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the Monte Carlo forecast engine.")
+  parser.add_argument("--sizes", nargs="+", default=["1000x500", "10000x500", "100000x2500"], help="Runs as <n_sims>x<n_steps>")
+  parser.add_argument("--workers", type=int, default=None)
+  parser.add_argument("--max-chunk-mb", type=float, default=256)
+  parser.add_argument("--out", help="Write the results to this JSON file")
+  args = parser.parse_args()
+
+  results = []
+  for size in args.sizes:
+    n_sims, n_steps = (int(v) for v in size.split("x"))
+    r = bench(n_sims, n_steps, args.workers, args.max_chunk_mb)
+    print(f"{n_sims:>9} sims x {n_steps:>5} steps: {r['seconds']:8.2f}s  {r['path_steps_per_sec'] / 1e6:8.1f}M path-steps/s")
+    results.append(r)
+  if args.out:
+    Path(args.out).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT))
+from hmmlearn.hmm import GaussianHMM
+from utils import trace
+from utils.bars import annual_periods
+from utils.columnar import load_table
+from utils.model_store import load_params, model_path, order_states
+from utils.synthetic import TRUE_PARAMS, generate_ohlcv, recovery_errors
+from backtest_engine import run_strategies
+from forecast_engine import monte_carlo_bands
+from metrics_engine import bootstrap_metrics, rolling_drawdown, rolling_sharpe, summary_metrics
+from process_returns import compute_returns, load_prices
+from main import stages
+
+# Scaling benchmark of the whole pipeline on synthetic bars from a known 2-state HMM.
+# Run from the project root:
+#   python benchmarks/bench_pipeline.py
+#   python benchmarks/bench_pipeline.py --sizes 1000 100000 10000000 --out bench_pipeline.json
+#
+# Every size gets a scratch project directory with its own config and raw CSV. Two layers are timed:
+#   kernels: the core functions called in-process (wall time and tracemalloc peak)
+#   stages:  every pipeline script run as its own process, as main.py --isolated runs it (wall time
+#            and CPU time from os.wait4, peak RSS as the child measured it)
+# The fitted model is then compared with the generator's parameters. The check only fails when
+# there are enough bars to expect recovery.
+
+SYMBOL = "SYNTH"
+RECOVERY_MIN_BARS = 10_000
+RECOVERY_TOLERANCE = {"mean_abs_err": 0.001, "std_rel_err": 0.1, "transmat_abs_err": 0.02, "state_accuracy": 0.9}
+
+# Writes a scratch project for one size: the config (cache and optional stages off) and the raw bars
+def make_workdir(workdir, n_bars, seed, n_iter):
+  with open(ROOT / "config" / "base.yaml") as f:
+    cfg = yaml.safe_load(f)
+  cfg["data"].update(symbol=SYMBOL, raw_path=f"data/raw/{SYMBOL}.csv", processed_path=f"data/processed/{SYMBOL}_processed.csv")
+  cfg["model"].update(n_components=len(TRUE_PARAMS["means"]), n_iter=n_iter, warm_start=False)
+  cfg["model_selection"]["enabled"] = False
+  cfg["walk_forward"]["enabled"] = False
+  cfg["universe"].update(symbols=[], glob=None)
+  cfg["cache"]["enabled"] = False
+  (workdir / "config").mkdir(parents=True)
+  with open(workdir / "config" / "base.yaml", "w") as f:
+    yaml.safe_dump(cfg, f, sort_keys=False)
+
+  df, states = generate_ohlcv(n_bars, seed=seed)
+  raw = workdir / cfg["data"]["raw_path"]
+  raw.parent.mkdir(parents=True)
+  df.to_csv(raw, index=False)
+  return cfg, states
+
+# Wall time and tracemalloc peak of one in-process call
+def measure(fn, *args, **kwargs):
+  tracemalloc.start()
+  start = time.perf_counter()
+  out = fn(*args, **kwargs)
+  elapsed = time.perf_counter() - start
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return out, {"wall_s": elapsed, "peak_mb": peak / 2**20}
+
+def run_kernels(cfg, workdir):
+  results = {}
+  df, results["load_prices"] = measure(load_prices, workdir / cfg["data"]["raw_path"])
+  df, results["compute_returns"] = measure(compute_returns, df, price=cfg["data"]["price_col"])
+  price = df[cfg["data"]["price_col"]]
+  X = df[cfg["model"]["target_col"]].dropna().values.reshape(-1, 1)
+  X_train = X[:int(len(X) * cfg["model"]["train_frac"])]
+
+  def fit():
+    model = GaussianHMM(n_components=cfg["model"]["n_components"], covariance_type=cfg["model"]["covariance_type"], n_iter=cfg["model"]["n_iter"], random_state=cfg["model"]["seed"])
+    return order_states(model.fit(X_train))
+  model, results["hmm_fit"] = measure(fit)
+  states, results["hmm_inference"] = measure(lambda: (model.predict_proba(X), model.predict(X))[1])
+
+  fc = cfg["forecasting"]
+  stds = np.sqrt(model._covars_.reshape(model.n_components, -1)[:, 0])
+  _, results["forecast_simulation"] = measure(
+    monte_carlo_bands, float(price.iloc[-1]), model.predict_proba(X)[-1], model.transmat_, model.means_[:, 0], stds,
+    n_steps=fc["n_steps"], n_sims=fc["n_sims"], seed=fc["seed"], max_chunk_mb=fc["max_chunk_mb"], workers=fc["workers"]
+  )
+
+  bt = cfg["backtest"]
+  px = price.iloc[1:]
+  curves, results["backtest"] = measure(run_strategies, px, states, bt["strategies"], px.iloc[0] * (1 - bt["transaction_cost"]), default_cost=bt["transaction_cost"])
+
+  mc = cfg["metrics"]
+  periods = annual_periods(cfg)
+  def metrics():
+    values = curves.values
+    summary_metrics(values, px.iloc[0], periods)
+    rolling_sharpe(values, mc["rolling_window"], periods)
+    rolling_drawdown(values, mc["rolling_window"])
+    boot = mc["bootstrap"]
+    if boot["n_resamples"] > 0 and len(values) > boot["block_size"]:
+      bootstrap_metrics(values, boot["n_resamples"], boot["block_size"], boot["confidence"], periods, boot["batch_size"], boot["seed"])
+  _, results["metrics"] = measure(metrics)
+  return results, model, states
+
+# Runs every pipeline script as a child process of the scratch project, stopping at the first failure
+def run_stages(workdir):
+  results = {}
+  for stage in stages:
+    result, usage = trace.run_process(trace.probed_command(sys.executable, str(ROOT / stage["script"])), cwd=workdir)
+    results[stage["name"]] = {
+      "wall_s": usage["wall_s"],
+      "cpu_s": usage["cpu_user_s"] + usage["cpu_sys_s"],
+      "max_rss_mb": usage["max_rss_mb"],
+      "returncode": result.returncode
+    }
+    if result.returncode != 0:
+      results[stage["name"]]["error"] = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else ""
+      break
+  return results
+
+def check_recovery(n_bars, means, stds, transmat, true_states, fitted_states):
+  errors = recovery_errors(means, stds, transmat, true_states, fitted_states)
+  checked = n_bars >= RECOVERY_MIN_BARS
+  failed = [k for k, tol in RECOVERY_TOLERANCE.items() if (errors[k] < tol if k == "state_accuracy" else errors[k] > tol)]
+  return {**errors, "checked": checked, "passed": not (checked and failed), "failed": failed if checked else []}
+
+def bench(n_bars, seed=0, n_iter=100, layers=("kernels", "stages"), keep=False):
+  workdir = Path(tempfile.mkdtemp(prefix=f"hmm_bench_{n_bars}_"))
+  try:
+    cfg, true_states = make_workdir(workdir, n_bars, seed, n_iter)
+    result = {"n_bars": n_bars}
+    # log_ret is undefined on the first bar, so fitted states line up with true_states[1:]
+    if "kernels" in layers:
+      result["kernels"], model, fitted_states = run_kernels(cfg, workdir)
+      stds = np.sqrt(model._covars_.reshape(model.n_components, -1)[:, 0])
+      result["recovery"] = check_recovery(n_bars, model.means_[:, 0], stds, model.transmat_, true_states[1:], fitted_states)
+    if "stages" in layers:
+      result["stages"] = run_stages(workdir)
+      artifact = workdir / model_path(SYMBOL)
+      if "recovery" not in result and artifact.exists():
+        params, _ = load_params(artifact)
+        fitted = load_table(workdir / f"reports/{SYMBOL}/tables/{SYMBOL}_probs_states.csv", cfg["storage"], columns=["state"])["state"].values
+        stds = np.sqrt(params["covars"].reshape(len(params["means"]), -1)[:, 0])
+        result["recovery"] = check_recovery(n_bars, params["means"][:, 0], stds, params["transmat"], true_states[1:], fitted)
+    if keep:
+      result["workdir"] = str(workdir)
+    return result
+  finally:
+    if not keep:
+      shutil.rmtree(workdir, ignore_errors=True)
+
+def environment():
+  import hmmlearn
+  try:
+    commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+  except OSError:
+    commit = None
+  return {
+    "commit": commit,
+    "created_at": datetime.now().isoformat(),
+    "python": platform.python_version(),
+    "numpy": np.__version__,
+    "pandas": pd.__version__,
+    "hmmlearn": hmmlearn.__version__,
+    "platform": platform.platform(),
+    "cpu_count": os.cpu_count()
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic regime-switching data.")
+  parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000], help="Numbers of bars to generate")
+  parser.add_argument("--layers", nargs="+", choices=["kernels", "stages"], default=["kernels", "stages"])
+  parser.add_argument("--n-iter", type=int, default=100, help="EM iterations of the HMM fit")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--keep", action="store_true", help="Keep the scratch project directories")
+  parser.add_argument("--out", help="Write the results to this JSON file")
+  args = parser.parse_args()
+
+  results = []
+  for n_bars in args.sizes:
+    r = bench(n_bars, args.seed, args.n_iter, args.layers, args.keep)
+    print(f"{n_bars:>10} bars")
+    for layer in ("kernels", "stages"):
+      for name, m in r.get(layer, {}).items():
+        if "peak_mb" in m:
+          mem = f"{m['peak_mb']:9.1f} MB peak"
+        else:
+          mem = f"{m['max_rss_mb']:9.1f} MB RSS " if m["max_rss_mb"] is not None else f"{'?':>9} MB RSS "
+        print(f"  {layer:<8} {name:<20} {m['wall_s']:9.3f}s {mem}{'  FAILED: ' + m['error'] if 'error' in m else ''}")
+    if "recovery" in r:
+      rec = r["recovery"]
+      verdict = ("ok" if rec["passed"] else f"FAILED ({', '.join(rec['failed'])})") if rec["checked"] else "not checked"
+      print(f"  recovery: state accuracy {rec['state_accuracy']:.3f}, transmat err {rec['transmat_abs_err']:.4f}, std err {rec['std_rel_err']:.3f} -> {verdict}")
+    results.append(r)
+  if args.out:
+    Path(args.out).write_text(json.dumps({"environment": environment(), "results": results}, indent=2))
+  if any(not r.get("recovery", {}).get("passed", True) for r in results):
+    sys.exit(1)
+
+if __name__ == "__main__":
+  main()
@@ -1,29 +1,365 @@
-import subprocess
+import argparse
+import copy
+import importlib
+import os
+import string
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 
-# Define the scripts to run in order
-scripts = [
-    ("src/process_returns.py", "Processing returns..."),
-    ("src/prep_model.py", "Preparing model..."),
-    ("src/run_model.py", "Running model..."),
-    ("src/plot_results.py", "Plotting results..."),
-    ("src/forecast.py", "Forecasting..."),
-    ("src/plot_forecast.py", "Plotting forecast..."),
-    ("src/backtest.py", "Running backtest..."),
-    ("src/backtest_data.py", "Preparing backtest data...")
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+from utils import cache, columnar, trace
+from utils.config import apply_symbol, load_config, universe_symbols
+
+# Define the stages to run in order. Each stage declares what it depends on (input files, config
+# keys and source files) and the files it produces so unchanged stages can be restored from the cache.
+# Paths are templates filled in with the symbol and the data paths of the config; a "table:" prefix
+# marks a table stored in the format of the storage config (a CSV and/or a columnar directory).
+#
+# Stages run in one process as the function named by "function", imported only when the stage runs,
+# so a fully cached run never imports hmmlearn or matplotlib. Frames a stage returns ("gives") are
+# handed to the later stages that take them ("takes") instead of being read back from disk. With
+# --isolated, each stage runs its "script" in its own interpreter instead.
+TABLES = "reports/{symbol}/tables/{symbol}"
+FIGURES = "reports/{symbol}/figures/{symbol}"
+TEMP = "data/temp/{symbol}/{symbol}"
+MODEL = "models/{symbol}/{symbol}_hmm.npz"
+
+stages = [
+    {
+        "name": "resample_bars", "script": "src/resample_bars.py", "message": "Resampling bars...",
+        "function": "resample_bars.resample_bars", "takes": [], "gives": [],
+        "inputs": ["{bars_source}"],
+        "config": ["data.raw_path", "bars"],
+        "sources": ["src/utils/bars.py", "src/process_returns.py"],
+        "outputs": ["{bars_path}"],
+    },
+    {
+        "name": "process_returns", "script": "src/process_returns.py", "message": "Processing returns...",
+        "function": "process_returns.process_returns", "takes": [], "gives": ["processed"],
+        "inputs": ["{raw_path}"],
+        "config": ["data.raw_path", "data.price_col", "ingest"],
+        "sources": [],
+        "outputs": ["table:{processed_path}"],
+    },
+    {
+        "name": "build_features", "script": "src/feature_store.py", "message": "Building features...",
+        "function": "feature_store.build_features", "takes": ["processed"], "gives": [],
+        "inputs": ["table:{processed_path}"],
+        "config": ["data.price_col", "model.target_col", "features"],
+        "sources": [],
+        "outputs": ["table:{features_path}"],
+    },
+    {
+        "name": "prep_model", "script": "src/prep_model.py", "message": "Preparing model...",
+        "function": "prep_model.prep_model", "takes": ["processed"], "gives": ["train", "full"],
+        "inputs": ["table:{processed_path}", "table:{features_path}"],
+        "config": ["model.target_col", "model.train_frac", "features.enabled", "features.columns"],
+        "sources": [],
+        "outputs": [f"table:{TEMP}_train_data.csv", f"table:{TEMP}_full_data.csv"],
+    },
+    {
+        "name": "run_model", "script": "src/run_model.py", "message": "Running model...",
+        "function": "run_model.run_model", "takes": ["processed", "train", "full"], "gives": ["model", "probs_states"],
+        "inputs": ["table:{processed_path}", f"table:{TEMP}_train_data.csv", f"table:{TEMP}_full_data.csv"],
+        "config": ["model", "model_selection", "walk_forward"],
+        "sources": ["src/utils/model_store.py", "src/utils/regimes.py", "src/model_selection.py", "src/walk_forward.py"],
+        "outputs": [f"{TABLES}_transition_matrix.csv", f"table:{TABLES}_probs_states.csv", f"{TABLES}_metadata.json", MODEL, "{model_selection_path}"],
+    },
+    {
+        "name": "plot_results", "script": "src/plot_results.py", "message": "Plotting results...",
+        "function": "plot_engine.plot_results", "takes": ["probs_states"], "gives": [],
+        "inputs": [f"table:{TABLES}_probs_states.csv"],
+        "config": ["data.price_col", "model.target_col", "plotting"],
+        "sources": ["src/plot_engine.py", "src/utils/regimes.py"],
+        "outputs": [f"{FIGURES}_price_and_return_with_regime.png", f"{FIGURES}_returns_histogram.png"],
+    },
+    {
+        "name": "forecast", "script": "src/forecast.py", "message": "Forecasting...",
+        "function": "forecast.forecast", "takes": ["model", "probs_states"], "gives": ["forecast"],
+        "inputs": [f"table:{TABLES}_probs_states.csv", f"{TABLES}_transition_matrix.csv", MODEL],
+        "config": ["data.price_col", "forecasting", "bars"],
+        "sources": ["src/utils/model_store.py", "src/utils/bars.py", "src/forecast_engine.py", "src/forecast_cache.py"],
+        "outputs": [f"{TABLES}_forecast.csv"],
+    },
+    {
+        "name": "plot_forecast", "script": "src/plot_forecast.py", "message": "Plotting forecast...",
+        "function": "plot_engine.plot_forecast", "takes": ["probs_states"], "gives": [],
+        "inputs": [f"table:{TABLES}_probs_states.csv", f"{TABLES}_forecast.csv"],
+        "config": ["data.price_col", "forecasting", "plotting"],
+        "sources": ["src/plot_engine.py", "src/utils/regimes.py"],
+        "outputs": [f"{FIGURES}_forecast.png"],
+    },
+    {
+        "name": "backtest", "script": "src/backtest.py", "message": "Running backtest...",
+        "function": "backtest.backtest", "takes": ["probs_states"], "gives": ["strategies"],
+        "inputs": [f"table:{TABLES}_probs_states.csv", f"{TABLES}_transition_matrix.csv"],
+        "config": ["data.price_col", "backtest", "metrics.periods_per_year", "bars", "plotting"],
+        "sources": ["src/utils/bars.py", "src/backtest_engine.py", "src/metrics_engine.py", "src/plot_engine.py", "src/utils/regimes.py"],
+        "outputs": [f"{TABLES}_strategies.csv", f"{FIGURES}_backtest_results.png", "{sweep_path}"],
+    },
+    {
+        "name": "backtest_data", "script": "src/backtest_data.py", "message": "Preparing backtest data...",
+        "function": "backtest_data.backtest_data", "takes": ["strategies"], "gives": ["metrics"],
+        "inputs": [f"{TABLES}_strategies.csv"],
+        "config": ["data.price_col", "backtest.strategies", "metrics", "bars"],
+        "sources": ["src/utils/bars.py", "src/metrics_engine.py"],
+        "outputs": [f"{TABLES}_metrics.csv", f"{TABLES}_rolling_metrics.csv", f"{TABLES}_metrics_ci.csv"],
+    },
 ]
+stage_names = [stage["name"] for stage in stages]
+
+# Subcommands that run a group of stages, with the same caching and tracing as a full run
+STAGE_GROUPS = {
+    "ingest": ["resample_bars", "process_returns", "build_features"],
+    "fit": ["prep_model", "run_model"],
+    "forecast": ["forecast"],
+    "backtest": ["backtest"],
+    "metrics": ["backtest_data"],
+    "plot": ["plot_results", "plot_forecast"],
+    "run": stage_names,
+}
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Plain `main.py [--force ...]` runs the whole pipeline, as it always has
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv = ["run", *argv]
+    parser = argparse.ArgumentParser(description="Run the HMM regime detection pipeline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    helps = {
+        "run": "Run every stage (the default)",
+        "ingest": "Resample ticks into bars, process the raw prices and build the features",
+        "fit": "Split the model inputs and fit the HMM",
+        "forecast": "Forecast price bands and regime probabilities",
+        "backtest": "Backtest the configured strategies",
+        "metrics": "Score the backtested strategies",
+        "plot": "Draw the regime and forecast figures",
+    }
+    for name, help in helps.items():
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("--symbol", help="Run this symbol instead of the configured universe or data.symbol")
+        sub.add_argument("--force", action="store_true", help="Rerun every stage, ignoring the stage cache")
+        sub.add_argument("--profile", choices=["cprofile", "py-spy"], help="Profile every stage that runs and save the dumps next to the trace")
+        sub.add_argument("--isolated", action="store_true", help="Run every stage in its own interpreter, as separate scripts")
+        if name == "run":
+            sub.add_argument("--from-stage", choices=stage_names, help="Rerun this stage and every stage after it")
+        if name == "ingest":
+            sub.add_argument("--append", action="store_true", help="Only add raw rows newer than the last processed date (same as ingest.mode: append)")
+    sub = commands.add_parser("filter", help="Filter new bars incrementally and append them to the probability table")
+    sub.add_argument("source", help="CSV of new bars (date, OHLCV), e.g. a replayed file or one being appended to")
+    sub.add_argument("--symbol", help="Symbol the bars belong to (defaults to data.symbol)")
+    sub.add_argument("--follow", action="store_true", help="Keep watching the source for appended bars")
+    sub.add_argument("--interval", type=float, default=1.0, help="Seconds between polls with --follow")
+    sub.add_argument("--lag", type=int, default=0, help="Also write fixed-lag smoothed states with this lag")
+    sub = commands.add_parser("regime", help="Print the regime probabilities at the last bar of fitted symbols")
+    sub.add_argument("symbols", nargs="*", help="Symbols to show (defaults to data.symbol)")
+    return parser.parse_args(argv)
 
 def main():
-    for script in scripts:
-        print(f"\n{script[1]}")
-        result = subprocess.run([sys.executable, script[0]], capture_output=True, text=True)
-        print(result.stdout)
-        if result.returncode != 0:
-            print(f"Error running {script}:")
-            print(result.stderr)
-            sys.exit(result.returncode)
-    print("\nPipeline completed successfully.")
+    args = parse_args()
+    cfg = load_config()
+    if args.command == "filter":
+        return filter_bars(cfg, args)
+    if args.command == "regime":
+        return print_regimes(cfg, args.symbols or [cfg["data"]["symbol"]])
+
+    names = STAGE_GROUPS[args.command]
+    if getattr(args, "append", False):
+        cfg["ingest"]["mode"] = "append"
+    from_stage = getattr(args, "from_stage", None)
+    first_forced = 0 if args.force else names.index(from_stage) if from_stage else len(names)
+    run = {"run_id": datetime.now().strftime("%Y%m%d-%H%M%S"), "started_at": datetime.now().isoformat(), "argv": sys.argv[1:]}
+    start = time.perf_counter()
+    exit_code = 0
+    symbols = [] if args.symbol else universe_symbols(cfg)
+    env = None
+    if args.symbol:
+        apply_symbol(cfg, args.symbol)
+        env = {**os.environ, "HMM_SYMBOL": args.symbol}
+    if symbols:
+        entries = run_universe(symbols, cfg, names, cfg["universe"].get("workers"), first_forced, args.profile, run["run_id"], args.isolated)
+    else:
+        entries = []
+        frames = {}
+        for i, name in enumerate(names):
+            stage = stages[stage_names.index(name)]
+            print(f"\n{stage['message']}")
+            result, entry = run_stage(stage, cfg, force=i >= first_forced, env=env, profiler=args.profile, run_id=run["run_id"], frames=frames, isolated=args.isolated)
+            entries.append(entry)
+            if result is None:
+                print("Unchanged, restored from cache.")
+                continue
+            print(result.stdout)
+            rss = "unknown" if entry["max_rss_mb"] is None else f"{entry['max_rss_mb']:.0f} MB"
+            print(f"Finished in {entry['wall_s']:.2f}s (CPU {entry['cpu_user_s'] + entry['cpu_sys_s']:.2f}s, peak RSS {rss}).")
+            if result.returncode != 0:
+                print(f"Error running {stage['script']}:")
+                print(result.stderr)
+                exit_code = result.returncode
+                break
+        else:
+            print("\nPipeline completed successfully." if args.command == "run" else f"\n{args.command.capitalize()} completed successfully.")
+
+    trace_cfg = cfg["trace"]
+    if trace_cfg["enabled"]:
+        run.update(finished_at=datetime.now().isoformat(), wall_s=round(time.perf_counter() - start, 4), stages=entries)
+        print(f"Trace written to {trace.write_trace(trace_cfg['dir'], run)}")
+    cache_cfg = cfg["cache"]
+    if cache_cfg["enabled"]:
+        cache.evict(cache_cfg["dir"], cache_cfg["max_size_mb"] * 1024 * 1024)
+    if exit_code:
+        sys.exit(exit_code)
+
+# Filters the bars of a CSV with online_filter.py in this process
+def filter_bars(cfg, args):
+    from online_filter import stream
+
+    if args.symbol:
+        apply_symbol(cfg, args.symbol)
+    n_new = stream(cfg, args.source, follow=args.follow, interval=args.interval, lag=args.lag)
+    print(f"Appended {n_new} new bars.")
+
+# Prints the last row of each symbol's probability table, reading only that row
+def print_regimes(cfg, symbols):
+    for symbol in symbols:
+        last = columnar.tail_table(f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"])
+        probs = {c[:-len("_prob")]: last[c].iloc[-1] for c in last.columns if c.endswith("_prob")}
+        state = int(last["state"].iloc[-1])
+        print(f"{symbol} {last.index[-1]:%Y-%m-%d %H:%M}: {list(probs)[state]} (" + ", ".join(f"{k} {v:.3f}" for k, v in probs.items()) + ")")
+
+# Looks up a dotted key such as "model.n_iter" in the config
+def config_value(cfg, key):
+    value = cfg
+    for part in key.split("."):
+        value = value[part]
+    return value
+
+# Files and directories behind a stage's path templates, skipping those whose fields are None
+def stage_paths(templates, fields, storage):
+    paths = []
+    for template in templates:
+        if any(fields.get(name, "") is None for _, name, _, _ in string.Formatter().parse(template) if name):
+            continue
+        if template.startswith("table:"):
+            paths.extend(columnar.table_files(template[len("table:"):].format(**fields), storage))
+        else:
+            paths.append(template.format(**fields))
+    return paths
+
+# Values of the path templates' fields for the configured symbol. Fields of files a run does not
+# write are None, so stage_paths leaves them out.
+def path_fields(cfg):
+    fields = {"symbol": cfg["data"]["symbol"], "raw_path": cfg["data"]["raw_path"], "processed_path": cfg["data"]["processed_path"]}
+    fields["features_path"] = cfg["features"]["path"].format(**fields)
+    # The raw file is only an output of resample_bars when it is resampled from ticks or minute bars
+    resample = cfg["bars"]["resample"]
+    fields["bars_source"] = resample["source"].format(**fields) if resample["enabled"] else None
+    fields["bars_path"] = fields["raw_path"] if resample["enabled"] else None
+    # The threshold sweep table is only written with backtest.sweep.enabled
+    fields["sweep_path"] = f"{TABLES}_sweep.csv".format(**fields) if cfg["backtest"]["sweep"]["enabled"] else None
+    # The model selection table is only written with model_selection.enabled
+    fields["model_selection_path"] = f"{TABLES}_model_selection.csv".format(**fields) if cfg["model_selection"]["enabled"] else None
+    return fields
+
+# The function behind a stage, imported on first use
+def stage_function(stage):
+    module, name = stage["function"].rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
+
+# Runs one stage, or restores it from the cache, and returns its result (None on a cache hit) and its
+# trace entry. frames holds the in-memory outputs of earlier stages; the stage's own are added to it,
+# or dropped when it is restored from the cache or run in its own interpreter.
+def run_stage(stage, cfg, force=False, env=None, profiler=None, run_id=None, frames=None, isolated=False):
+    frames = {} if frames is None else frames
+    fields = path_fields(cfg)
+    inputs = stage_paths(stage["inputs"], fields, cfg["storage"])
+    outputs = stage_paths(stage["outputs"], fields, cfg["storage"])
+    sources = [stage["script"], "src/utils/config.py", "src/utils/columnar.py"] + stage["sources"]
+    config_values = {key: config_value(cfg, key) for key in ["data.symbol", "storage"] + stage["config"]}
+
+    symbol = cfg["data"]["symbol"]
+    trace_cfg = cfg["trace"]
+    count_rows = trace_cfg["enabled"] and trace_cfg["count_rows"]
+    for name in stage["gives"]:
+        frames.pop(name, None)
+
+    cache_cfg = cfg["cache"]
+    start = time.perf_counter()
+    key = cache.stage_key(stage["name"], sources, inputs, config_values)
+    if cache_cfg["enabled"] and not force and cache.restore(cache_cfg["dir"], key, outputs):
+        usage = {"wall_s": round(time.perf_counter() - start, 4), "cpu_user_s": 0.0, "cpu_sys_s": 0.0, "max_rss_mb": 0.0}
+        return None, trace.stage_entry(stage["name"], symbol, "cached", usage, inputs, outputs, count_rows)
+
+    profile = None
+    if profiler:
+        suffix = ".prof" if profiler == "cprofile" else ".speedscope.json"
+        profile = Path(trace_cfg["dir"]) / run_id / f"{symbol}_{stage['name']}{suffix}"
+    if isolated or profiler == "py-spy":
+        result, usage = trace.run_process(trace.profiled_command(sys.executable, stage["script"], profiler, profile), env)
+    else:
+        kwargs = {name: frames[name] for name in stage["takes"] if name in frames}
+        result, value, usage = trace.run_inline(stage_function(stage), cfg, profile_path=profile, **kwargs)
+        values = value if len(stage["gives"]) > 1 else [value]
+        if result.returncode == 0 and stage["gives"]:
+            frames.update((name, v) for name, v in zip(stage["gives"], values) if v is not None)
+    if result.returncode == 0 and cache_cfg["enabled"] and all(Path(p).exists() for p in outputs):
+        cache.store(cache_cfg["dir"], key, outputs)
+    status = "ok" if result.returncode == 0 else "failed"
+    return result, trace.stage_entry(stage["name"], symbol, status, usage, inputs, outputs, count_rows, profile)
+
+# Runs a chain of stages for one symbol, stopping at the first failing stage
+def run_symbol(symbol, cfg=None, names=stage_names, first_forced=len(stages), profiler=None, run_id=None, isolated=False):
+    env = {**os.environ, "HMM_SYMBOL": symbol}
+    cfg = apply_symbol(copy.deepcopy(cfg) if cfg else load_config(), symbol)
+    entries = []
+    frames = {}
+    for i, name in enumerate(names):
+        stage = stages[stage_names.index(name)]
+        result, entry = run_stage(stage, cfg, force=i >= first_forced, env=env, profiler=profiler, run_id=run_id, frames=frames, isolated=isolated)
+        entries.append(entry)
+        if result is not None and result.returncode != 0:
+            return {"symbol": symbol, "status": "failed", "failed_script": stage["script"], "error": (result.stderr.strip().splitlines() or [""])[-1], "trace": entries}
+    return {"symbol": symbol, "status": "ok", "failed_script": None, "error": None, "trace": entries}
+
+# Runs every symbol of the universe in a worker pool, collects their metrics into one summary table
+# and returns the trace entries of all their stages
+def run_universe(symbols, cfg=None, names=stage_names, workers=None, first_forced=len(stages), profiler=None, run_id=None, isolated=False):
+    import pandas as pd
+
+    workers = workers or os.cpu_count()
+    print(f"\nRunning {len(symbols)} symbols on {workers} workers...")
+    results, entries = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_symbol, symbol, cfg, names, first_forced, profiler, run_id, isolated): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"symbol": futures[future], "status": "failed", "failed_script": None, "error": repr(e)}
+            print(f"{result['symbol']}: {result['status']}" + (f" ({result['failed_script']})" if result["failed_script"] else ""))
+            entries.extend(result.pop("trace", []))
+            results.append(result)
+
+    status_df = pd.DataFrame(results).set_index("symbol").sort_index()
+    metrics = []
+    for symbol in status_df.index[status_df["status"] == "ok"]:
+        p = Path(f"reports/{symbol}/tables/{symbol}_metrics.csv")
+        if p.exists():
+            metrics.append(pd.read_csv(p).assign(Symbol=symbol))
+
+    out_dir = Path("reports/universe")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    status_df.to_csv(out_dir / "universe_status.csv")
+    if metrics:
+        summary = pd.concat(metrics, ignore_index=True).set_index(["Symbol", "Strategy"])
+        summary.to_csv(out_dir / "universe_metrics.csv")
+
+    n_failed = int((status_df["status"] != "ok").sum())
+    print(f"\nUniverse completed: {len(status_df) - n_failed} succeeded, {n_failed} failed.")
+    return entries
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
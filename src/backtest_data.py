@@ -1,42 +1,61 @@
+from utils.bars import annual_periods
 from utils.config import load_config
+from metrics_engine import bootstrap_metrics, rolling_drawdown, rolling_sharpe, strategy_title, summary_metrics
 import pandas as pd
-import numpy as np
 from pathlib import Path
 
-cfg = load_config()
-symbol = cfg["data"]["symbol"]
-
-strat_df = pd.read_csv(f"reports/{symbol}/tables/{symbol}_strategies.csv", parse_dates=['date']).set_index('date')
-
-
-d = {'Strategy': ['Buy and Hold', 'Dollar Cost Averaging', 'Risk Averse', 'Risk Seeking']}
-
-metric_df = pd.DataFrame(data=d).set_index('Strategy')
-
-strats = [
-  ('buy_and_hold', 'Buy and Hold'),
-  ('dollar_cost_averaging', 'Dollar Cost Averaging'),
-  ('risk_averse', 'Risk Averse'),
-  ('risk_seeking', 'Risk Seeking')
-]
-
-for s in strats:
-    metric_df.loc[s[1], 'Final Value ($)'] = strat_df[s[0]].iloc[-1].round(2)
-    
-    metric_df.loc[s[1], 'Total Log Return (%)'] = (((strat_df[s[0]].iloc[-1] / strat_df['close'].iloc[0]) - 1) * 100).round(2)
-    
-    metric_df.loc[s[1], 'Volatility (%)'] = (np.std(np.log(strat_df[s[0]]/strat_df[s[0]].shift(1)).dropna()) * np.sqrt(252) * 100).round(2)
-    
-    metric_df.loc[s[1], 'CAGR (%)'] = (((strat_df[s[0]].iloc[-1] / strat_df['close'].iloc[0]) ** (1 / (len(strat_df) / 252)) - 1) * 100).round(2)
-    
-    rolling_max = strat_df[s[0]].cummax()
-    daily_drawdown = strat_df[s[0]] / rolling_max - 1.0
-    max_drawdown = daily_drawdown.cummin().min()
-    metric_df.loc[s[1], 'Max Drawdown (%)'] = (max_drawdown * 100).round(1)
-    
-    if max_drawdown != 0:
-        metric_df.loc[s[1], 'Calmar Ratio'] = (metric_df.loc[s[1], 'CAGR (%)'] / abs(max_drawdown * 100)).round(3)
-        
-p = Path(f"reports/{symbol}/tables/{symbol}_metrics.csv")
-p.parent.mkdir(parents=True, exist_ok=True)
-metric_df.to_csv(p)
\ No newline at end of file
+# The backtest_data stage: summary, rolling and bootstrap metrics of every strategy. strategies is the
+# strategies table when it is already in memory.
+def backtest_data(cfg, strategies=None):
+  symbol = cfg["data"]["symbol"]
+  price = cfg["data"]["price_col"]
+  metrics_cfg = cfg["metrics"]
+  periods = annual_periods(cfg)  # Bars per year used for annualization
+  window = metrics_cfg["rolling_window"]  # Window of the rolling metrics
+  boot_cfg = metrics_cfg["bootstrap"]
+
+  # Round-trip parsing gives back the exact curves backtest.py computed, so the metrics are the same
+  # whether the table comes from memory, an isolated run or the cache
+  strat_df = strategies if strategies is not None else pd.read_csv(f"reports/{symbol}/tables/{symbol}_strategies.csv", parse_dates=['date'], float_precision="round_trip").set_index('date')
+
+  # Every configured strategy is one column of a single (T, strategies) array, scored in one pass
+  names = sorted(cfg["backtest"]["strategies"], key=strategy_title)
+  titles = [strategy_title(s) for s in names]
+  values = strat_df[names].values
+
+  metric_df = pd.DataFrame(summary_metrics(values, strat_df[price].iloc[0], periods), index=pd.Index(titles, name='Strategy'))
+
+  p = Path(f"reports/{symbol}/tables/{symbol}_metrics.csv")
+  p.parent.mkdir(parents=True, exist_ok=True)
+  metric_df.to_csv(p)
+
+  # Rolling Sharpe ratio and drawdown of every strategy
+  rolling_df = pd.concat([
+    pd.DataFrame(rolling_sharpe(values, window, periods), index=strat_df.index, columns=[f"{s}_sharpe" for s in names]),
+    pd.DataFrame(rolling_drawdown(values, window), index=strat_df.index, columns=[f"{s}_drawdown" for s in names])
+  ], axis=1)
+  rolling_df.to_csv(f"reports/{symbol}/tables/{symbol}_rolling_metrics.csv", index=True)
+
+  # Block-bootstrap confidence intervals
+  rows = []
+  if boot_cfg["n_resamples"] > 0:
+    ci = bootstrap_metrics(
+      values,
+      n_resamples=boot_cfg["n_resamples"],
+      block_size=boot_cfg["block_size"],
+      confidence=boot_cfg["confidence"],
+      periods_per_year=periods,
+      batch_size=boot_cfg["batch_size"],
+      seed=boot_cfg["seed"]
+    )
+    for i, title in enumerate(titles):
+      for metric, est in ci.items():
+        rows.append({
+          "Strategy": title, "Metric": metric,
+          "Estimate": est["estimate"][i], "Low": est["low"][i], "High": est["high"][i]
+        })
+  pd.DataFrame(rows, columns=["Strategy", "Metric", "Estimate", "Low", "High"]).to_csv(f"reports/{symbol}/tables/{symbol}_metrics_ci.csv", index=False)
+  return metric_df
+
+if __name__ == "__main__":
+  backtest_data(load_config())
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+# Vectorized backtest engine. Strategies are declared as plain dicts (usually straight from the
+# "backtest" section of the config) instead of hand-written per-day loops:
+#
+#   risk_averse:
+#     positions: {0: 1, default: 0}   # exposure held while the previous bar was in each state,
+#                                     # default covers every state not listed
+#     cost: 0.001                     # proportional cost charged on every change of exposure
+#
+#   dollar_cost_averaging:
+#     type: dca                       # invest an equal slice of the initial money every bar
+#     cost: 0.001
+
+# Maps every state label to the exposure held in it using a lookup table
+def position_mask(states, positions):
+  states = np.asarray(states, dtype=np.int64)
+  if states.size == 0:
+    return np.zeros(0)
+  explicit = {int(k): v for k, v in positions.items() if k != "default"}
+  n_states = max(max(explicit, default=0), int(states.max())) + 1
+  table = np.full(n_states, float(positions.get("default", 0.0)))
+  for state, exposure in explicit.items():
+    table[state] = exposure
+  return table[states]
+
+# Multiplier applied on each bar for the transaction cost of changing exposure on that bar
+def cost_mask(pos, cost):
+  turnover = np.abs(np.diff(pos, prepend=pos[:1]))
+  return 1.0 - cost * turnover
+
+# Equity curve of a strategy that holds pos[t-1] of the asset over the bar (t-1, t]
+# and pays cost on the bar its exposure changes
+def equity_curve(prices, states, positions, cost=0.0, init_money=1.0):
+  prices = np.asarray(prices, dtype=float)
+  pos = position_mask(states, positions)
+  growth = np.ones_like(prices)
+  growth[1:] = 1.0 + pos[:-1] * (prices[1:] / prices[:-1] - 1.0)
+  growth *= cost_mask(pos, cost)
+  return init_money * np.cumprod(growth)
+
+# Equity curve of investing init_money / n on every bar after the first, net of cost
+def dca_curve(prices, cost=0.0, init_money=1.0):
+  prices = np.asarray(prices, dtype=float)
+  invest_per_bar = init_money / len(prices)
+  bought = invest_per_bar * (1 - cost) / prices
+  bought[0] = 0.0
+  curve = np.cumsum(bought) * prices
+  curve[0] = invest_per_bar
+  return curve
+
+# Runs every declared strategy over the same price and state series
+def run_strategies(prices, states, strategies, init_money, default_cost=0.0):
+  curves = {}
+  for name, spec in strategies.items():
+    kind = spec.get("type", "regime")
+    cost = spec.get("cost", default_cost)
+    if kind == "regime":
+      curves[name] = equity_curve(prices, states, spec["positions"], cost, init_money)
+    elif kind == "dca":
+      curves[name] = dca_curve(prices, cost, init_money)
+    else:
+      raise ValueError(f"Unknown strategy type '{kind}' for strategy '{name}'.")
+  index = prices.index if isinstance(prices, pd.Series) else None
+  return pd.DataFrame(curves, index=index)
+
+
+# Values of one sweep axis, given either as a list or as {start, stop, num} for an evenly spaced grid
+def grid_values(spec):
+  if isinstance(spec, dict):
+    return np.linspace(spec["start"], spec["stop"], int(spec["num"]))
+  return np.atleast_1d(np.asarray(spec, dtype=float))
+
+# Long/flat position matrix (T, P) of probability-threshold rules, one column per (entry, exit) pair.
+# A column goes long on the bar prob reaches its entry threshold, goes flat on the bar prob falls to
+# its exit threshold or below, and otherwise keeps its previous position (flat at the start).
+# entry > exit gives a hysteresis band that stops the rule from flipping on noise.
+def threshold_positions(prob, entry, exit):
+  prob = np.asarray(prob, dtype=float)[:, None]
+  signal = np.where(prob >= entry, 1, np.where(prob <= exit, 0, -1)).astype(np.int8)
+  bars = np.arange(len(prob))[:, None]
+  last = np.maximum.accumulate(np.where(signal >= 0, bars, -1), axis=0)
+  pos = np.take_along_axis(signal, np.maximum(last, 0), axis=0)
+  return np.where(last >= 0, pos, 0).astype(float)
+
+# Per-bar log growth of long/flat position columns: held (T-1, P) is the log return earned while
+# long, trades (T-1, P) is one on every bar the position changes. Under cost c, a column's log equity
+# grows by held + trades * log(1 - c) per bar, the same curves equity_curve() builds one at a time.
+def sweep_log_growth(prices, pos):
+  log_ratio = np.diff(np.log(np.asarray(prices, dtype=float)))
+  return pos[:-1] * log_ratio[:, None], np.abs(np.diff(pos, axis=0))
+
+# Metrics of every (entry, hysteresis, cost) cell of a threshold-strategy grid over one price series.
+# Costs only scale the trade term of the log growth, so every metric but the drawdown comes from
+# per-column sums; drawdowns take one pass over the (T, P) log curves per cost. Position columns are
+# processed max_chunk_mb at a time. Returns one row per cell, ready to pivot into a heatmap.
+def parameter_sweep(prices, prob, entries, bands, costs, init_money, base, periods_per_year=252, max_chunk_mb=256):
+  from metrics_engine import summary_from_stats
+
+  entries, bands, costs = grid_values(entries), grid_values(bands), grid_values(costs)
+  entry = np.repeat(entries, len(bands))
+  band = np.tile(bands, len(entries))
+  log_cost = np.log1p(-costs)
+  n_bars = len(prices)
+  # Roughly six (T, P) float64 temporaries live at once while scoring a chunk
+  chunk = max(1, int(max_chunk_mb * 2**20 // (n_bars * 8 * 6)))
+
+  frames = []
+  for start in range(0, len(entry), chunk):
+    e, b = entry[start:start + chunk], band[start:start + chunk]
+    held, trades = sweep_log_growth(prices, threshold_positions(prob, e, e - b))
+    n = len(held)
+    total = held.sum(axis=0)[:, None] + trades.sum(axis=0)[:, None] * log_cost
+    second = ((held * held).sum(axis=0)[:, None]
+              + 2 * (held * trades).sum(axis=0)[:, None] * log_cost
+              + trades.sum(axis=0)[:, None] * log_cost ** 2) / n  # trades is 0/1, so trades**2 == trades
+    mean = total / n
+    log_std = np.sqrt(np.maximum(second - mean ** 2, 0))
+
+    held_path, trade_path = np.cumsum(held, axis=0), np.cumsum(trades, axis=0)
+    log_drawdown = np.empty_like(total)
+    for j, lc in enumerate(log_cost):
+      path = held_path + trade_path * lc
+      peak = np.maximum(np.maximum.accumulate(path, axis=0), 0.0)
+      log_drawdown[:, j] = np.minimum((path - peak).min(axis=0), 0.0)
+
+    metrics = summary_from_stats(init_money * np.exp(total), base, n + 1, log_std, np.expm1(log_drawdown), periods_per_year)
+    with np.errstate(divide="ignore", invalid="ignore"):
+      metrics["Sharpe Ratio"] = np.round(mean / log_std * np.sqrt(periods_per_year), 3)
+    metrics["Trades"] = np.repeat(trades.sum(axis=0)[:, None], len(costs), axis=1).astype(int)
+    frames.append(pd.DataFrame({
+      "entry": np.repeat(e, len(costs)),
+      "hysteresis": np.repeat(b, len(costs)),
+      "exit": np.repeat(e - b, len(costs)),
+      "cost": np.tile(costs, len(e)),
+      **{name: np.ravel(value) for name, value in metrics.items()}
+    }))
+  return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,141 @@
+import argparse
+import copy
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.columnar import load_table, save_table
+from utils.config import apply_symbol, load_config, universe_symbols
+from utils.model_store import load_params, model_path
+from utils.regimes import prob_columns
+
+# Batched inference for the state-reordered Gaussian HMMs saved by run_model.py. Series of many
+# symbols are stacked into one zero-padded (S, T, F) array and forward-backward and Viterbi run in log
+# space, vectorized across symbols and states; only the time loop stays in Python. Bars past the end
+# of a shorter series use an identity transition and a likelihood of one, so padding never changes
+# the posteriors or the Viterbi path of the real bars. Models with the same number of states and
+# features are scored together.
+
+# Expands hmmlearn's internal covariance parameters to full (K, F, F) matrices
+def full_covars(covars, covariance_type, n_components, n_features):
+  if covariance_type == "full":
+    return covars
+  if covariance_type == "diag":
+    return np.stack([np.diag(c) for c in covars])
+  if covariance_type == "spherical":
+    return np.stack([np.eye(n_features) * c for c in np.reshape(covars, (n_components, -1))[:, 0]])
+  if covariance_type == "tied":
+    return np.tile(covars, (n_components, 1, 1))
+  raise ValueError(f"Unknown covariance type '{covariance_type}'.")
+
+# Stacks ragged (T_s, F) series into a zero-padded (S, T, F) array and their lengths
+def stack_series(series):
+  lengths = np.array([len(x) for x in series])
+  X = np.zeros((len(series), lengths.max(), series[0].shape[1]))
+  for i, x in enumerate(series):
+    X[i, :len(x)] = x
+  return X, lengths
+
+# Gaussian log-likelihood of every bar under every state, shape (S, T, K)
+def emission_log_likelihood(X, means, covars):
+  n_features = X.shape[-1]
+  chol = np.linalg.cholesky(covars)
+  inv_chol = np.linalg.inv(chol)
+  log_det = np.log(np.diagonal(chol, axis1=-2, axis2=-1)).sum(axis=-1)
+  d = X[:, :, None, :] - means[:, None, :, :]
+  z = np.einsum("skfg,stkg->stkf", inv_chol, d)
+  return -0.5 * (z * z).sum(axis=-1) - log_det[:, None, :] - 0.5 * n_features * np.log(2 * np.pi)
+
+def _logsumexp(a, axis):
+  m = a.max(axis=axis, keepdims=True)
+  m = np.where(np.isfinite(m), m, 0.0)
+  return np.squeeze(m, axis=axis) + np.log(np.exp(a - m).sum(axis=axis))
+
+# Smoothed state posteriors (S, T, K) and the log-likelihood of every series
+def forward_backward(log_start, log_trans, log_b, lengths):
+  S, T, K = log_b.shape
+  valid = np.arange(T)[None, :] < lengths[:, None]
+  log_alpha = np.empty((S, T, K))
+  log_alpha[:, 0] = log_start + log_b[:, 0]
+  for t in range(1, T):
+    step = _logsumexp(log_alpha[:, t - 1, :, None] + log_trans, axis=1) + log_b[:, t]
+    log_alpha[:, t] = np.where(valid[:, t, None], step, log_alpha[:, t - 1])
+
+  log_beta = np.zeros((S, T, K))
+  for t in range(T - 2, -1, -1):
+    step = _logsumexp(log_trans + (log_b[:, t + 1] + log_beta[:, t + 1])[:, None, :], axis=2)
+    log_beta[:, t] = np.where(valid[:, t + 1, None], step, log_beta[:, t + 1])
+
+  log_likelihood = _logsumexp(log_alpha[:, -1], axis=1)
+  log_gamma = log_alpha + log_beta - log_likelihood[:, None, None]
+  return np.exp(log_gamma), log_likelihood
+
+# Most likely state path (S, T) of every series; padded bars repeat the last real state
+def viterbi(log_start, log_trans, log_b, lengths):
+  S, T, K = log_b.shape
+  valid = np.arange(T)[None, :] < lengths[:, None]
+  delta = log_start + log_b[:, 0]
+  backpointers = np.empty((S, T, K), dtype=np.intp)
+  backpointers[:, 0] = np.arange(K)
+  for t in range(1, T):
+    scores = delta[:, :, None] + log_trans
+    best = scores.argmax(axis=1)
+    step = np.take_along_axis(scores, best[:, None, :], axis=1)[:, 0] + log_b[:, t]
+    delta = np.where(valid[:, t, None], step, delta)
+    backpointers[:, t] = np.where(valid[:, t, None], best, np.arange(K))
+
+  states = np.empty((S, T), dtype=np.intp)
+  states[:, -1] = delta.argmax(axis=1)
+  rows = np.arange(S)
+  for t in range(T - 1, 0, -1):
+    states[:, t - 1] = backpointers[rows, t, states[:, t]]
+  return states
+
+# Scores a batch of series with their own models. params is a list of load_params() results with the
+# same number of states and features. Returns per-series posteriors, Viterbi states and log-likelihoods.
+def score_batch(series, params, metas):
+  X, lengths = stack_series(series)
+  K, F = params[0]["means"].shape
+  means = np.stack([p["means"] for p in params])
+  covars = np.stack([full_covars(p["covars"], m["covariance_type"], K, F) for p, m in zip(params, metas)])
+  with np.errstate(divide="ignore"):
+    log_start = np.log(np.stack([p["startprob"] for p in params]))
+    log_trans = np.log(np.stack([p["transmat"] for p in params]))
+  log_b = emission_log_likelihood(X, means, covars)
+  posteriors, log_likelihood = forward_backward(log_start, log_trans, log_b, lengths)
+  states = viterbi(log_start, log_trans, log_b, lengths)
+  return [
+    (posteriors[i, :n], states[i, :n], log_likelihood[i])
+    for i, n in enumerate(lengths)
+  ]
+
+# Loads every symbol's model and data, scores them in batches and writes each *_probs_states.csv
+def score_universe(cfg, symbols):
+  groups = {}
+  for symbol in symbols:
+    sym_cfg = apply_symbol(copy.deepcopy(cfg), symbol)
+    params, meta = load_params(model_path(symbol))
+    data = load_table(f"data/temp/{symbol}/{symbol}_full_data.csv", cfg["storage"])
+    groups.setdefault(params["means"].shape, []).append((symbol, sym_cfg, params, meta, data))
+
+  for members in groups.values():
+    results = score_batch([m[4].values.reshape(len(m[4]), -1) for m in members], [m[2] for m in members], [m[3] for m in members])
+    for (symbol, sym_cfg, params, meta, data), (posteriors, states, _) in zip(members, results):
+      df = load_table(sym_cfg["data"]["processed_path"], cfg["storage"])
+      probs_states_df = pd.DataFrame(posteriors, index=data.index, columns=prob_columns(meta["n_components"]))
+      probs_states_df["state"] = states
+      save_table(probs_states_df.join(df, how="inner"), f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"])
+
+def main():
+  parser = argparse.ArgumentParser(description="Score saved HMMs of many symbols in one batched pass.")
+  parser.add_argument("symbols", nargs="*", help="Symbols to score (defaults to the configured universe, or data.symbol)")
+  args = parser.parse_args()
+  cfg = load_config()
+  symbols = args.symbols or universe_symbols(cfg) or [cfg["data"]["symbol"]]
+  start = time.perf_counter()
+  score_universe(cfg, symbols)
+  print(f"Scored {len(symbols)} symbols in {time.perf_counter() - start:.2f}s.")
+
+if __name__ == "__main__":
+  main()
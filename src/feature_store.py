@@ -0,0 +1,155 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from utils.columnar import append_rows, load_table, save_table, table_rows, tail_table
+from utils.config import load_config
+
+# Rolling features of the processed data for multivariate HMMs. Every feature is a rolling sum of a
+# per-bar quantity (squared return, squared log range, log volume, ...). Rolling sums are differences
+# of running sums, so each bar costs O(1) whatever the window.
+#
+# The features are stored as a table with one row per processed bar (NaN until a window fills up).
+# When new bars are appended to the processed data, only those bars are computed, from the last
+# `lookback` processed rows plus the new ones, and appended to the stored table. Changing the
+# feature list, or processed rows that no longer line up with the stored features, recomputes
+# everything.
+
+# Rolling sum over the last `window` values, NaN until the window is full or while it holds a NaN
+def rolling_sum(values, window):
+  values = np.asarray(values, dtype=float)
+  missing = np.isnan(values)
+  total = np.concatenate([[0.0], np.cumsum(np.where(missing, 0.0, values))])
+  gaps = np.concatenate([[0], np.cumsum(missing)])
+  out = np.full(len(values), np.nan)
+  if len(values) >= window:
+    sums = total[window:] - total[:-window]
+    full = (gaps[window:] - gaps[:-window]) == 0
+    out[window - 1:] = np.where(full, sums, np.nan)
+  return out
+
+def rolling_mean(values, window):
+  return rolling_sum(values, window) / window
+
+def _log_range(df):
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.log(df["high"].values / df["low"].values)
+
+def _log_body(df, price):
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.log(df[price].values / df["open"].values)
+
+# Zero-mean realized volatility of the log returns
+def realized_vol(df, window, returns="log_ret", **_):
+  return np.sqrt(rolling_mean(df[returns].values ** 2, window))
+
+# Parkinson volatility from the high-low range
+def parkinson_vol(df, window, **_):
+  return np.sqrt(rolling_mean(_log_range(df) ** 2, window) / (4 * np.log(2)))
+
+# Garman-Klass volatility from the high-low range and the open-close body
+def garman_klass_vol(df, window, price="close", **_):
+  per_bar = 0.5 * _log_range(df) ** 2 - (2 * np.log(2) - 1) * _log_body(df, price) ** 2
+  return np.sqrt(np.maximum(rolling_mean(per_bar, window), 0.0))
+
+# z-score of the log volume against its rolling mean and standard deviation
+def volume_z(df, window, **_):
+  with np.errstate(divide="ignore"):
+    v = np.log(df["volume"].values.astype(float))
+  v[~np.isfinite(v)] = np.nan
+  total = rolling_sum(v, window)
+  total_sq = rolling_sum(v ** 2, window)
+  std = np.sqrt(np.maximum(total_sq - total ** 2 / window, 0.0) / (window - 1))
+  with np.errstate(divide="ignore", invalid="ignore"):
+    z = np.where(std > 0, (v - total / window) / std, 0.0)
+  z[np.isnan(total)] = np.nan
+  return z
+
+# Log return over the last `horizon` bars
+def horizon_return(df, horizon, returns="log_ret", **_):
+  return rolling_sum(df[returns].values, horizon)
+
+FEATURES = {
+  "realized_vol": (realized_vol, "window"),
+  "parkinson_vol": (parkinson_vol, "window"),
+  "garman_klass_vol": (garman_klass_vol, "window"),
+  "volume_z": (volume_z, "window"),
+  "return": (horizon_return, "horizon"),
+}
+
+# Column name of a feature spec, e.g. {type: realized_vol, window: 21} -> realized_vol_21
+def feature_name(spec):
+  if spec["type"] == "column":
+    return spec["column"]
+  if spec["type"] not in FEATURES:
+    raise ValueError(f"Unknown feature type '{spec['type']}', expected 'column' or one of {sorted(FEATURES)}.")
+  return f"{spec['type']}_{spec[FEATURES[spec['type']][1]]}"
+
+# Bars a feature looks back over, including the current one
+def feature_lookback(spec):
+  return 1 if spec["type"] == "column" else int(spec[FEATURES[spec["type"]][1]])
+
+# Computes every feature over the processed rows of df
+def compute_features(df, specs, price="close", returns="log_ret"):
+  out = pd.DataFrame(index=df.index)
+  for spec in specs:
+    name = feature_name(spec)
+    if spec["type"] == "column":
+      out[name] = df[spec["column"]].astype(float)
+      continue
+    fn, param = FEATURES[spec["type"]]
+    out[name] = fn(df, int(spec[param]), price=price, returns=returns)
+  return out
+
+# Brings the feature table up to date with the processed data, given as df when it is already in
+# memory. Returns the number of rows computed and whether it was an incremental update.
+def update_features(processed_path, features_path, specs, storage=None, price="close", returns="log_ret", incremental=True, df=None):
+  names = [feature_name(spec) for spec in specs]
+  if incremental:
+    try:
+      stored = tail_table(features_path, storage)
+    except (FileNotFoundError, KeyError, pd.errors.EmptyDataError):
+      stored = None
+    if stored is not None and list(stored.columns) == names and len(stored):
+      n_done, n_total = table_rows(features_path, storage), table_rows(processed_path, storage)
+      n_new = n_total - n_done
+      if n_new >= 0:
+        lookback = max(feature_lookback(spec) for spec in specs)
+        tail = tail_table(processed_path, storage, n=n_new + lookback)
+        # The stored features must end on the processed row just before the new ones
+        if len(tail) > n_new and tail.index[-n_new - 1] == stored.index[-1]:
+          if n_new:
+            append_rows(compute_features(tail, specs, price, returns).iloc[-n_new:], features_path, storage)
+          return n_new, True
+
+  if df is None:
+    df = load_table(processed_path, storage)
+  features = compute_features(df, specs, price, returns)
+  save_table(features, features_path, storage)
+  return len(features), False
+
+# The build_features stage, from the processed data when it is already in memory
+def build_features(cfg, full=False, processed=None):
+  feat = cfg["features"]
+  if not feat["enabled"]:
+    print("Features are disabled, the model uses model.target_col.")
+    return
+  if feat["mode"] not in ("incremental", "full"):
+    raise ValueError(f"Unknown features mode '{feat['mode']}', expected 'incremental' or 'full'.")
+  features_path = feat["path"].format(symbol=cfg["data"]["symbol"])
+  n, incremental = update_features(
+    cfg["data"]["processed_path"], features_path, feat["columns"], cfg["storage"],
+    price=cfg["data"]["price_col"], returns=cfg["model"]["target_col"],
+    incremental=feat["mode"] == "incremental" and not full, df=processed
+  )
+  print(f"{'Appended' if incremental else 'Computed'} {n} rows of {len(feat['columns'])} features in {features_path}.")
+
+def main():
+  parser = argparse.ArgumentParser(description="Compute the rolling features of the processed data, extending the stored ones with new bars.")
+  parser.add_argument("--full", action="store_true", help="Recompute every row (same as features.mode: full)")
+  args = parser.parse_args()
+  build_features(load_config(), full=args.full)
+
+if __name__ == "__main__":
+  main()
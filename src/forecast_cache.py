@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from forecast_engine import forecast_bands
+
+# On-disk memo of forecast bands. Bands scale with the last price, so they are computed for a price of
+# 1 and stored as <cache_dir>/<key>_<n_steps>.npy, where the key hashes everything else the result
+# depends on: the method and its settings, the transition matrix, the regime means and volatilities
+# and the starting regime distribution. A file's mtime is its last use and drives LRU eviction.
+# With reuse_longer, a forecast over a longer horizon answers a shorter one by slicing its first
+# steps. Hit and miss counts are kept in one <cache_dir>/stats-<pid>.json per process and summed on
+# read, so concurrent runs never overwrite each other's counts.
+
+STATS = "stats*.json"
+_record_lock = threading.Lock()
+
+# Forecasting settings that change the bands of a method (workers never do)
+def _method_settings(fc):
+  if fc["method"] == "monte_carlo":
+    return {"n_sims": fc["n_sims"], "seed": fc["seed"], "max_chunk_mb": fc["max_chunk_mb"]}
+  return {"grid_points": fc["grid_points"]}
+
+# Hashes the inputs of a forecast except its horizon and last price
+def forecast_key(fc, p0, transmat, means, stds):
+  h = hashlib.sha256(json.dumps({
+    "method": fc["method"],
+    "extra_quantiles": list(fc["extra_quantiles"]),
+    **_method_settings(fc)
+  }, sort_keys=True).encode())
+  for a in (p0, transmat, means, stds):
+    a = np.ascontiguousarray(a, dtype=float)
+    h.update(str(a.shape).encode() + a.tobytes())
+  return h.hexdigest()
+
+# Cached bands of n_steps steps, or None. Returns the bands and "hit", "sliced" or "miss".
+def lookup(cache_dir, key, n_steps, reuse_longer=False):
+  root = Path(cache_dir)
+  path = root / f"{key}_{n_steps}.npy"
+  if not path.exists() and reuse_longer:
+    longer = [(int(p.stem.rsplit("_", 1)[1]), p) for p in root.glob(f"{key}_*.npy") if not p.name.endswith(".tmp.npy")]
+    longer = sorted((n, p) for n, p in longer if n > n_steps)
+    path = longer[0][1] if longer else path
+  if not path.exists():
+    return None, "miss"
+  try:
+    bands = np.load(path)
+  except (OSError, ValueError):
+    return None, "miss"
+  os.utime(path)
+  return bands[:n_steps + 1], "hit" if len(bands) == n_steps + 1 else "sliced"
+
+def store(cache_dir, key, bands):
+  root = Path(cache_dir)
+  root.mkdir(parents=True, exist_ok=True)
+  path = root / f"{key}_{len(bands) - 1}.npy"
+  tmp = path.with_suffix(".tmp.npy")
+  np.save(tmp, bands)
+  tmp.replace(path)
+
+# Deletes the least recently used forecasts until the cache fits in max_bytes
+def evict(cache_dir, max_bytes):
+  root = Path(cache_dir)
+  if max_bytes is None or not root.exists():
+    return []
+  entries = sorted((p.stat().st_mtime, p.stat().st_size, p) for p in root.glob("*.npy") if not p.name.endswith(".tmp.npy"))
+  total = sum(size for _, size, _ in entries)
+  evicted = []
+  for _, size, path in entries:
+    if total <= max_bytes:
+      break
+    path.unlink(missing_ok=True)
+    total -= size
+    evicted.append(path.name)
+  return evicted
+
+# Hit, sliced and miss counts of the cache, summed over the count files of every process. A file that
+# cannot be read, e.g. one removed meanwhile, is skipped.
+def stats(cache_dir):
+  counts = {"hit": 0, "sliced": 0, "miss": 0}
+  for path in Path(cache_dir).glob(STATS):
+    try:
+      for outcome, n in json.loads(path.read_text()).items():
+        counts[outcome] = counts.get(outcome, 0) + n
+    except (OSError, ValueError):
+      continue
+  return counts
+
+# Counts an outcome in this process's own count file, replaced whole so readers never see it half
+# written. Processes never write each other's files, and threads of one take turns.
+def record(cache_dir, outcome):
+  root = Path(cache_dir)
+  root.mkdir(parents=True, exist_ok=True)
+  path = root / f"stats-{os.getpid()}.json"
+  with _record_lock:
+    counts = {"hit": 0, "sliced": 0, "miss": 0}
+    try:
+      counts.update(json.loads(path.read_text()))
+    except (OSError, ValueError):
+      pass
+    counts[outcome] += 1
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(counts))
+    tmp.replace(path)
+  return counts
+
+# forecast_engine.forecast_bands through the cache set under forecasting.cache. Returns the bands and
+# "hit", "sliced", "miss" or None when the cache is off. Unseeded Monte Carlo runs are never cached.
+def cached_forecast_bands(fc, last_price, p0, transmat, means, stds, n_steps):
+  cache = fc.get("cache") or {}
+  if not cache.get("enabled") or (fc["method"] == "monte_carlo" and fc["seed"] is None):
+    return forecast_bands(fc, last_price, p0, transmat, means, stds, n_steps), None
+  key = forecast_key(fc, p0, transmat, means, stds)
+  bands, outcome = lookup(cache["dir"], key, n_steps, cache["reuse_longer"])
+  if bands is None:
+    bands = forecast_bands(fc, 1.0, p0, transmat, means, stds, n_steps)
+    store(cache["dir"], key, bands)
+    evict(cache["dir"], cache["max_size_mb"] * 1024 * 1024)
+  record(cache["dir"], outcome)
+  return last_price * bands, outcome
@@ -0,0 +1,258 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Forecast engines for regime-switching price paths.
+#
+# Monte Carlo: Every path follows its own Markov chain of
+# regimes drawn from the transition matrix, and returns are drawn in blocks from a seeded
+# numpy.random.Generator. Small runs keep every path and take exact quantiles. Runs too large to hold
+# in memory are split into chunks of paths, each simulated by a worker process and reduced to
+# per-step log-price histograms. The histograms are summed and the quantiles are read off them.
+#
+# Density: the cumulative log return is propagated exactly as a regime-weighted mixture. Each
+# regime's density is carried on a fixed grid in the Fourier domain, where one step of the chain is
+# a matrix product with the transition matrix and a multiplication by the regime's Gaussian
+# characteristic function. The result has no sampling noise and does not depend on n_sims.
+
+HIST_BINS = 2048  # Bins per step for chunked runs, spanning +-HIST_SIGMAS standard deviations
+HIST_SIGMAS = 8
+BAND_QUANTILES = (0.5, 0.05, 0.95)  # median, p05, p95
+DENSITY_STEP_BLOCK = 64  # Steps transformed back from the Fourier domain at once
+
+# Column name of a quantile band, e.g. 0.05 -> p05, 0.995 -> p99_5
+def quantile_label(q):
+  whole, _, frac = f"{q * 100:g}".partition(".")
+  return "p" + whole.zfill(2) + (f"_{frac}" if frac else "")
+
+# Simulates cumulative log returns of n_paths regime-switching paths. Arrays are step-major,
+# shape (n_steps, n_paths), so every step of the regime chain works on contiguous memory.
+def simulate_log_paths(rng, n_paths, n_steps, p0, transmat, means, stds):
+  cum_trans = np.cumsum(transmat, axis=1)[:, :-1]
+  states = np.empty((n_steps, n_paths), dtype=np.intp)
+  u = rng.random((n_steps + 1, n_paths))
+  state = (u[0, :, None] > np.cumsum(p0)[:-1]).sum(axis=1)
+  for t in range(n_steps):
+    if len(cum_trans) == 2:
+      state = (u[t + 1] > cum_trans[state, 0]).astype(np.intp)
+    else:
+      state = (u[t + 1, :, None] > cum_trans[state]).sum(axis=1)
+    states[t] = state
+  del u
+  log_ret = rng.standard_normal((n_steps, n_paths))
+  log_ret *= stds[states]
+  log_ret += means[states]
+  return np.cumsum(log_ret, axis=0, out=log_ret)
+
+# Per-step histogram grid of cumulative log returns wide enough for every regime mix
+def histogram_grid(n_steps, means, stds):
+  t = np.arange(1, n_steps + 1)
+  lo = means.min() * t - HIST_SIGMAS * stds.max() * np.sqrt(t)
+  hi = means.max() * t + HIST_SIGMAS * stds.max() * np.sqrt(t)
+  return lo, (hi - lo) / HIST_BINS
+
+# Simulates one chunk of paths and reduces it to per-step price sums and log-price histogram counts
+def _simulate_chunk(args):
+  seed, n_paths, n_steps, p0, transmat, means, stds = args
+  rng = np.random.default_rng(seed)
+  log_paths = simulate_log_paths(rng, n_paths, n_steps, p0, transmat, means, stds)
+  price_sums = np.exp(log_paths).sum(axis=1)
+  lo, width = histogram_grid(n_steps, means, stds)
+  bins = ((log_paths - lo[:, None]) / width[:, None]).astype(np.int64)
+  np.clip(bins, 0, HIST_BINS - 1, out=bins)
+  bins += np.arange(n_steps)[:, None] * HIST_BINS
+  counts = np.bincount(bins.ravel(), minlength=n_steps * HIST_BINS).reshape(n_steps, HIST_BINS)
+  return price_sums, counts
+
+# Reads quantiles off per-step histograms, interpolating linearly inside the bin
+def histogram_quantiles(counts, lo, width, quantiles):
+  cum = np.cumsum(counts, axis=1)
+  total = cum[:, -1:]
+  out = np.empty((len(counts), len(quantiles)))
+  rows = np.arange(len(counts))
+  for j, q in enumerate(quantiles):
+    target = q * total
+    idx = np.minimum((cum < target).sum(axis=1), HIST_BINS - 1)
+    below = np.where(idx > 0, cum[rows, idx - 1], 0)
+    frac = (target[:, 0] - below) / np.maximum(counts[rows, idx], 1)
+    out[:, j] = lo + (idx + frac) * width
+  return out
+
+# Forecasts price bands over n_steps from the last price and the current regime probabilities.
+# Returns an (n_steps + 1, 1 + len(quantiles)) array of the mean price followed by the price
+# quantiles (median, p05 and p95 by default), starting with last_price.
+def monte_carlo_bands(last_price, p0, transmat, means, stds, n_steps, n_sims, seed=None, max_chunk_mb=256, workers=None, quantiles=BAND_QUANTILES):
+  p0, transmat = np.asarray(p0, dtype=float), np.asarray(transmat, dtype=float)
+  means, stds = np.asarray(means, dtype=float), np.asarray(stds, dtype=float)
+  bands = np.empty((n_steps + 1, 1 + len(quantiles)))
+  bands[0] = last_price
+  if n_steps == 0:
+    return bands
+
+  # A chunk peaks at about four float64 arrays of shape (n_steps, n_paths)
+  chunk_paths = max(1, int(max_chunk_mb * 1024 * 1024 // (32 * n_steps)))
+  seeds = np.random.SeedSequence(seed)
+  if n_sims <= chunk_paths:
+    # Everything fits in one chunk: keep all paths and take exact quantiles in one vectorized pass
+    rng = np.random.default_rng(seeds)
+    prices = last_price * np.exp(simulate_log_paths(rng, n_sims, n_steps, p0, transmat, means, stds))
+    bands[1:, 0] = prices.mean(axis=1)
+    bands[1:, 1:] = np.quantile(prices, quantiles, axis=1).T
+    return bands
+
+  sizes = [chunk_paths] * (n_sims // chunk_paths) + ([n_sims % chunk_paths] if n_sims % chunk_paths else [])
+  tasks = [(s, n, n_steps, p0, transmat, means, stds) for s, n in zip(seeds.spawn(len(sizes)), sizes)]
+  price_sums = np.zeros(n_steps)
+  counts = np.zeros((n_steps, HIST_BINS), dtype=np.int64)
+  workers = workers or os.cpu_count()
+  if workers > 1:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      results = pool.map(_simulate_chunk, tasks)
+      for chunk_sums, chunk_counts in results:
+        price_sums += chunk_sums
+        counts += chunk_counts
+  else:
+    for task in tasks:
+      chunk_sums, chunk_counts = _simulate_chunk(task)
+      price_sums += chunk_sums
+      counts += chunk_counts
+
+  lo, width = histogram_grid(n_steps, means, stds)
+  bands[1:, 0] = last_price * price_sums / n_sims
+  bands[1:, 1:] = last_price * np.exp(histogram_quantiles(counts, lo, width, quantiles))
+  return bands
+
+# Forecasts the same bands as monte_carlo_bands by propagating the density of the cumulative log
+# return on a grid of grid_points points. The mean price is exact: E[exp(X)] follows the same
+# recursion with each regime's lognormal mean exp(mu + sigma^2 / 2).
+def density_bands(last_price, p0, transmat, means, stds, n_steps, grid_points=16384, quantiles=BAND_QUANTILES):
+  p0, transmat = np.asarray(p0, dtype=float), np.asarray(transmat, dtype=float)
+  means, stds = np.asarray(means, dtype=float), np.asarray(stds, dtype=float)
+  bands = np.empty((n_steps + 1, 1 + len(quantiles)))
+  bands[0] = last_price
+  if n_steps == 0:
+    return bands
+
+  # Grid wide enough that the periodic FFT never wraps probability mass around
+  half = np.abs(means).max() * n_steps + HIST_SIGMAS * stds.max() * np.sqrt(n_steps)
+  x, dx = np.linspace(-half, half, grid_points, endpoint=False, retstep=True)
+  omega = 2 * np.pi * np.fft.fftfreq(grid_points, d=dx)
+  char = np.exp(1j * omega[:, None] * means - 0.5 * (omega[:, None] * stds) ** 2)
+  shift = np.exp(-1j * omega * x[0])
+
+  # Per-regime characteristic functions start as point masses at zero weighted by p0
+  F = np.tile(p0.astype(complex), (grid_points, 1))
+  growth = np.exp(means + 0.5 * stds ** 2)
+  m = p0.copy()
+  for start in range(1, n_steps + 1, DENSITY_STEP_BLOCK):
+    steps = range(start, min(start + DENSITY_STEP_BLOCK, n_steps + 1))
+    total = np.empty((len(steps), grid_points), dtype=complex)
+    for i, t in enumerate(steps):
+      F = (F @ transmat) * char
+      total[i] = F.sum(axis=1)
+      m = (m @ transmat) * growth
+      bands[t, 0] = last_price * m.sum()
+    density = np.clip(np.fft.fft(total * shift, axis=1).real, 0, None)
+    cdf = np.cumsum(density, axis=1)
+    cdf /= cdf[:, -1:]
+    for i, t in enumerate(steps):
+      bands[t, 1:] = last_price * np.exp(np.interp(quantiles, cdf[i], x + dx / 2))
+  return bands
+
+# Mean regime probabilities over the horizon, p0 @ A^t for t = 0..n_steps
+def regime_path(p0, transmat, n_steps):
+  paths = np.empty((n_steps + 1, len(p0)))
+  paths[0] = p0
+  for t in range(1, n_steps + 1):
+    paths[t] = paths[t - 1] @ transmat
+  return paths
+
+# Column names of the price bands: the mean path, the median, p05, p95 and any extra quantiles
+def band_columns(extra_quantiles=()):
+  return ["point_forecast", "median_forecast", "p05", "p95"] + [quantile_label(q) for q in extra_quantiles]
+
+# Price bands of the method set in the "forecasting" config section
+def forecast_bands(fc, last_price, p0, transmat, means, stds, n_steps):
+  quantiles = list(BAND_QUANTILES) + list(fc["extra_quantiles"])
+  if fc["method"] == "density":
+    # --- Exact density propagation ---
+    return density_bands(last_price, p0, transmat, means, stds, n_steps, grid_points=fc["grid_points"], quantiles=quantiles)
+  if fc["method"] == "monte_carlo":
+    # --- Monte Carlo path simulation ---
+    # Each path follows its own regime chain; large runs are split across worker processes in chunks
+    return monte_carlo_bands(
+      last_price, p0, transmat, means, stds,
+      n_steps=n_steps, n_sims=fc["n_sims"],
+      seed=fc["seed"],
+      max_chunk_mb=fc["max_chunk_mb"],
+      workers=fc["workers"],
+      quantiles=quantiles
+    )
+  raise ValueError(f"Unknown forecasting method '{fc['method']}', expected 'monte_carlo' or 'density'.")
+
+# Simulates paths_per_draw paths under each of D parameter draws in one batch. transmats has shape
+# (D, K, K), means and stds (D, K). Columns are draw-major: draw d owns columns d*paths_per_draw up to
+# (d+1)*paths_per_draw. Indexing the flattened (draw, state) parameters keeps every step vectorized.
+def simulate_draw_paths(rng, paths_per_draw, n_steps, p0, transmats, means, stds):
+  D, K = means.shape
+  n_paths = D * paths_per_draw
+  offset = np.repeat(np.arange(D) * K, paths_per_draw)
+  cum_trans = np.cumsum(transmats, axis=2)[:, :, :-1].reshape(D * K, K - 1)
+  cum_p0 = np.cumsum(np.broadcast_to(p0, (D, K)), axis=1)[:, :-1]
+  states = np.empty((n_steps, n_paths), dtype=np.intp)
+  u = rng.random((n_steps + 1, n_paths))
+  state = offset + (u[0, :, None] > cum_p0[offset // K]).sum(axis=1)
+  for t in range(n_steps):
+    state = offset + (u[t + 1, :, None] > cum_trans[state]).sum(axis=1)
+    states[t] = state
+  del u
+  log_ret = rng.standard_normal((n_steps, n_paths))
+  log_ret *= stds.ravel()[states]
+  log_ret += means.ravel()[states]
+  return np.cumsum(log_ret, axis=0, out=log_ret)
+
+# Forecasts price bands under many parameter draws at once. Returns the bands of the mixture of all
+# draws' paths (same layout as monte_carlo_bands), every draw's own bands, shape (D, n_steps + 1,
+# 1 + len(quantiles)), and every draw's expected terminal price below its `tail` quantile. Draws are
+# simulated a chunk at a time within max_chunk_mb; when they do not fit in one chunk, the mixture's
+# quantiles are read off summed histograms as in monte_carlo_bands.
+def stress_bands(last_price, p0, transmats, means, stds, n_steps, paths_per_draw, seed=None, max_chunk_mb=256, quantiles=BAND_QUANTILES, tail=0.05):
+  p0, transmats = np.asarray(p0, dtype=float), np.asarray(transmats, dtype=float)
+  means, stds = np.asarray(means, dtype=float), np.asarray(stds, dtype=float)
+  D = len(means)
+  bands = np.empty((n_steps + 1, 1 + len(quantiles)))
+  draw_bands = np.empty((D, n_steps + 1, 1 + len(quantiles)))
+  bands[0] = draw_bands[:, 0] = last_price
+  shortfall = np.full(D, float(last_price))
+  if n_steps == 0:
+    return bands, draw_bands, shortfall
+
+  chunk_draws = max(1, int(max_chunk_mb * 1024 * 1024 // (32 * n_steps * paths_per_draw)))
+  chunks = [range(i, min(i + chunk_draws, D)) for i in range(0, D, chunk_draws)]
+  lo, width = histogram_grid(n_steps, means.ravel(), stds.ravel())
+  price_sums = np.zeros(n_steps)
+  counts = np.zeros((n_steps, HIST_BINS), dtype=np.int64)
+  n_tail = max(1, int(np.ceil(tail * paths_per_draw)))
+  seeds = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  for chunk, chunk_seed in zip(chunks, seeds.spawn(len(chunks))):
+    rng = np.random.default_rng(chunk_seed)
+    log_paths = simulate_draw_paths(rng, paths_per_draw, n_steps, p0, transmats[chunk.start:chunk.stop], means[chunk.start:chunk.stop], stds[chunk.start:chunk.stop])
+    prices = last_price * np.exp(log_paths).reshape(n_steps, len(chunk), paths_per_draw)
+    draw_bands[chunk.start:chunk.stop, 1:, 0] = prices.mean(axis=2).T
+    draw_bands[chunk.start:chunk.stop, 1:, 1:] = np.quantile(prices, quantiles, axis=2).transpose(2, 1, 0)
+    shortfall[chunk.start:chunk.stop] = np.sort(prices[-1], axis=1)[:, :n_tail].mean(axis=1)
+    if len(chunks) == 1:
+      prices = prices.reshape(n_steps, -1)
+      bands[1:, 0] = prices.mean(axis=1)
+      bands[1:, 1:] = np.quantile(prices, quantiles, axis=1).T
+      return bands, draw_bands, shortfall
+    price_sums += prices.sum(axis=(1, 2))
+    bins = ((log_paths - lo[:, None]) / width[:, None]).astype(np.int64)
+    np.clip(bins, 0, HIST_BINS - 1, out=bins)
+    bins += np.arange(n_steps)[:, None] * HIST_BINS
+    counts += np.bincount(bins.ravel(), minlength=n_steps * HIST_BINS).reshape(n_steps, HIST_BINS)
+
+  bands[1:, 0] = price_sums / (D * paths_per_draw)
+  bands[1:, 1:] = last_price * np.exp(histogram_quantiles(counts, lo, width, quantiles))
+  return bands, draw_bands, shortfall
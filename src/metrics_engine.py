@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+# Vectorized strategy metrics. Equity curves are passed as one array with time on axis 0 and any
+# number of trailing axes, e.g. (T, strategies) or (T, symbols, strategies). Every metric is computed
+# for all curves in one pass. Shorter curves can be NaN-padded at the start or the end.
+
+# Per-bar log returns with NaN where either bar is missing
+def log_returns(values):
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return np.log(values[1:] / values[:-1])
+
+# Final Value, Total Log Return, Volatility, CAGR, Max Drawdown and Calmar Ratio of every curve, rounded
+# like the original per-strategy loop. base is the price the returns are measured against (the
+# first price of the asset), broadcastable to the trailing shape.
+def summary_metrics(values, base, periods_per_year=252):
+  values = np.asarray(values, dtype=float)
+  valid = ~np.isnan(values)
+  n_obs = valid.sum(axis=0)
+  last_idx = values.shape[0] - 1 - np.argmax(valid[::-1], axis=0)
+  final = np.take_along_axis(values, last_idx[None], axis=0)[0]
+  log_std = np.nanstd(log_returns(values), axis=0)
+  max_drawdown = np.nanmin(values / np.fmax.accumulate(np.where(valid, values, -np.inf), axis=0) - 1.0, axis=0)
+  return summary_from_stats(final, base, n_obs, log_std, max_drawdown, periods_per_year)
+
+# The summary table from the final value, bar count, per-bar log-return standard deviation and max
+# drawdown (as a fraction) of every curve, for callers that get those numbers without the curves
+def summary_from_stats(final, base, n_obs, log_std, max_drawdown, periods_per_year=252):
+  growth = final / base
+  cagr_rounded = np.round((growth ** (1 / (n_obs / periods_per_year)) - 1) * 100, 2)
+  with np.errstate(divide="ignore", invalid="ignore"):
+    calmar = np.where(max_drawdown != 0, np.round(cagr_rounded / np.abs(max_drawdown * 100), 3), np.nan)
+  return {
+    "Final Value ($)": np.round(final, 2),
+    "Total Log Return (%)": np.round((growth - 1) * 100, 2),
+    "Volatility (%)": np.round(log_std * np.sqrt(periods_per_year) * 100, 2),
+    "CAGR (%)": cagr_rounded,
+    "Max Drawdown (%)": np.round(max_drawdown * 100, 1),
+    "Calmar Ratio": calmar,
+  }
+
+# Annualized Sharpe ratio of log returns over a trailing window, using running sums so the cost is
+# O(T) whatever the window
+def rolling_sharpe(values, window, periods_per_year=252):
+  r = log_returns(np.asarray(values, dtype=float))
+  valid = ~np.isnan(r)
+  r = np.where(valid, r, 0.0)
+  pad = np.zeros((1,) + r.shape[1:])
+  s1 = np.concatenate([pad, np.cumsum(r, axis=0)])
+  s2 = np.concatenate([pad, np.cumsum(r * r, axis=0)])
+  n = np.concatenate([pad, np.cumsum(valid, axis=0)])
+  count = n[window:] - n[:-window]
+  mean = (s1[window:] - s1[:-window]) / count
+  var = (s2[window:] - s2[:-window]) / count - mean ** 2
+  with np.errstate(divide="ignore", invalid="ignore"):
+    sharpe = mean / np.sqrt(np.maximum(var, 0)) * np.sqrt(periods_per_year)
+  sharpe = np.where(count == window, sharpe, np.nan)
+  out = np.full(np.shape(values), np.nan)
+  out[window:] = sharpe
+  return out
+
+# Drawdown from the highest value of the trailing window
+def rolling_drawdown(values, window):
+  values = np.asarray(values, dtype=float)
+  flat = values.reshape(len(values), -1)
+  peak = pd.DataFrame(flat).rolling(window, min_periods=1).max().values
+  return (flat / peak - 1.0).reshape(values.shape)
+
+# Annualized return, volatility, Sharpe, CAGR and max drawdown from the sum, sum of squares and
+# deepest log drawdown of n bars of log returns
+def _path_metrics(total, total_sq, log_drawdown, n, periods_per_year):
+  mean = total / n
+  std = np.sqrt(np.maximum(total_sq / n - mean ** 2, 0))
+  with np.errstate(divide="ignore", invalid="ignore"):
+    sharpe = mean / std * np.sqrt(periods_per_year)
+  return {
+    "Annual Return (%)": mean * periods_per_year * 100,
+    "Volatility (%)": std * np.sqrt(periods_per_year) * 100,
+    "Sharpe Ratio": sharpe,
+    "CAGR (%)": (np.exp(total * periods_per_year / n) - 1) * 100,
+    "Max Drawdown (%)": (np.exp(log_drawdown) - 1) * 100,
+  }
+
+# Summary of every block of `length` consecutive returns, one row per start bar: its sum, sum of
+# squares, lowest and highest running sum and deepest drawdown inside the block. A resampled path is
+# then scored from these per-block numbers alone, without gathering its bars.
+def _block_stats(r, length):
+  m = len(r) - length + 1
+  level = np.zeros((m,) + r.shape[1:])
+  sq = np.zeros_like(level)
+  low = np.full_like(level, np.inf)
+  high = np.zeros_like(level)
+  drawdown = np.zeros_like(level)
+  for j in range(length):
+    step = r[j:j + m]
+    level += step
+    sq += step * step
+    low = np.minimum(low, level)
+    high = np.maximum(high, level)
+    drawdown = np.minimum(drawdown, level - high)
+  return level, sq, low, high, drawdown
+
+# Sum, sum of squares and deepest log drawdown of paths built by chaining blocks, indexed by their
+# start bars with shape (batch, n_blocks); the loop runs over blocks, vectorized across the batch
+def _chain_blocks(stats, starts, carry=None):
+  level, sq, low, high, drawdown = (s[starts] for s in stats)
+  if carry is None:
+    shape = level.shape[:1] + level.shape[2:]
+    carry = (np.zeros(shape), np.zeros(shape), np.zeros(shape), np.zeros(shape))
+  total, total_sq, peak, worst = carry
+  total_sq = total_sq + sq.sum(axis=1)
+  for k in range(starts.shape[1]):
+    worst = np.minimum(worst, np.minimum(drawdown[:, k], total + low[:, k] - peak))
+    peak = np.maximum(peak, total + high[:, k])
+    total = total + level[:, k]
+  return total, total_sq, peak, worst
+
+# Moving-block bootstrap confidence intervals of the path metrics. Blocks of block_size bars are
+# drawn with replacement, using the same blocks for every curve so their correlation is kept, and
+# resamples are evaluated batch_size at a time.
+def bootstrap_metrics(values, n_resamples=1000, block_size=21, confidence=0.95, periods_per_year=252, batch_size=100, seed=None):
+  r = log_returns(np.asarray(values, dtype=float))
+  r = r[~np.isnan(r).reshape(len(r), -1).any(axis=1)]
+  n = len(r)
+  if n < block_size:
+    raise ValueError(f"Need at least block_size={block_size} returns to bootstrap, got {n}.")
+  n_full, tail = divmod(n, block_size)
+  full_stats = _block_stats(r, block_size)
+  tail_stats = _block_stats(r, tail) if tail else None
+  # Block starts are drawn up front so the result does not depend on batch_size
+  rng = np.random.default_rng(seed)
+  full_starts = rng.integers(0, n - block_size + 1, size=(n_resamples, n_full))
+  tail_starts = rng.integers(0, n - tail + 1, size=(n_resamples, 1))
+  samples = {}
+  for start in range(0, n_resamples, batch_size):
+    batch = slice(start, start + batch_size)
+    carry = _chain_blocks(full_stats, full_starts[batch])
+    if tail:
+      carry = _chain_blocks(tail_stats, tail_starts[batch], carry)
+    total, total_sq, _, worst = carry
+    for name, value in _path_metrics(total, total_sq, worst, n, periods_per_year).items():
+      samples.setdefault(name, []).append(value)
+
+  total, total_sq, _, worst = _chain_blocks(_block_stats(r, n), np.zeros((1, 1), dtype=np.intp))
+  point = _path_metrics(total[0], total_sq[0], worst[0], n, periods_per_year)
+  alpha = (1 - confidence) / 2
+  out = {}
+  for name, chunks in samples.items():
+    draws = np.concatenate(chunks, axis=0)
+    low, high = np.nanquantile(draws, [alpha, 1 - alpha], axis=0)
+    out[name] = {"estimate": point[name], "low": low, "high": high}
+  return out
+
+# Display name of a strategy column, e.g. buy_and_hold -> Buy and Hold
+def strategy_title(name):
+  return " ".join(w if w in ("and", "or", "of") else w.capitalize() for w in name.split("_"))
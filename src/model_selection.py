@@ -0,0 +1,105 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from hmmlearn.hmm import GaussianHMM
+
+# Model-order selection for the Gaussian HMM. Every (n_components, covariance_type) pair of the grid
+# is fitted from several random restarts in a process pool. EM runs in rounds of check_every
+# iterations. After each round, only the best keep_frac of the unfinished restarts in every group
+# go on (successive halving), so poor local optima stop early. The best restart of each group is
+# scored with BIC and AIC, and the winner by the chosen criterion is returned with a comparison table.
+
+# Number of free parameters of a Gaussian HMM
+def n_parameters(n_components, n_features, covariance_type):
+  k, f = n_components, n_features
+  covars = {
+    "diag": k * f,
+    "spherical": k,
+    "full": k * f * (f + 1) // 2,
+    "tied": f * (f + 1) // 2,
+  }[covariance_type]
+  return (k - 1) + k * (k - 1) + k * f + covars
+
+def information_criteria(log_likelihood, n_params, n_obs):
+  return {
+    "aic": 2 * n_params - 2 * log_likelihood,
+    "bic": n_params * math.log(n_obs) - 2 * log_likelihood,
+  }
+
+# Runs up to n_more EM iterations on one restart and reports its log-likelihood and whether EM converged
+def _em_round(args):
+  X, model, n_more = args
+  try:
+    if hasattr(model, "transmat_"):
+      model.init_params = ""
+    # fit() stops when the monitor reaches its own n_iter, set when the model was built
+    model.n_iter = model.monitor_.n_iter = n_more
+    model.fit(X)
+    history = model.monitor_.history
+    converged = len(history) >= 2 and history[-1] - history[-2] < model.monitor_.tol
+    return model, model.score(X), converged
+  except (ValueError, np.linalg.LinAlgError):
+    return model, -np.inf, True
+
+# Fits the whole grid and returns the winning model and a table comparing the best fit of every group
+def select_model(X, n_components_grid, covariance_types, n_restarts=10, n_iter=1000, check_every=10, keep_frac=0.5, criterion="bic", seed=0, workers=None):
+  if criterion not in ("aic", "bic"):
+    raise ValueError(f"Unknown selection criterion '{criterion}', expected 'aic' or 'bic'.")
+  if min(n_components_grid) < 2:
+    raise ValueError(f"Every n_components of the selection grid must be at least 2, got {list(n_components_grid)}.")
+  candidates = []
+  for k in n_components_grid:
+    for ct in covariance_types:
+      for r in range(n_restarts):
+        candidates.append({
+          "group": (k, ct),
+          "model": GaussianHMM(n_components=k, covariance_type=ct, random_state=seed + r),
+          "score": -np.inf, "iters": 0, "alive": True
+        })
+
+  workers = workers or os.cpu_count()
+  pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+  try:
+    while True:
+      alive = [c for c in candidates if c["alive"] and c["iters"] < n_iter]
+      if not alive:
+        break
+      n_more = min(check_every, n_iter - min(c["iters"] for c in alive))
+      tasks = [(X, c["model"], min(n_more, n_iter - c["iters"])) for c in alive]
+      results = pool.map(_em_round, tasks) if pool else map(_em_round, tasks)
+      for c, (model, score, converged), task in zip(alive, results, tasks):
+        c.update(model=model, score=score, iters=c["iters"] + task[2], alive=not converged)
+
+      # Successive halving: drop the weakest unfinished restarts of every group
+      for group in {c["group"] for c in alive}:
+        running = sorted((c for c in candidates if c["group"] == group and c["alive"]), key=lambda c: -c["score"])
+        for c in running[max(1, math.ceil(len(running) * keep_frac)):]:
+          c["alive"] = False
+  finally:
+    if pool:
+      pool.shutdown()
+
+  rows, best = [], {}
+  n_obs, n_features = X.shape
+  for c in candidates:
+    group = c["group"]
+    if group not in best or c["score"] > best[group]["score"]:
+      best[group] = c
+  for (k, ct), c in best.items():
+    n_params = n_parameters(k, n_features, ct)
+    rows.append({
+      "n_components": k,
+      "covariance_type": ct,
+      "log_likelihood": c["score"],
+      "n_params": n_params,
+      **information_criteria(c["score"], n_params, n_obs),
+      "n_iter": c["iters"],
+      "n_restarts": sum(1 for other in candidates if other["group"] == (k, ct))
+    })
+  table = pd.DataFrame(rows).sort_values(criterion).reset_index(drop=True)
+  table["selected"] = table.index == 0
+  winner = best[(int(table.loc[0, "n_components"]), table.loc[0, "covariance_type"])]["model"]
+  return winner, table
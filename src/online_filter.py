@@ -0,0 +1,201 @@
+import argparse
+import csv
+import math
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.columnar import append_table, table_dir, tail_table
+from utils.config import load_config
+from utils.model_store import load_params, model_path
+
+# Incremental regime filtering for new bars. The filter carries the forward-algorithm state (the
+# filtered regime probabilities at the last bar) so each new return costs O(K^2) instead of rerunning
+# predict_proba over the whole history. The last row of *_probs_states.csv is already a filtered
+# probability (smoothing does not revise the final bar), so the filter resumes from it directly.
+
+class RegimeFilter:
+  def __init__(self, transmat, means, variances, probs, lag=0):
+    self.transmat = np.asarray(transmat, dtype=float)
+    self.means = np.asarray(means, dtype=float).reshape(len(self.transmat), -1)
+    self.variances = np.asarray(variances, dtype=float).reshape(self.means.shape)
+    self.probs = np.asarray(probs, dtype=float)
+    self.lag = lag
+    # Per-state constant part of the diagonal Gaussian log density
+    self._log_norm = -0.5 * np.log(2 * np.pi * self.variances).sum(axis=1)
+    self._inv_var = 1.0 / self.variances
+    # Filtered probabilities and emission likelihoods of the last lag bars for the fixed-lag smoother
+    self._window = deque(maxlen=lag + 1)
+
+  # Builds a filter from a saved model artifact, starting from the given regime probabilities
+  @classmethod
+  def from_artifact(cls, path, probs, lag=0):
+    params, meta = load_params(path)
+    if meta["covariance_type"] != "diag":
+      raise ValueError(f"Online filtering needs a diag covariance model, got '{meta['covariance_type']}'.")
+    return cls(params["transmat"], params["means"], params["covars"], probs, lag=lag)
+
+  # Likelihood of an observation under each regime
+  def emission(self, x):
+    d = np.atleast_1d(x) - self.means
+    log_b = self._log_norm - 0.5 * (d * d * self._inv_var).sum(axis=1)
+    return np.exp(log_b - log_b.max())
+
+  # Advances the filter by one observation and returns the filtered probabilities and the most likely state
+  def update(self, x):
+    b = self.emission(x)
+    alpha = (self.probs @ self.transmat) * b
+    alpha /= alpha.sum()
+    self.probs = alpha
+    if self.lag:
+      self._window.append((alpha, b))
+    return (*alpha.tolist(), int(alpha.argmax()))
+
+  # Fixed-lag smoothed probabilities of the bars in the window, oldest first. The first row is the
+  # revised estimate for the bar lag steps back; the last row equals the filtered probabilities.
+  def smoothed(self):
+    if not self._window:
+      return np.empty((0, len(self.transmat)))
+    beta = np.ones(len(self.transmat))
+    out = []
+    for alpha, b in reversed(self._window):
+      post = alpha * beta
+      out.append(post / post.sum())
+      beta = self.transmat @ (b * beta)
+      beta /= beta.sum()
+    return np.array(out[::-1])
+
+# Adds simple and log close-to-close returns for one bar, matching process_returns.compute_returns
+def bar_returns(price, prev_price):
+  if prev_price is None or not prev_price:
+    return math.nan, math.nan
+  simple_ret = price / prev_price - 1.0
+  log_ret = math.log(price / prev_price) if price > 0 and prev_price > 0 else math.nan
+  return simple_ret, log_ret
+
+# Yields the rows of a bar CSV as dicts in date order. With follow, keeps polling the file for
+# appended rows like tail -f.
+def read_bars(path, follow=False, interval=1.0):
+  if not follow:
+    df = pd.read_csv(path, dtype=str)
+    df.columns = [c.strip().lower() for c in df.columns]
+    df = df.iloc[np.argsort(pd.to_datetime(df["date"]).values, kind="stable")]
+    yield from df.to_dict("records")
+    return
+  with open(path, "r", newline="") as f:
+    header = [c.strip().lower() for c in next(csv.reader([f.readline()]))]
+    buffer = ""
+    while True:
+      line = f.readline()
+      if not line:
+        time.sleep(interval)
+        continue
+      buffer += line
+      if not buffer.endswith("\n"):
+        continue
+      row = next(csv.reader([buffer]))
+      buffer = ""
+      if row:
+        yield dict(zip(header, row))
+
+# Appends filtered rows to the columnar copy of the probability table
+def append_columnar(path, rows, columns):
+  frame = pd.DataFrame(rows, columns=["date", *columns]).set_index("date")
+  append_table(frame.apply(pd.to_numeric, errors="coerce"), path)
+
+def format_date(date):
+  return date.strftime("%Y-%m-%d") if date == date.normalize() else date.strftime("%Y-%m-%d %H:%M:%S")
+
+# Filters every bar of the source that is newer than the last row of the probability table and
+# appends the new rows to it. With lag > 0 the fixed-lag smoothed rows go to *_lagged_states.csv.
+def stream(cfg, source, follow=False, interval=1.0, lag=0):
+  symbol = cfg["data"]["symbol"]
+  price = cfg["data"]["price_col"]
+  target = cfg["model"]["target_col"]
+  probs_path = Path(f"reports/{symbol}/tables/{symbol}_probs_states.csv")
+  lagged_path = Path(f"reports/{symbol}/tables/{symbol}_lagged_states.csv")
+
+  storage = cfg["storage"]
+  columnar = storage["format"] == "columnar" and table_dir(probs_path).exists()
+  write_csv = probs_path.exists() and (storage["format"] == "csv" or storage["export_csv"])
+
+  hist = tail_table(probs_path, storage)
+  columns = list(hist.columns)
+  prob_cols = columns[:columns.index("state")]
+  last = hist.iloc[-1]
+  last_date = hist.index[-1]
+  prev_price = float(last[price])
+  filt = RegimeFilter.from_artifact(model_path(symbol), last[prob_cols].values.astype(float), lag=lag)
+  if filt.means.shape[1] != 1:
+    raise ValueError(f"Online filtering uses {target} alone, but the model was fitted on {filt.means.shape[1]} features. Append the bars with process_returns.py --append and rerun the pipeline instead.")
+  dates = deque(maxlen=lag + 1)
+
+  out = open(probs_path, "a", newline="") if write_csv else None
+  writer = csv.writer(out) if write_csv else None
+  pending = []
+  if lag:
+    write_header = not lagged_path.exists()
+    lagged_out = open(lagged_path, "a", newline="")
+    lagged_writer = csv.writer(lagged_out)
+    if write_header:
+      lagged_writer.writerow(["date", *prob_cols, "state"])
+
+  n_new = 0
+  try:
+    for bar in read_bars(source, follow=follow, interval=interval):
+      date = pd.Timestamp(bar["date"])
+      if date <= last_date:
+        continue
+      px = float(bar[price])
+      bar["simple_ret"], bar["log_ret"] = bar_returns(px, prev_price)
+      prev_price, last_date = px, date
+      x = float(bar[target])
+      if math.isnan(x):
+        continue
+
+      *probs, state = filt.update(x)
+      row = {**bar, **dict(zip(prob_cols, probs)), "state": state}
+      values = [row.get(c, "") for c in columns]
+      if write_csv:
+        writer.writerow([format_date(date)] + values)
+      if columnar:
+        pending.append([date, *values])
+      n_new += 1
+
+      if lag:
+        dates.append(date)
+        if len(dates) == lag + 1:
+          revised = filt.smoothed()[0]
+          lagged_writer.writerow([format_date(dates[0]), *revised.tolist(), int(revised.argmax())])
+      if follow:
+        if write_csv:
+          out.flush()
+        if pending:
+          append_columnar(probs_path, pending, columns)
+          pending = []
+        if lag:
+          lagged_out.flush()
+  finally:
+    if pending:
+      append_columnar(probs_path, pending, columns)
+    if write_csv:
+      out.close()
+    if lag:
+      lagged_out.close()
+  return n_new
+
+def main():
+  parser = argparse.ArgumentParser(description="Filter new bars incrementally and append them to the probability table.")
+  parser.add_argument("source", help="CSV of new bars (date, OHLCV), e.g. a replayed file or one being appended to")
+  parser.add_argument("--follow", action="store_true", help="Keep watching the source for appended bars")
+  parser.add_argument("--interval", type=float, default=1.0, help="Seconds between polls with --follow")
+  parser.add_argument("--lag", type=int, default=0, help="Also write fixed-lag smoothed states with this lag")
+  args = parser.parse_args()
+  n_new = stream(load_config(), args.source, follow=args.follow, interval=args.interval, lag=args.lag)
+  print(f"Appended {n_new} new bars.")
+
+if __name__ == "__main__":
+  main()
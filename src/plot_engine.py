@@ -0,0 +1,286 @@
+import hashlib
+import math
+import sys
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")  # Figures are only ever saved to files, never shown
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+import pandas as pd
+
+from metrics_engine import strategy_title
+from utils.columnar import load_table
+from utils.regimes import regime_colors, regime_title
+
+# Drawing for the pipeline's figures. Bar-by-bar series are reduced before they reach matplotlib:
+#   decimate      keeps the lowest and highest bar of every pixel-sized bucket, so a line through the
+#                 kept bars covers the same pixels as one through every bar
+#   regime_line   draws a series colored by regime as one LineCollection with a polyline per regime
+#                 spell (run-length encoded states) instead of a scatter point per bar
+# render() skips a figure whose data, parameters and drawing code hash to the value stored in the
+# existing PNG. plot_results, plot_forecast and plot_backtest draw a symbol's figures from its tables,
+# for the stage scripts and for render_figures.py.
+
+# Indices of the first, last, lowest and highest point of every bucket of a series, in order. With
+# about as many buckets as pixel columns the decimated line looks the same as the full one.
+def decimate(y, max_points):
+  y = np.asarray(y, dtype=float)
+  n = len(y)
+  if not max_points or n <= max_points:
+    return np.arange(n)
+  size = -(-n // max(max_points // 2, 1))
+  n_buckets = -(-n // size)
+  low = np.full(n_buckets * size, np.inf)
+  high = np.full(n_buckets * size, -np.inf)
+  low[:n] = np.where(np.isnan(y), np.inf, y)
+  high[:n] = np.where(np.isnan(y), -np.inf, y)
+  offsets = np.arange(n_buckets) * size
+  keep = np.concatenate([
+    [0, n - 1],
+    offsets + low.reshape(n_buckets, size).argmin(axis=1),
+    offsets + high.reshape(n_buckets, size).argmax(axis=1)
+  ])
+  return np.unique(np.minimum(keep, n - 1))
+
+# Start, end (exclusive) and value of every run of equal consecutive states
+def run_lengths(states):
+  states = np.asarray(states)
+  if len(states) == 0:
+    return np.empty(0, dtype=int), np.empty(0, dtype=int), states
+  starts = np.concatenate([[0], np.flatnonzero(states[1:] != states[:-1]) + 1])
+  ends = np.concatenate([starts[1:], [len(states)]])
+  return starts, ends, states[starts]
+
+def _as_numbers(x):
+  x = np.asarray(x)
+  return mdates.date2num(x) if x.dtype.kind == "M" else x.astype(float)
+
+# Series colored by the regime of each bar, one polyline per regime spell. Each spell runs on to the
+# first bar of the next one, so the line has no gaps.
+def regime_line(ax, x, y, states, colors, max_points=None, **kwargs):
+  idx = decimate(y, max_points)
+  is_date = np.asarray(x).dtype.kind == "M"
+  points = np.column_stack([_as_numbers(np.asarray(x)[idx]), np.asarray(y, dtype=float)[idx]])
+  starts, ends, values = run_lengths(np.asarray(states)[idx])
+  segments = [points[s:min(e + 1, len(points))] for s, e in zip(starts, ends)]
+  lines = LineCollection(segments, colors=[colors[v] for v in values], **kwargs)
+  ax.add_collection(lines)
+  if is_date:
+    ax.xaxis_date()
+  ax.autoscale_view()
+  return lines
+
+# Bars from zero colored by regime, drawn as one collection of vertical lines over the decimated bars
+def regime_bars(ax, x, y, states, colors, max_points=None, **kwargs):
+  idx = decimate(y, max_points)
+  x = np.asarray(x)[idx]
+  lines = ax.vlines(x, 0, np.asarray(y, dtype=float)[idx], colors=[colors[s] for s in np.asarray(states)[idx]], **kwargs)
+  if x.dtype.kind == "M":
+    ax.xaxis_date()
+  return lines
+
+# Legend entries of the regimes of a figure
+def regime_handles(labels, colors, **kwargs):
+  return [Line2D([], [], color=colors[i], label=regime_title(label), **kwargs) for i, label in enumerate(labels)]
+
+# Plain (optionally decimated) line
+def series_line(ax, x, y, max_points=None, **kwargs):
+  idx = decimate(y, max_points)
+  return ax.plot(np.asarray(x)[idx], np.asarray(y, dtype=float)[idx], **kwargs)
+
+# Hash of the data and parameters a figure is drawn from, plus the code that draws it
+def data_hash(draw, data, params):
+  h = hashlib.sha256(matplotlib.__version__.encode())
+  for module in sorted({__name__, draw.__module__}):
+    h.update(Path(sys.modules[module].__file__).read_bytes())
+  h.update(draw.__qualname__.encode())
+  for value in data:
+    if hasattr(value, "columns"):
+      h.update(repr(list(value.columns)).encode())
+      value = [value.index.values, *(value[c].values for c in value.columns)]
+    elif hasattr(value, "index"):
+      value = [value.index.values, value.values]
+    for arr in value if isinstance(value, list) else [value]:
+      arr = np.ascontiguousarray(arr)
+      h.update(str(arr.dtype).encode() + str(arr.shape).encode())
+      h.update(arr.tobytes())
+  h.update(repr(sorted(params.items())).encode())
+  return h.hexdigest()
+
+def stored_hash(path):
+  from PIL import Image
+
+  try:
+    with Image.open(path) as img:
+      return img.text.get("Data-Hash")
+  except (OSError, ValueError):
+    return None
+
+# Saves draw(*data, **params) to path unless the PNG there was drawn from the same data, parameters
+# and code. Returns whether the figure was drawn.
+def render(path, draw, *data, skip_unchanged=True, **params):
+  path = Path(path)
+  digest = data_hash(draw, data, params)
+  if skip_unchanged and path.exists() and stored_hash(path) == digest:
+    return False
+  fig = draw(*data, **params)
+  path.parent.mkdir(parents=True, exist_ok=True)
+  fig.savefig(path, metadata={"Data-Hash": digest})
+  plt.close(fig)
+  return True
+
+# Price with regime coloring and volume, above the regime-colored returns
+def regime_figure(df, symbol, price, returns, max_points=None):
+  labels = [c[:-len("_prob")] for c in df.columns if c.endswith("_prob")]
+  colors = regime_colors(len(labels))
+  states = df["state"].values
+  fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(8, 8), sharex=True, gridspec_kw={'height_ratios': [2, 1]})
+
+  # Price with Regime Coloring
+  regime_line(ax1, df.index.values, df[price].values, states, colors, max_points, linewidth=1.5)
+  ax1.set_ylabel("Closing Price")
+
+  # Overlay volume on a secondary y-axis, but scale it down for better visualization
+  volume = df["volume"].values
+  idx = decimate(volume, max_points)
+  ax1b = ax1.twinx()
+  ax1b.plot(df.index.values[idx], volume[idx], label="Volume (scaled)", color='lightgreen', alpha=0.5)
+  ax1b.fill_between(df.index.values[idx], volume[idx], color='lightgreen', alpha=0.2)
+  ax1b.set_ylabel("Volume")
+  ax1b.tick_params(axis='y')
+
+  # Add space below the lowest price and above the volume
+  min_price = df[price].min()
+  max_price = df[price].max()
+  price_padding = (max_price - min_price) * 0.2  # 20% padding
+  ax1.set_ylim(bottom=min_price - price_padding)
+
+  mid_volume = (volume.max() + volume.min())/2
+  volume_padding = mid_volume * 9  # 900% padding
+  ax1b.set_ylim(top=mid_volume + volume_padding)
+
+  ax1.set_title(f"{symbol} Price with Regime Coloring")
+  ax1.legend(handles=regime_handles(labels, colors), loc="upper left")
+  ax1.grid(True)
+
+  # Returns with Regime Coloring
+  regime_bars(ax2, df.index.values, df[returns].values, states, colors, max_points, linewidth=1.0)
+  ax2.set_title(f"{symbol} Returns with Regime Coloring")
+  ax2.set_xlabel("Date")
+  ax2.set_ylabel("Log Returns")
+  ax2.grid(True)
+  fig.tight_layout()
+  return fig
+
+def returns_histogram(returns, symbol):
+  fig = plt.figure(figsize=(10, 6))
+  plt.hist(returns.dropna(), bins=50, color='blue', alpha=0.7, edgecolor='black')
+  plt.title(f"{symbol} Returns Histogram")
+  plt.xlabel("Log Returns")
+  plt.ylabel("Frequency")
+  plt.grid(axis='y', alpha=0.75)
+  fig.tight_layout()
+  return fig
+
+# Historical prices followed by the forecast bands, the mean path colored by its most likely regime
+def forecast_figure(hist_price, forecast_df, symbol, title_method, max_points=None):
+  labels = [c[:-len("_prob")] for c in forecast_df.columns if c.endswith("_prob")]
+  colors = regime_colors(len(labels))
+  fig, ax = plt.subplots(figsize=(14, 7))
+  series_line(ax, hist_price.index.values, hist_price.values, max_points, label="Historical Price", color="black")
+  ax.plot(forecast_df.index, forecast_df["point_forecast"], label="Forecast (mean)", color="gray")
+  ax.plot(forecast_df.index, forecast_df["median_forecast"], label="Forecast (median)", color="gray", linestyle="--")
+  ax.fill_between(forecast_df.index, forecast_df["p05"], forecast_df["p95"], color="gray", alpha=0.2, label="5-95% Quantile")
+  regime_line(ax, forecast_df.index.values, forecast_df["point_forecast"].values, forecast_df["state"].values, colors, max_points, linewidth=2)
+  ax.set_xlabel("Date")
+  ax.set_ylabel("Closing Price")
+  ax.set_title(f"{symbol} Price Forecast ({title_method})")
+  ax.legend(handles=ax.get_legend_handles_labels()[0] + regime_handles(labels, colors, linewidth=2), loc="upper left")
+  ax.grid(True)
+  fig.tight_layout()
+  return fig
+
+# One panel per strategy: its value colored by regime over the price
+def backtest_figure(df, strategies, titles, labels, symbol, price, max_points=None):
+  colors = regime_colors(len(labels))
+  states = df['state'].values
+  # One panel per strategy, two to a row
+  ncols = min(2, len(strategies))
+  nrows = math.ceil(len(strategies) / ncols)
+  fig, axes = plt.subplots(nrows, ncols, figsize=(9 * ncols, 6 * nrows), sharex=True, squeeze=False)
+  axes = axes.flatten()
+  for i, ax in enumerate(axes[:len(strategies)]):
+    # Plot price, and the strategy portfolio value colored by regime over it
+    price_line = series_line(ax, df.index.values, df[price].values, max_points, label='Closing Price', color='gray', alpha=0.5)
+    regime_line(ax, df.index.values, df[strategies[i]].values, states, colors, max_points, linewidth=1.5)
+    ax.set_title(titles[i])
+    ax.set_ylabel("Price / Portfolio Value")
+    ax.legend(handles=price_line + regime_handles(labels, colors), loc='upper left')
+    # The lowest panel of each column carries the date axis
+    if i + ncols >= len(strategies):
+      ax.set_xlabel("Date")
+      ax.xaxis.set_tick_params(labelbottom=True)
+  for ax in axes[len(strategies):]:
+    ax.set_visible(False)
+
+  fig.suptitle(f"Backtest Results for {symbol}", fontsize=18)
+  fig.tight_layout(rect=[0, 0.03, 1, 0.97])
+  return fig
+
+# Price/regime and returns histogram figures of a symbol (plot_results.py)
+def plot_results(cfg, probs_states=None):
+  price = cfg["data"]["price_col"]
+  returns = cfg["model"]["target_col"]
+  symbol = cfg["data"]["symbol"]
+  plotting = cfg["plotting"]
+  df = probs_states if probs_states is not None else load_table(f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"])
+  prob_cols = [c for c in df.columns if c.endswith("_prob")]
+  return [
+    render(
+      f"reports/{symbol}/figures/{symbol}_price_and_return_with_regime.png", regime_figure,
+      df[prob_cols + ["state", price, "volume", returns]], symbol=symbol, price=price, returns=returns,
+      max_points=plotting["max_points"], skip_unchanged=plotting["skip_unchanged"]
+    ),
+    render(
+      f"reports/{symbol}/figures/{symbol}_returns_histogram.png", returns_histogram,
+      df[returns], symbol=symbol, skip_unchanged=plotting["skip_unchanged"]
+    )
+  ]
+
+# Forecast figure of a symbol (plot_forecast.py)
+def plot_forecast(cfg, probs_states=None):
+  symbol = cfg["data"]["symbol"]
+  price = cfg["data"]["price_col"]
+  plotting = cfg["plotting"]
+  hist_df = probs_states[[price]] if probs_states is not None else load_table(f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"], columns=[price])
+  forecast_df = pd.read_csv(f"reports/{symbol}/tables/{symbol}_forecast.csv", parse_dates=["index"]).set_index("index")
+  method = f"{cfg['forecasting']['n_sims']} simulated paths" if cfg["forecasting"]["method"] == "monte_carlo" else "exact density"
+  return [render(
+    f"reports/{symbol}/figures/{symbol}_forecast.png", forecast_figure,
+    hist_df[price], forecast_df, symbol=symbol, title_method=method,
+    max_points=plotting["max_points"], skip_unchanged=plotting["skip_unchanged"]
+  )]
+
+# Backtest figure of a symbol (backtest.py), from its strategies table unless the curves are given
+def plot_backtest(cfg, df=None, labels=None):
+  symbol = cfg["data"]["symbol"]
+  price = cfg["data"]["price_col"]
+  plotting = cfg["plotting"]
+  if df is None:
+    # Round-trip parsing gives back the exact curves backtest.py drew, so the figure hash matches
+    df = pd.read_csv(f"reports/{symbol}/tables/{symbol}_strategies.csv", parse_dates=["date"], float_precision="round_trip").set_index("date")
+  if labels is None:
+    labels = pd.read_csv(f"reports/{symbol}/tables/{symbol}_transition_matrix.csv", index_col=0).index.tolist()
+  # One panel per strategy declared under backtest.strategies, in config order
+  strategies = list(cfg["backtest"]["strategies"])
+  titles = [strategy_title(s) for s in strategies]
+  return [render(
+    f"reports/{symbol}/figures/{symbol}_backtest_results.png", backtest_figure,
+    df[['state', price] + strategies], strategies=strategies, titles=titles, labels=labels, symbol=symbol, price=price,
+    max_points=plotting["max_points"], skip_unchanged=plotting["skip_unchanged"]
+  )]
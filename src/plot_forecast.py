@@ -1,40 +1,6 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 from utils.config import load_config
-from pathlib import Path
+from plot_engine import plot_forecast
 
-cfg = load_config()
-symbol = cfg["data"]["symbol"]
-price_col = cfg["data"]["price_col"]
-n_steps = cfg["forecasting"]["n_steps"]
-n_sims = cfg["forecasting"]["n_sims"]
-
-# Load historical prices
-hist_df = pd.read_csv(f"reports/{symbol}/tables/{symbol}_probs_states.csv", parse_dates=["date"]).set_index("date")
-
-# Load forecast
-forecast_df = pd.read_csv(f"reports/{symbol}/tables/{symbol}_forecast.csv", parse_dates=["index"]).set_index("index")
-low_vol = forecast_df["state"] == 0
-high_vol = forecast_df["state"] == 1
-
-# Plot
-plt.figure(figsize=(14, 7))
-plt.plot(hist_df.index, hist_df[price_col], label="Historical Price", color="black")
-plt.plot(forecast_df.index, forecast_df["point_forecast"], label="Forecast (mean)", color="gray")
-plt.plot(forecast_df.index, forecast_df["median_forecast"], label="Forecast (median)", color="gray", linestyle="--")
-plt.fill_between(forecast_df.index, forecast_df["p05"], forecast_df["p95"], color="gray", alpha=0.2, label="5-95% Quantile")
-plt.scatter(forecast_df.index[low_vol], forecast_df["point_forecast"][low_vol], color="green", label="Low Volatility",s=10)
-plt.scatter(forecast_df.index[high_vol], forecast_df["point_forecast"][high_vol], color="red", label="High Volatility", s=10)
-
-plt.xlabel("Date")
-plt.ylabel("Closing Price")
-plt.title(f"{symbol} Price Forecast ({n_sims} simulations/day)")
-plt.legend(loc="upper left")
-plt.grid(True)
-
-# Save
-out_path = Path(f"reports/{symbol}/figures/{symbol}_forecast.png")
-out_path.parent.mkdir(parents=True, exist_ok=True)
-plt.tight_layout()
-plt.savefig(out_path)
-plt.close()
\ No newline at end of file
+# Historical prices followed by the forecast bands
+if __name__ == "__main__":
+  plot_forecast(load_config())
@@ -1,23 +1,32 @@
-import pandas as pd
+from utils.columnar import load_table, save_table
 from utils.config import load_config
-from pathlib import Path
 
-cfg = load_config()
+# The prep_model stage: splits the model inputs into the training and full data and saves both.
+# processed is the processed data when it is already in memory.
+def prep_model(cfg, processed=None):
+  target = cfg["model"]["target_col"]
+  symbol = cfg["data"]["symbol"]
+  features = cfg["features"]
 
-df = pd.read_csv(cfg["data"]["processed_path"], parse_dates=["date"]).set_index("date")
-returns = df[cfg["model"]["target_col"]]
-symbol = cfg["data"]["symbol"]
+  # The model is fitted on the target returns, or on the rolling feature table led by them
+  if features["enabled"]:
+    data = load_table(features["path"].format(symbol=symbol), cfg["storage"])
+    if data.columns[0] != target:
+      raise ValueError(f"The first feature must be model.target_col '{target}', got '{data.columns[0]}'.")
+  elif processed is not None:
+    data = processed[[target]]
+  else:
+    data = load_table(cfg["data"]["processed_path"], cfg["storage"], columns=[target])
 
-# Splitting the data into a training set to feed into the model
-split_index = int(len(returns) * cfg["model"]["train_frac"])
-train_data = returns.iloc[:split_index].dropna()
-full_data = returns.dropna()
+  # Splitting the data into a training set to feed into the model
+  split_index = int(len(data) * cfg["model"]["train_frac"])
+  train_data = data.iloc[:split_index].dropna()
+  full_data = data.dropna()
 
-# Saving the training data to CSV files
-p = Path(f"data/temp/{symbol}/{symbol}_train_data.csv")
-p.parent.mkdir(parents=True, exist_ok=True)
-train_data.reset_index().to_csv(p, index=False)
+  # Saving the training data
+  save_table(train_data, f"data/temp/{symbol}/{symbol}_train_data.csv", cfg["storage"])
+  save_table(full_data, f"data/temp/{symbol}/{symbol}_full_data.csv", cfg["storage"])
+  return train_data, full_data
 
-p = Path(f"data/temp/{symbol}/{symbol}_full_data.csv")
-p.parent.mkdir(parents=True, exist_ok=True)
-full_data.reset_index().to_csv(p, index=False)
\ No newline at end of file
+if __name__ == "__main__":
+  prep_model(load_config())
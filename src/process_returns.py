@@ -1,40 +1,86 @@
 import argparse
+import io
 from pathlib import Path
 import numpy as np
 import pandas as pd
+from utils.columnar import append_rows, reversed_lines, save_table, table_files, tail_table
 from utils.config import load_config
 
-cfg = load_config()
+# Rows on or before this date are dropped, unless ingest.start says otherwise
+START_CUTOFF = pd.Timestamp("2000-03-20")
 
-def main():
-  df = load_prices(cfg["data"]["raw_path"])
-  df = compute_returns(df, price=cfg["data"]["price_col"])
-  save_processed(df, cfg["data"]["processed_path"])
+# The process_returns stage. Returns the processed data, or None after an append (only the new rows
+# were read).
+def process_returns(cfg, append=False):
+  ingest = cfg["ingest"]
+  if ingest["mode"] not in ("full", "append"):
+    raise ValueError(f"Unknown ingest mode '{ingest['mode']}', expected 'full' or 'append'.")
+  raw_path, processed_path, price = cfg["data"]["raw_path"], cfg["data"]["processed_path"], cfg["data"]["price_col"]
 
-# Loads the raw pricing data, parses dates into datetime, and forces all numerical values to be integers
-def load_prices(in_path):
-  df = pd.read_csv(in_path, parse_dates=["date"])
-  
-  df.columns = [c.strip().lower() for c in df.columns]
-  df = df.sort_values("date").set_index("date")
-  
-  df = df[~df.index.duplicated(keep='first')]
-  df = df.drop_duplicates()
-  
-  # Convert all columns except 'date' to numeric
-  numeric_cols = [c for c in df.columns if c != "date"]
-  df = df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors="coerce")
-  
-  # Replace empty strings with NaN
-  df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
-  # Drop rows where all columns are NaN
-  df.dropna(how='all', inplace=True)
-  
-  # Remove all times before 2000-03-20
-  df = df.loc[df.index > pd.Timestamp("2000-03-20")]
-  
+  processed = table_files(processed_path, cfg["storage"])
+  if (append or ingest["mode"] == "append") and all(Path(p).exists() for p in processed):
+    n_new = append_prices(raw_path, processed_path, price=price, schema=ingest["schema"], storage=cfg["storage"])
+    print(f"Appended {n_new} new rows to {processed_path}.")
+    return None
+
+  df = load_prices(raw_path, schema=ingest["schema"], chunk_rows=ingest["chunk_rows"], start=ingest.get("start", START_CUTOFF))
+  df = compute_returns(df, price=price)
+  save_processed(df, processed_path, storage=cfg["storage"])
   return df
 
+def main():
+  parser = argparse.ArgumentParser(description="Load raw prices, compute returns and save the processed data.")
+  parser.add_argument("--append", action="store_true", help="Only add raw rows newer than the last processed date (same as ingest.mode: append)")
+  args = parser.parse_args()
+  process_returns(load_config(), append=args.append)
+
+# Lower-cased, stripped column name, as every later stage refers to columns
+def normalize(name):
+  return name.strip().lower()
+
+# Loads the raw pricing data with an explicit dtype per column. schema maps normalized column names to
+# dtypes; columns it does not list are coerced to numbers. When a value does not parse under the
+# schema, the file is read again with per-column coercion (unparseable values become NaN). With
+# chunk_rows, the file is read that many rows at a time so multi-GB files never sit in memory as text.
+# Rows on or before start are dropped (None keeps them all).
+def load_prices(in_path, schema=None, chunk_rows=None, start=START_CUTOFF):
+  schema = schema or {}
+  header = pd.read_csv(in_path, nrows=0).columns
+  if hasattr(in_path, "seek"):
+    in_path.seek(0)
+  date_col = next((c for c in header if normalize(c) == "date"), None)
+  if date_col is None:
+    raise KeyError(f"No 'date' column found in {in_path}.")
+  dtype = {c: schema[normalize(c)] for c in header if normalize(c) in schema}
+
+  try:
+    chunks = [_clean(chunk, date_col, start=start) for chunk in _read(in_path, date_col, dtype, chunk_rows)]
+  except (ValueError, TypeError):
+    if hasattr(in_path, "seek"):
+      in_path.seek(0)
+    chunks = [_clean(chunk, date_col, coerce=True, start=start) for chunk in _read(in_path, date_col, {}, chunk_rows)]
+
+  df = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+  if not df.index.is_monotonic_increasing:
+    df = df.sort_index(kind="stable")
+  return df[~df.index.duplicated(keep="first")]
+
+def _read(in_path, date_col, dtype, chunk_rows):
+  reader = pd.read_csv(in_path, dtype=dtype, parse_dates=[date_col], chunksize=chunk_rows)
+  return reader if chunk_rows else [reader]
+
+# Normalizes one chunk: lower-case columns, date index, numeric values, rows after start, no empty rows
+def _clean(chunk, date_col, coerce=False, start=START_CUTOFF):
+  chunk = chunk.set_index(date_col)
+  chunk.index.name = "date"
+  chunk.columns = [normalize(c) for c in chunk.columns]
+  for c in chunk.columns:
+    if coerce or not pd.api.types.is_numeric_dtype(chunk[c]):
+      chunk[c] = pd.to_numeric(chunk[c], errors="coerce")
+  if start is not None:
+    chunk = chunk.loc[chunk.index > pd.Timestamp(start)]
+  return chunk.dropna(how="all")
+
 # Computes the simple and log close-to-close returns and adds the to the data frame
 def compute_returns(df,price="adj_close"):
   if price not in df.columns:
@@ -50,11 +96,59 @@ def compute_returns(df,price="adj_close"):
   
   return df
 
-# Saves the processed data
-def save_processed(df,out_path):
-  p = Path(out_path)
-  p.parent.mkdir(parents=True, exist_ok=True)
-  df.reset_index().to_csv(p, index=False)
-  
+# Saves the processed data, as a CSV and/or a columnar table depending on the storage config
+def save_processed(df,out_path, storage=None):
+  save_table(df, out_path, storage)
+
+# The header of a raw CSV and its data lines dated after `after`, read from whichever end of the file
+# holds the newest rows, so the cost grows with the number of new rows rather than the file size
+def _raw_lines_after(in_path, after):
+  with open(in_path, "rb") as f:
+    header = f.readline()
+    date_idx = [normalize(c) for c in header.decode().split(",")].index("date")
+    line_date = lambda line: pd.Timestamp(line.split(b",")[date_idx].decode().strip())
+    first = f.readline()
+    if not first.strip():
+      return header, []
+    last = next(reversed_lines(f))
+    if line_date(first) <= line_date(last):
+      # Oldest first: walk back from the end
+      lines = []
+      for line in reversed_lines(f):
+        if line == header.rstrip(b"\r\n") or line_date(line) <= after:
+          break
+        lines.append(line)
+      return header, lines[::-1]
+    # Newest first: walk forward from the top
+    f.seek(len(header))
+    lines = []
+    for line in f:
+      line = line.rstrip(b"\r\n")
+      if not line.strip():
+        continue
+      if line_date(line) <= after:
+        break
+      lines.append(line)
+    return header, lines
+
+# Appends the returns of the raw rows newer than the last processed date to the processed table. The
+# previous close seeds the first new return, so the result matches reprocessing the whole history.
+def append_prices(in_path, processed_path, price="adj_close", schema=None, storage=None):
+  seed = tail_table(processed_path, storage)
+  last_date = seed.index[-1]
+
+  header, lines = _raw_lines_after(in_path, last_date)
+  if not lines:
+    return 0
+  new = load_prices(io.BytesIO(header + b"\n".join(lines) + b"\n"), schema=schema)
+  new = new.loc[new.index > last_date]
+  if new.empty:
+    return 0
+  returns = compute_returns(pd.concat([seed[[price]], new[[price]]]), price=price).iloc[1:]
+  new[["simple_ret", "log_ret"]] = returns[["simple_ret", "log_ret"]]
+  new = new.reindex(columns=seed.columns)
+  append_rows(new, processed_path, storage)
+  return len(new)
+
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -0,0 +1,331 @@
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from batch_inference import full_covars
+from forecast_cache import cached_forecast_bands
+from forecast_engine import band_columns, regime_path
+from online_filter import RegimeFilter, bar_returns
+from utils.bars import bar_dates
+from utils.columnar import table_dir, tail_table
+from utils.config import apply_symbol, load_config
+from utils.model_store import load_params, model_path
+from utils.regimes import regime_labels
+
+# Local query service for the regimes and forecasts of fitted symbols. A symbol's saved model and the
+# last row of its *_probs_states table are loaded on first use and kept in an in-memory LRU cache of
+# service.max_symbols entries, so later queries only check the mtimes of those files. A refit or new
+# rows on disk reload the symbol. Pushed bars advance the cached filtered probabilities with the
+# forward algorithm (see online_filter.py); they are not written back to the tables, and a reload
+# replaces them with what is on disk. Forecast bands are cached per horizon until the next push, on top of forecast_cache.py.
+# Forecasts that are not cached are computed on a worker thread, so the event loop keeps answering.
+#
+#   GET  /health                          cache size, hit and miss counts
+#   GET  /regime/<SYMBOL>                 filtered regime probabilities and state at the last bar
+#   GET  /distribution/<SYMBOL>?steps=n   regime distribution n bars ahead, p @ T^n (n <= service.max_steps)
+#   GET  /forecast/<SYMBOL>?steps=n       price quantile bands of the configured forecasting method
+#   POST /bars/<SYMBOL>                   {"bars": [{"date": ..., "<price_col>": ...}, ...]}
+
+# Routes taking a symbol, besides GET /health
+ROUTES = {("GET", "regime"), ("GET", "distribution"), ("GET", "forecast"), ("POST", "bars")}
+
+# Everything the service knows about one symbol
+class SymbolState:
+  def __init__(self, cfg, symbol):
+    self.symbol = symbol
+    self.price = cfg["data"]["price_col"]
+    self.target = cfg["model"]["target_col"]
+    self.bars = cfg.get("bars")
+    table = f"reports/{symbol}/tables/{symbol}_probs_states.csv"
+    # Taken before loading, so a file replaced while it loads is seen as changed next time
+    self.sources = [model_path(symbol), table_dir(table) / "manifest.json", table]
+    self.mtimes = _mtimes(self.sources)
+    params, meta = load_params(model_path(symbol))
+    K, F = params["means"].shape
+    self.labels = regime_labels(K)
+    self.transmat = params["transmat"]
+    # Forecasts compound the first feature, the return (see forecast.py)
+    self.means = params["means"][:, 0]
+    self.stds = np.sqrt(full_covars(params["covars"], meta["covariance_type"], K, F)[:, 0, 0])
+    last = tail_table(table, cfg["storage"])
+    self.date = last.index[-1]
+    self.last_price = float(last[self.price].iloc[-1])
+    self.probs = last[[f"{l}_prob" for l in self.labels]].iloc[-1].values.astype(float)
+    self.state = int(last["state"].iloc[-1])
+    # Pushed bars are filtered on the return alone, like online_filter.py
+    self.filter = None
+    if F == 1 and meta["covariance_type"] == "diag":
+      self.filter = RegimeFilter(self.transmat, self.means, self.stds ** 2, self.probs)
+    self.forecasts = {}
+    self.pushes = 0
+
+  # Whether the model or the probability table changed on disk since the state was loaded
+  def stale(self):
+    return _mtimes(self.sources) != self.mtimes
+
+  def regime(self):
+    return {
+      "symbol": self.symbol,
+      "date": self.date.isoformat(),
+      "price": self.last_price,
+      "probs": dict(zip(self.labels, self.probs.tolist())),
+      "state": self.state,
+      "label": self.labels[self.state]
+    }
+
+  def distribution(self, steps):
+    probs = self.probs @ np.linalg.matrix_power(self.transmat, steps)
+    return {"symbol": self.symbol, "date": self.date.isoformat(), "steps": steps, "probs": dict(zip(self.labels, probs.tolist()))}
+
+  def forecast(self, fc, steps):
+    if steps not in self.forecasts:
+      self.forecasts[steps] = self.forecast_job(fc, steps)()
+    return self.forecasts[steps]
+
+  # A call computing the forecast from the state as it is now. Bars pushed while it runs do not change
+  # its inputs, so it can run off the event loop.
+  def forecast_job(self, fc, steps):
+    date, last_price, probs = self.date, self.last_price, self.probs.copy()
+
+    def run():
+      bands, _ = cached_forecast_bands(fc, last_price, probs, self.transmat, self.means, self.stds, steps)
+      dates = bar_dates(date, steps, self.bars)
+      paths = regime_path(probs, self.transmat, steps)
+      return {
+        "symbol": self.symbol,
+        "steps": steps,
+        "dates": [d.isoformat() for d in dates],
+        "bands": {c: bands[:, i].tolist() for i, c in enumerate(band_columns(fc["extra_quantiles"]))},
+        "state": paths.argmax(axis=1).tolist()
+      }
+    return run
+
+  # Filters pushed bars newer than the last one, returns how many were applied
+  def push(self, bars):
+    if self.filter is None:
+      raise ValueError(f"Pushed bars are filtered on {self.target} alone with a diag covariance model. Refit {self.symbol} that way, or append the bars with process_returns.py --append and rerun the pipeline.")
+    n_new = 0
+    for bar in sorted(bars, key=lambda b: pd.Timestamp(b["date"])):
+      date = pd.Timestamp(bar["date"])
+      if date <= self.date:
+        continue
+      if self.price not in bar:
+        raise ValueError(f"Bar {bar['date']} has no '{self.price}' value.")
+      px = float(bar[self.price])
+      _, log_ret = bar_returns(px, self.last_price)
+      self.date, self.last_price = date, px
+      if not np.isnan(log_ret):
+        *_, self.state = self.filter.update(log_ret)
+        self.probs = self.filter.probs
+      n_new += 1
+    if n_new:
+      self.forecasts.clear()
+      self.pushes += 1
+    return n_new
+
+class RegimeService:
+  def __init__(self, cfg, max_symbols=None):
+    self.cfg = cfg
+    self.max_symbols = max_symbols or cfg["service"]["max_symbols"]
+    self.symbols = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    # Forecast misses run one at a time on a worker thread, each symbol and horizon behind its own lock
+    self.executor = ThreadPoolExecutor(max_workers=1)
+    self.locks = {}
+
+  # Cached state of a symbol, loading it (and evicting the least recently used one) on a miss or when
+  # its files changed on disk
+  def get(self, symbol):
+    if symbol in self.symbols and not self.symbols[symbol].stale():
+      self.hits += 1
+      self.symbols.move_to_end(symbol)
+      return self.symbols[symbol]
+    self.misses += 1
+    try:
+      state = SymbolState(apply_symbol(copy.deepcopy(self.cfg), symbol), symbol)
+    except FileNotFoundError as e:
+      raise FileNotFoundError(f"No fitted model or probability table for '{symbol}'. Run the pipeline for it first.") from e
+    self.symbols[symbol] = state
+    self.symbols.move_to_end(symbol)
+    while len(self.symbols) > self.max_symbols:
+      self.symbols.popitem(last=False)
+    return state
+
+  # Answers one request, returns the HTTP status and the JSON payload. Unknown symbols and endpoints
+  # are 404, bad parameters or payloads 400 and any other failure 500.
+  def handle(self, method, target, body=b""):
+    url = urlsplit(target)
+    parts = [p for p in url.path.split("/") if p]
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    route = (method, parts[0] if parts else "")
+    if route == ("GET", "health"):
+      return 200, {"symbols": list(self.symbols), "max_symbols": self.max_symbols, "hits": self.hits, "misses": self.misses}
+    if len(parts) != 2 or route not in ROUTES:
+      return 404, {"error": f"Unknown endpoint {method} {url.path}."}
+    try:
+      state = self.get(parts[1])
+    except FileNotFoundError as e:
+      return 404, {"error": str(e)}
+    except Exception as e:
+      return _failure(e)
+    try:
+      if route == ("POST", "bars"):
+        payload = json.loads(body or b"{}")
+        bars = payload["bars"] if isinstance(payload, dict) and "bars" in payload else payload
+        return 200, {"applied": state.push(bars if isinstance(bars, list) else [bars]), **state.regime()}
+      steps = None
+      if route != ("GET", "regime"):
+        steps = self.steps(query, 1 if route == ("GET", "distribution") else self.cfg["forecasting"]["n_steps"])
+    except Exception as e:
+      return _error(e)
+    # The query is valid, so whatever fails from here on is a failure of the service
+    try:
+      if route == ("GET", "regime"):
+        return 200, state.regime()
+      if route == ("GET", "distribution"):
+        return 200, state.distribution(steps)
+      return 200, state.forecast(self.cfg["forecasting"], steps)
+    except Exception as e:
+      return _failure(e)
+
+  # Answers one request like handle, computing forecast misses off the event loop so other connections
+  # are answered meanwhile. Concurrent requests for the same forecast wait for the first one.
+  async def handle_async(self, method, target, body=b""):
+    url = urlsplit(target)
+    parts = [p for p in url.path.split("/") if p]
+    if method != "GET" or len(parts) != 2 or parts[0] != "forecast":
+      return self.handle(method, target, body)
+    fc = self.cfg["forecasting"]
+    try:
+      state = self.get(parts[1])
+    except FileNotFoundError as e:
+      return 404, {"error": str(e)}
+    except Exception as e:
+      return _failure(e)
+    try:
+      steps = self.steps({k: v[-1] for k, v in parse_qs(url.query).items()}, fc["n_steps"])
+    except Exception as e:
+      return _error(e)
+    try:
+      async with self.locks.setdefault((parts[1], steps), asyncio.Lock()):
+        if steps in state.forecasts:
+          return 200, state.forecasts[steps]
+        pushes = state.pushes
+        payload = await asyncio.get_running_loop().run_in_executor(self.executor, state.forecast_job(fc, steps))
+        # Bars pushed meanwhile made this forecast stale for later requests
+        if state.pushes == pushes:
+          state.forecasts[steps] = payload
+        return 200, payload
+    except Exception as e:
+      return _failure(e)
+
+  # Horizon of a query, from 1 to service.max_steps bars
+  def steps(self, query, default):
+    steps = int(query.get("steps", default))
+    max_steps = self.cfg["service"]["max_steps"]
+    if not 1 <= steps <= max_steps:
+      raise ValueError(f"steps must be between 1 and service.max_steps ({max_steps}), got {steps}.")
+    return steps
+
+# Modification time and size of files, None for those that do not exist
+def _mtimes(paths):
+  mtimes = []
+  for path in paths:
+    try:
+      st = os.stat(path)
+      mtimes.append((st.st_mtime_ns, st.st_size))
+    except FileNotFoundError:
+      mtimes.append(None)
+  return mtimes
+
+# HTTP status and payload of a request whose parameters or payload could not be used. KeyError,
+# ValueError and TypeError come from what the client sent; anything else is a failure of the service.
+def _error(e):
+  if isinstance(e, KeyError):
+    return 400, {"error": f"Missing field {e}."}
+  if isinstance(e, (ValueError, TypeError)):
+    return 400, {"error": str(e)}
+  return _failure(e)
+
+# 500 response to a failure of the service, whose traceback goes to stderr
+def _failure(e):
+  traceback.print_exception(type(e), e, e.__traceback__)
+  return 500, {"error": f"{type(e).__name__}: {e}"}
+
+# Reads one HTTP/1.1 request per iteration and answers it on the same connection until the client
+# closes it or asks for Connection: close
+async def serve_connection(service, reader, writer):
+  try:
+    while True:
+      request_line = await reader.readline()
+      if not request_line.strip():
+        break
+      method, target, _ = request_line.decode("latin-1").split(" ", 2)
+      headers = {}
+      while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+      body = await reader.readexactly(int(headers.get("content-length", 0)))
+      status, payload = await service.handle_async(method.upper(), target, body)
+      data = json.dumps(payload).encode()
+      close = headers.get("connection", "").lower() == "close"
+      writer.write(
+        f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+        f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + data
+      )
+      await writer.drain()
+      if close:
+        break
+  except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+    pass
+  finally:
+    writer.close()
+
+# Starts the server on a TCP port, or on a Unix socket when a path is given
+async def start_server(service, host="127.0.0.1", port=8765, unix_socket=None):
+  handler = lambda r, w: serve_connection(service, r, w)
+  if unix_socket:
+    return await asyncio.start_unix_server(handler, path=unix_socket)
+  return await asyncio.start_server(handler, host=host, port=port)
+
+async def _run(service, host, port, unix_socket):
+  server = await start_server(service, host, port, unix_socket)
+  where = unix_socket or "http://{}:{}".format(*server.sockets[0].getsockname()[:2])
+  print(f"Serving regimes on {where}")
+  async with server:
+    await server.serve_forever()
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve regime probabilities, regime distributions and forecast bands of fitted symbols.")
+  parser.add_argument("--host", help="Address to listen on (defaults to service.host)")
+  parser.add_argument("--port", type=int, help="Port to listen on (defaults to service.port)")
+  parser.add_argument("--unix", help="Listen on this Unix socket path instead of a TCP port")
+  parser.add_argument("--preload", nargs="*", default=[], help="Symbols to load before serving")
+  args = parser.parse_args()
+  cfg = load_config()
+  service = RegimeService(cfg)
+  start = time.perf_counter()
+  for symbol in args.preload:
+    service.get(symbol)
+  if args.preload:
+    print(f"Loaded {len(args.preload)} symbols in {time.perf_counter() - start:.2f}s.")
+  svc = cfg["service"]
+  try:
+    asyncio.run(_run(service, args.host or svc["host"], args.port or svc["port"], args.unix or svc["unix_socket"]))
+  except KeyboardInterrupt:
+    pass
+
+if __name__ == "__main__":
+  main()
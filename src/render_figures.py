@@ -0,0 +1,36 @@
+import argparse
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.config import apply_symbol, load_config, universe_symbols
+from plot_engine import plot_backtest, plot_forecast, plot_results
+
+# Redraws the figures of many symbols from their saved tables, one symbol per worker process.
+# Figures whose data and drawing code are unchanged are skipped unless --force is given.
+
+# Draws every figure of one symbol, returns how many were drawn and how many were unchanged
+def render_symbol(cfg, symbol, force=False):
+  cfg = apply_symbol(copy.deepcopy(cfg), symbol)
+  if force:
+    cfg["plotting"]["skip_unchanged"] = False
+  drawn = plot_results(cfg) + plot_forecast(cfg) + plot_backtest(cfg)
+  return sum(drawn), len(drawn) - sum(drawn)
+
+def main():
+  parser = argparse.ArgumentParser(description="Redraw the figures of many symbols in a worker pool.")
+  parser.add_argument("symbols", nargs="*", help="Symbols to draw (defaults to the configured universe, or data.symbol)")
+  parser.add_argument("--force", action="store_true", help="Redraw figures even when their data is unchanged")
+  args = parser.parse_args()
+  cfg = load_config()
+  symbols = args.symbols or universe_symbols(cfg) or [cfg["data"]["symbol"]]
+  workers = min(cfg["plotting"]["workers"] or os.cpu_count(), len(symbols))
+  start = time.perf_counter()
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    results = list(pool.map(render_symbol, [cfg] * len(symbols), symbols, [args.force] * len(symbols)))
+  drawn, unchanged = sum(r[0] for r in results), sum(r[1] for r in results)
+  print(f"Drew {drawn} figures ({unchanged} unchanged) for {len(symbols)} symbols in {time.perf_counter() - start:.2f}s.")
+
+if __name__ == "__main__":
+  main()
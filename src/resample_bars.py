@@ -0,0 +1,94 @@
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from process_returns import normalize
+from utils.bars import bar_labels, is_daily
+from utils.config import load_config
+
+# The resample_bars stage: streams a tick or minute CSV into OHLCV bars of bars.frequency and writes
+# them to data.raw_path, where process_returns picks them up. The source is read chunk_rows rows at a
+# time and each chunk is aggregated with one groupby. The last bar of a chunk may continue in the next
+# one, so it is held back and merged with that chunk's first bar; memory is bounded by chunk_rows
+# whatever the size of the source. Ticks need a price and a size column; minute bars (open, high, low,
+# close, volume) are aggregated into longer bars. Rows outside bars.session are dropped.
+
+DATE_COLUMNS = ("date", "datetime", "timestamp", "time")
+# How partial bars of the same label combine
+MERGE = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+def resample_bars(cfg):
+  bars = cfg["bars"]
+  resample = bars["resample"]
+  if not resample["enabled"]:
+    print("bars.resample is disabled, using data.raw_path as it is.")
+    return None
+  source = resample["source"].format(symbol=cfg["data"]["symbol"])
+  start = time.perf_counter()
+  n_rows, n_bars = write_bars(source, cfg["data"]["raw_path"], bars, resample["chunk_rows"], resample["price"], resample["size"])
+  print(f"Resampled {n_rows} rows of {source} into {n_bars} {bars['frequency']} bars in {time.perf_counter() - start:.2f}s.")
+  return None
+
+# Bars of one chunk, indexed by their start. Ticks give the first, highest, lowest and last price and
+# the summed size; minute bars the first open, highest high, lowest low, last close and summed volume.
+def aggregate(chunk, bars, price="price", size="size"):
+  if {"open", "high", "low", "close", "volume"} <= set(chunk.columns):
+    spec = {c: (c, how) for c, how in MERGE.items()}
+  elif {price, size} <= set(chunk.columns):
+    spec = {"open": (price, "first"), "high": (price, "max"), "low": (price, "min"), "close": (price, "last"), "volume": (size, "sum")}
+  else:
+    raise KeyError(f"Expected tick columns '{price}' and '{size}' or minute bar columns {list(MERGE)}, got {list(chunk.columns)}.")
+  labels = bar_labels(chunk.index, bars)
+  out = chunk.groupby(labels).agg(**spec)
+  out.index.name = "date"
+  return out
+
+# Yields the finished bars of a time-ordered source and the number of source rows read so far
+def stream_bars(source, bars, chunk_rows=1_000_000, price="price", size="size"):
+  header = pd.read_csv(source, nrows=0).columns
+  date_col = next((c for c in header if normalize(c) in DATE_COLUMNS), None)
+  if date_col is None:
+    raise KeyError(f"No date column ({', '.join(DATE_COLUMNS)}) found in {source}.")
+  held, last, n_rows = None, None, 0
+  for chunk in pd.read_csv(source, parse_dates=[date_col], chunksize=chunk_rows):
+    chunk = chunk.set_index(date_col)
+    chunk.columns = [normalize(c) for c in chunk.columns]
+    if chunk.empty:
+      continue
+    if not chunk.index.is_monotonic_increasing or (last is not None and chunk.index[0] < last):
+      raise ValueError(f"{source} is not in time order near {chunk.index[0]}. Sort it before resampling.")
+    last = chunk.index[-1]
+    n_rows += len(chunk)
+    out = aggregate(chunk, bars, price, size)
+    if out.empty:
+      continue
+    if held is not None:
+      if held.index[0] == out.index[0]:
+        out = pd.concat([pd.concat([held, out.iloc[:1]]).groupby(level=0).agg(MERGE), out.iloc[1:]])
+      else:
+        out = pd.concat([held, out])
+    held = out.iloc[-1:]
+    yield out.iloc[:-1], n_rows
+  if held is not None:
+    yield held, n_rows
+
+# Writes the bars of a source to out_path (replacing it once complete), returns the number of source
+# rows and of bars
+def write_bars(source, out_path, bars, chunk_rows=1_000_000, price="price", size="size"):
+  out_path = Path(out_path)
+  out_path.parent.mkdir(parents=True, exist_ok=True)
+  tmp = out_path.with_name(out_path.name + ".tmp")
+  date_format = "%Y-%m-%d" if is_daily(bars) else "%Y-%m-%d %H:%M:%S"
+  n_rows = n_bars = 0
+  with open(tmp, "w", newline="") as f:
+    pd.DataFrame(columns=list(MERGE)).rename_axis("date").to_csv(f)
+    for out, n_rows in stream_bars(source, bars, chunk_rows, price, size):
+      out.to_csv(f, header=False, date_format=date_format)
+      n_bars += len(out)
+  os.replace(tmp, out_path)
+  return n_rows, n_bars
+
+if __name__ == "__main__":
+  resample_bars(load_config())
@@ -4,80 +4,136 @@ from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from hmmlearn.hmm import GaussianHMM
 
+from utils.columnar import load_table, save_table
 from utils.config import load_config
-
-cfg = load_config()
-symbol = cfg["data"]["symbol"]
-global model
-
-# Load processed, training, and testing data
-df = pd.read_csv(cfg["data"]["processed_path"], parse_dates=["date"]).set_index("date")
-
-df_train = pd.read_csv(f"data/temp/{symbol}/{symbol}_train_data.csv", parse_dates=["date"]).set_index("date")
-X_train = df_train.values.reshape(-1, 1)
-
-df_test = pd.read_csv(f"data/temp/{symbol}/{symbol}_full_data.csv", parse_dates=["date"]).set_index("date")
-X_test = df_test.values.reshape(-1, 1)
-
-# Running the 2 state Gaussian HMM
-model = GaussianHMM(n_components=2, covariance_type='diag', n_iter=cfg["model"]["n_iter"], random_state=cfg["model"]["seed"])
-model.fit(X_train)
-
-variances = model.covars_.ravel()
-order = np.argsort(variances)
-
-model.means_ = model.means_[order]
-model.covars_ = model.covars_[order].reshape(2,1)
-model.startprob_ = model.startprob_[order]
-model.transmat_ = model.transmat_[np.ix_(order, order)]
-
-# Predicting the hidden states for the test data
-state_prob = model.predict_proba(X_test)
-predicted_states = model.predict(X_test)
-
-
-# Combine probabilities and state info into a single DataFrame
-probs_states_df = pd.DataFrame({
-  "low_vol_prob": state_prob[:,0],
-  "high_vol_prob": state_prob[:,1],
-  "state": predicted_states
-}, index=df_test.index)
-transition_matrix = pd.DataFrame(model.transmat_.copy(), index=["low_vol", "high_vol"], columns=["low_vol", "high_vol"])
-
-# Save CSVs and collect metadata
-csv_info = []
-
-transition_matrix_path = f"reports/{symbol}/tables/{symbol}_transition_matrix.csv"
-probs_states_path = f"reports/{symbol}/tables/{symbol}_probs_states.csv"
-
-# Merge the probabilities with the original DataFrame
-probs_states_df = probs_states_df.join(df, how='inner')
-
-# Saving the transition matrix, probabilities, and predicted states
-for path, df, desc in [
-  (transition_matrix_path, transition_matrix, "Transition matrix of HMM states"),
-  (probs_states_path, probs_states_df, "State probabilities and predicted HMM state for each date (0=low_vol, 1=high_vol)")
-]:
-  p = Path(path)
-  p.parent.mkdir(parents=True, exist_ok=True)
-  df.to_csv(p, index=True)
-  csv_info.append({
-    "filename": str(p),
-    "description": desc,
-    "n_rows": len(df),
-    "n_columns": len(df.columns),
-    "columns": list(df.columns),
-    "created_at": datetime.now().isoformat()
-  })
-
-# Save metadata JSON
-meta_path = f"reports/{symbol}/tables/{symbol}_metadata.json"
-with open(meta_path, "w") as f:
-  json.dump({
-    "csv_files": csv_info,
-    "generated_at": datetime.now().isoformat(),
-    "symbol": symbol
-  }, f, indent=2)
\ No newline at end of file
+from utils.model_store import load_params, model_path, order_states, save_model, set_params
+from utils.regimes import prob_columns, regime_labels
+
+# The run_model stage: fits the HMM (or selects and fits it, or refits it walk-forward), labels every
+# bar with its regime probabilities and saves the model and the tables. processed, train and full are
+# the processed data and the prep_model tables when they are already in memory. Returns the fitted
+# model and the probability table.
+def run_model(cfg, processed=None, train=None, full=None):
+  from hmmlearn.hmm import GaussianHMM
+  from model_selection import select_model
+  from walk_forward import walk_forward
+
+  symbol = cfg["data"]["symbol"]
+
+  # Load processed, training, and testing data
+  storage = cfg["storage"]
+  df = processed if processed is not None else load_table(cfg["data"]["processed_path"], storage)
+
+  df_train = train if train is not None else load_table(f"data/temp/{symbol}/{symbol}_train_data.csv", storage)
+  X_train = df_train.values
+
+  df_test = full if full is not None else load_table(f"data/temp/{symbol}/{symbol}_full_data.csv", storage)
+  X_test = df_test.values
+
+  # Running the Gaussian HMM, or selecting its number of states and covariance type first
+  sel = cfg["model_selection"]
+  if sel["enabled"]:
+    selected, selection_table = select_model(
+      X_train, sel["n_components"], sel["covariance_types"],
+      n_restarts=sel["n_restarts"], n_iter=cfg["model"]["n_iter"], check_every=sel["check_every"],
+      keep_frac=sel["keep_frac"], criterion=sel["criterion"], seed=cfg["model"]["seed"], workers=sel["workers"]
+    )
+    n_components, covariance_type = selected.n_components, selected.covariance_type
+  else:
+    n_components, covariance_type = cfg["model"]["n_components"], cfg["model"]["covariance_type"]
+    regime_labels(n_components)  # Refuses a single state before fitting
+  model_kwargs = dict(n_components=n_components, covariance_type=covariance_type, n_iter=cfg["model"]["n_iter"], random_state=cfg["model"]["seed"])
+  model = selected if sel["enabled"] else GaussianHMM(**model_kwargs)
+
+  # Optionally start EM from the previously saved model instead of a random initialization
+  artifact_path = model_path(symbol)
+  if cfg["model"]["warm_start"] and not sel["enabled"] and artifact_path.exists():
+    prev_params, prev_meta = load_params(artifact_path)
+    if prev_meta["n_components"] == model.n_components and prev_meta["covariance_type"] == model.covariance_type:
+      set_params(model, prev_params)
+      model.init_params = ""
+
+  if not sel["enabled"]:
+    model.fit(X_train)
+  order_states(model)
+  X_fit = X_train
+
+  wf = cfg["walk_forward"]
+  if wf["enabled"]:
+    # Refit on each walk-forward window and label only the following out-of-sample block by forward filtering
+    first_test = df_test.index.searchsorted(df_train.index[-1], side="right")
+    oos_probs, model, (fit_start, fit_end) = walk_forward(
+      X_test, df_test.index, first_test, model_kwargs,
+      freq=wf["freq"], window=wf["window"], rolling_bars=wf["rolling_bars"], workers=wf["workers"]
+    )
+    # The most recent window's model is the one forecasting and online filtering continue from
+    X_fit = X_test[fit_start:fit_end]
+    state_index = oos_probs.index
+    state_prob = oos_probs.values
+    predicted_states = state_prob.argmax(axis=1)
+
+  # Persist the reordered model so downstream stages can load it instead of refitting
+  model_meta = save_model(model, artifact_path, cfg["model"], X_fit)
+
+  if not wf["enabled"]:
+    # Predicting the hidden states for the test data
+    state_index = df_test.index
+    state_prob = model.predict_proba(X_test)
+    predicted_states = model.predict(X_test)
+
+
+  # Combine probabilities and state info into a single DataFrame
+  labels = regime_labels(model.n_components)
+  probs_states_df = pd.DataFrame(state_prob, index=state_index, columns=prob_columns(model.n_components))
+  probs_states_df["state"] = predicted_states
+  transition_matrix = pd.DataFrame(model.transmat_.copy(), index=labels, columns=labels)
+
+  # Save CSVs and collect metadata
+  csv_info = []
+
+  transition_matrix_path = f"reports/{symbol}/tables/{symbol}_transition_matrix.csv"
+  probs_states_path = f"reports/{symbol}/tables/{symbol}_probs_states.csv"
+
+  # Merge the probabilities with the original DataFrame
+  probs_states_df = probs_states_df.join(df, how='inner')
+
+  # Saving the transition matrix, probabilities, and predicted states
+  state_desc = ", ".join(f"{i}={label}" for i, label in enumerate(labels))
+  outputs = [
+    (transition_matrix_path, transition_matrix, "Transition matrix of HMM states"),
+    (probs_states_path, probs_states_df, f"State probabilities and predicted HMM state for each date ({state_desc})")
+  ]
+  if sel["enabled"]:
+    outputs.append((f"reports/{symbol}/tables/{symbol}_model_selection.csv", selection_table.set_index("n_components"), f"Best restart of every model in the selection grid, ranked by {sel['criterion'].upper()}"))
+  for path, df, desc in outputs:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    if path == probs_states_path:
+      # Read by every later stage, so it is stored in the configured table format
+      save_table(df, p, storage)
+    else:
+      df.to_csv(p, index=True)
+    csv_info.append({
+      "filename": str(p),
+      "description": desc,
+      "n_rows": len(df),
+      "n_columns": len(df.columns),
+      "columns": list(df.columns),
+      "created_at": datetime.now().isoformat()
+    })
+
+  # Save metadata JSON
+  meta_path = f"reports/{symbol}/tables/{symbol}_metadata.json"
+  with open(meta_path, "w") as f:
+    json.dump({
+      "csv_files": csv_info,
+      "model": {"filename": str(artifact_path), **model_meta},
+      "generated_at": datetime.now().isoformat(),
+      "symbol": symbol
+    }, f, indent=2)
+
+  return model, probs_states_df
+
+if __name__ == "__main__":
+  run_model(load_config())
@@ -0,0 +1,162 @@
+import argparse
+import copy
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from batch_inference import full_covars
+from forecast_engine import BAND_QUANTILES, band_columns, stress_bands
+from utils.bars import bar_dates
+from utils.columnar import load_table, tail_table
+from utils.config import apply_symbol, load_config, universe_symbols
+from utils.model_store import load_params, model_path, order_states, set_params
+from utils.regimes import prob_columns, regime_labels
+
+# Stress forecasts that account for the estimation error of the fitted HMM. Instead of one parameter
+# set, n_draws sets are drawn and every draw's paths are simulated in one batch
+# (forecast_engine.stress_bands). Draws come from either:
+#
+#   perturb:   an approximate posterior around the fit. Each transition row is Dirichlet with the
+#              expected transition counts, each regime mean is normal with the standard error of its
+#              expected bar count and each variance is scaled inverse chi-squared. Rarely visited
+#              regimes get wide draws. Costs next to nothing.
+#   bootstrap: EM refits, warm-started from the fitted model, on block-bootstrapped training data.
+#              Blocks are passed to hmmlearn as separate sequences so their seams are not transitions.
+#              The refits run in a process pool.
+#
+# Every draw starts from the same filtered regime probabilities at the last bar. Outputs per symbol:
+#   *_stress_forecast.csv   the bands of all draws' paths pooled, plus the spread of the per-draw tails
+#   *_stress_scenarios.csv  one row per draw, worst first by expected terminal shortfall
+
+# Draws transition matrices, means and volatilities of the return around the fitted ones. occupancy
+# holds the expected number of bars spent in each regime.
+def perturb_draws(rng, n_draws, transmat, means, stds, occupancy):
+  n = np.maximum(np.asarray(occupancy, dtype=float), 2.0)
+  counts = transmat * n[:, None]
+  transmats = np.stack([
+    np.stack([rng.dirichlet(np.maximum(row, 1e-3)) for row in counts])
+    for _ in range(n_draws)
+  ])
+  variances = stds ** 2 * (n - 1) / rng.chisquare(n - 1, size=(n_draws, len(n)))
+  draw_means = rng.normal(means, stds / np.sqrt(n), size=(n_draws, len(n)))
+  return _order(transmats, draw_means, np.sqrt(variances))
+
+# Reorders the states of every draw from lowest to highest volatility, as model_store.order_states
+def _order(transmats, means, stds):
+  order = np.argsort(stds, axis=1, kind="stable")
+  rows = np.arange(len(order))[:, None]
+  return transmats[rows[:, :, None], order[:, :, None], order[:, None, :]], means[rows, order], stds[rows, order]
+
+# Start positions of a circular block bootstrap of n bars, and the length of every block
+def bootstrap_blocks(rng, n, block_size):
+  n_blocks = int(np.ceil(n / block_size))
+  lengths = np.full(n_blocks, block_size)
+  lengths[-1] = n - block_size * (n_blocks - 1)
+  return rng.integers(0, n, n_blocks), lengths
+
+# Refits one bootstrap sample, returns the ordered transition matrix, means and volatilities of the
+# return, or None when EM fails on the sample
+def _refit_draw(args):
+  X, starts, lengths, model_kwargs, params = args
+  from hmmlearn.hmm import GaussianHMM
+
+  idx = np.concatenate([np.arange(s, s + n) % len(X) for s, n in zip(starts, lengths)])
+  model = GaussianHMM(**model_kwargs)
+  set_params(model, params)
+  model.init_params = ""
+  try:
+    model.fit(X[idx], lengths)
+  except ValueError:
+    return None
+  order_states(model)
+  if not np.isfinite(model.transmat_).all():
+    return None
+  K, F = model.means_.shape
+  variances = full_covars(model._covars_, model.covariance_type, K, F)[:, 0, 0]
+  return model.transmat_, model.means_[:, 0], np.sqrt(variances)
+
+def bootstrap_draws(rng, n_draws, X, params, meta, block_size, n_iter, workers=None):
+  model_kwargs = dict(n_components=meta["n_components"], covariance_type=meta["covariance_type"], n_iter=n_iter, random_state=0)
+  tasks = [(X, *bootstrap_blocks(rng, len(X), block_size), model_kwargs, params) for _ in range(n_draws)]
+  workers = min(workers or os.cpu_count(), n_draws)
+  if workers > 1:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      results = list(pool.map(_refit_draw, tasks))
+  else:
+    results = [_refit_draw(task) for task in tasks]
+  results = [r for r in results if r is not None]
+  if not results:
+    raise ValueError("Every bootstrap refit failed, try a larger stress.block_size or more training data.")
+  return tuple(np.stack(a) for a in zip(*results))
+
+# Draws parameter sets for one symbol with the configured method
+def draw_parameters(cfg, symbol, params, meta, rng):
+  stress = cfg["stress"]
+  K, F = params["means"].shape
+  if stress["method"] == "perturb":
+    probs = load_table(f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"], columns=prob_columns(K))
+    stds = np.sqrt(full_covars(params["covars"], meta["covariance_type"], K, F)[:, 0, 0])
+    return perturb_draws(rng, stress["n_draws"], params["transmat"], params["means"][:, 0], stds, probs.sum().values)
+  if stress["method"] == "bootstrap":
+    X = load_table(f"data/temp/{symbol}/{symbol}_train_data.csv", cfg["storage"]).values
+    return bootstrap_draws(rng, stress["n_draws"], X, params, meta, stress["block_size"], stress["n_iter"], stress["workers"])
+  raise ValueError(f"Unknown stress method '{stress['method']}', expected 'perturb' or 'bootstrap'.")
+
+# Runs the stress forecast of one symbol and writes its two tables
+def stress_symbol(cfg, symbol):
+  stress, fc = cfg["stress"], cfg["forecasting"]
+  n_steps = stress["n_steps"] or fc["n_steps"]
+  params, meta = load_params(model_path(symbol))
+  labels = regime_labels(meta["n_components"])
+  last = tail_table(f"reports/{symbol}/tables/{symbol}_probs_states.csv", cfg["storage"])
+  last_price = float(last[cfg["data"]["price_col"]].iloc[-1])
+  p0 = last[prob_columns(len(labels))].iloc[-1].values.astype(float)
+
+  seeds = np.random.SeedSequence(stress["seed"]).spawn(2)
+  transmats, means, stds = draw_parameters(cfg, symbol, params, meta, np.random.default_rng(seeds[0]))
+  quantiles = list(BAND_QUANTILES) + list(fc["extra_quantiles"])
+  bands, draw_bands, shortfall = stress_bands(
+    last_price, p0, transmats, means, stds, n_steps, stress["paths_per_draw"],
+    seed=seeds[1], max_chunk_mb=stress["max_chunk_mb"], quantiles=quantiles, tail=stress["tail_quantile"]
+  )
+
+  # Pooled bands, plus the 5th percentile over draws of each draw's p05 and the 95th of each draw's p95
+  dates = bar_dates(last.index[-1], n_steps, cfg.get("bars"))
+  cols = band_columns(fc["extra_quantiles"])
+  forecast_df = pd.DataFrame(bands, index=dates, columns=cols)
+  forecast_df["p05_draw_p05"] = np.quantile(draw_bands[:, :, cols.index("p05")], 0.05, axis=0)
+  forecast_df["p95_draw_p95"] = np.quantile(draw_bands[:, :, cols.index("p95")], 0.95, axis=0)
+  forecast_df.index.name = "date"
+
+  scenarios = pd.DataFrame(draw_bands[:, -1, :], columns=[f"terminal_{c}" for c in cols])
+  scenarios.insert(0, "terminal_shortfall", shortfall)
+  for i, label in enumerate(labels):
+    scenarios[f"{label}_mean"] = means[:, i]
+    scenarios[f"{label}_vol"] = stds[:, i]
+    scenarios[f"{label}_stay"] = transmats[:, i, i]
+  scenarios.index.name = "draw"
+  scenarios = scenarios.sort_values("terminal_shortfall", kind="stable")
+
+  out = Path(f"reports/{symbol}/tables")
+  out.mkdir(parents=True, exist_ok=True)
+  forecast_df.reset_index().to_csv(out / f"{symbol}_stress_forecast.csv", index=False)
+  scenarios.reset_index().to_csv(out / f"{symbol}_stress_scenarios.csv", index=False)
+  return len(transmats)
+
+def main():
+  parser = argparse.ArgumentParser(description="Forecast price bands over many draws of the HMM parameters.")
+  parser.add_argument("symbols", nargs="*", help="Symbols to stress (defaults to the configured universe, or data.symbol)")
+  args = parser.parse_args()
+  cfg = load_config()
+  symbols = args.symbols or universe_symbols(cfg) or [cfg["data"]["symbol"]]
+  for symbol in symbols:
+    start = time.perf_counter()
+    n_draws = stress_symbol(apply_symbol(copy.deepcopy(cfg), symbol), symbol)
+    print(f"{symbol}: {n_draws} {cfg['stress']['method']} draws in {time.perf_counter() - start:.2f}s.")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,60 @@
+import argparse
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# Compares two run traces written by main.py, stage by stage.
+#   python src/trace_diff.py reports/traces/20250101-090000.json reports/traces/latest.json
+# Ratios are new / old; stages whose wall time or peak RSS grew by more than --threshold are flagged.
+
+METRICS = ["wall_s", "cpu_s", "max_rss_mb", "input_rows", "output_rows", "output_bytes", "n_iter", "log_likelihood"]
+
+# One row per (symbol, stage) of a trace, with the model's fit statistics flattened in
+def trace_frame(run):
+  rows = []
+  for entry in run["stages"]:
+    model = entry.get("model") or {}
+    rows.append({
+      "symbol": entry["symbol"], "stage": entry["stage"], "status": entry["status"],
+      "wall_s": entry["wall_s"], "cpu_s": entry["cpu_user_s"] + entry["cpu_sys_s"], "max_rss_mb": entry["max_rss_mb"],
+      "input_rows": entry["input_rows"], "output_rows": entry["output_rows"], "output_bytes": entry["output_bytes"],
+      "n_iter": model.get("n_iter"), "log_likelihood": model.get("log_likelihood"),
+    })
+  return pd.DataFrame(rows, columns=["symbol", "stage", "status"] + METRICS).set_index(["symbol", "stage"])
+
+# Side-by-side old/new values of every metric, the wall-time and memory ratios and a regression flag
+def diff_traces(old, new, threshold=0.2):
+  a, b = trace_frame(old), trace_frame(new)
+  joined = a.join(b, how="outer", lsuffix="_old", rsuffix="_new")
+  for metric in ("wall_s", "max_rss_mb"):
+    joined[f"{metric}_ratio"] = joined[f"{metric}_new"] / joined[f"{metric}_old"].where(joined[f"{metric}_old"] > 0)
+  # Cache hits take no time, so only compare stages that actually ran in both traces
+  ran = (joined["status_old"] == "ok") & (joined["status_new"] == "ok")
+  joined["regressed"] = ran & ((joined["wall_s_ratio"] > 1 + threshold) | (joined["max_rss_mb_ratio"] > 1 + threshold))
+  order = ["status_old", "status_new"] + [f"{m}_{side}" for m in METRICS for side in ("old", "new")] + ["wall_s_ratio", "max_rss_mb_ratio", "regressed"]
+  return joined[order]
+
+def main():
+  parser = argparse.ArgumentParser(description="Diff two pipeline run traces.")
+  parser.add_argument("old", help="Trace JSON of the baseline run")
+  parser.add_argument("new", help="Trace JSON of the run to compare")
+  parser.add_argument("--threshold", type=float, default=0.2, help="Relative growth of wall time or peak RSS flagged as a regression")
+  args = parser.parse_args()
+  old, new = (json.loads(Path(p).read_text()) for p in (args.old, args.new))
+  diff = diff_traces(old, new, args.threshold)
+
+  print(f"{old['run_id']} -> {new['run_id']}: total {old['wall_s']:.2f}s -> {new['wall_s']:.2f}s")
+  cols = ["status_new", "wall_s_old", "wall_s_new", "wall_s_ratio", "max_rss_mb_old", "max_rss_mb_new", "output_rows_old", "output_rows_new", "regressed"]
+  with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.3f}".format):
+    print(diff[cols].to_string())
+  fits = diff.dropna(subset=["log_likelihood_old", "log_likelihood_new"], how="all")
+  if not fits.empty:
+    print("\nModel fits:")
+    print(fits[["n_iter_old", "n_iter_new", "log_likelihood_old", "log_likelihood_new"]].to_string())
+  regressed = diff.index[diff["regressed"]]
+  if len(regressed):
+    print(f"\n{len(regressed)} stage(s) regressed by more than {args.threshold:.0%}: " + ", ".join(f"{s}/{st}" for s, st in regressed))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,86 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# Bar frequencies (1m, 5m, 1h, 1d, ...) and what follows from them: which bar a timestamp belongs to,
+# how many bars make a year and when the bars after a given one fall. Daily bars fall on business
+# days. Intraday bars start at bars.session's open on business days and are labelled by their start,
+# or run around the clock every day when no session is set.
+
+UNITS = {"s": "s", "m": "min", "h": "h", "d": "D"}
+DAILY = {"frequency": "1d", "session": None, "trading_days": 252}
+
+def bar_length(frequency):
+  match = re.fullmatch(r"(\d+)\s*([smhd])", str(frequency).strip().lower())
+  if not match or int(match.group(1)) == 0:
+    raise ValueError(f"Unknown bar frequency '{frequency}', expected e.g. 1m, 5m, 1h or 1d.")
+  length = pd.Timedelta(int(match.group(1)), UNITS[match.group(2)])
+  if length > pd.Timedelta(days=1):
+    raise ValueError(f"Bars longer than a day are not supported, got '{frequency}'.")
+  return length
+
+def is_daily(bars):
+  return bar_length((bars or DAILY)["frequency"]) == pd.Timedelta(days=1)
+
+# Open and close of the trading session as offsets from midnight, or None around the clock
+def session_bounds(bars):
+  session = (bars or DAILY).get("session")
+  if not session:
+    return None
+  open_, _, close = str(session).partition("-")
+  bounds = pd.Timedelta(f"{open_.strip()}:00"), pd.Timedelta(f"{close.strip()}:00")
+  if not bounds[0] < bounds[1]:
+    raise ValueError(f"bars.session must be 'HH:MM-HH:MM' with the open before the close, got '{session}'.")
+  return bounds
+
+# Intraday bars in one session (or one day without a session)
+def bars_per_day(bars):
+  bounds = session_bounds(bars)
+  span = bounds[1] - bounds[0] if bounds else pd.Timedelta(days=1)
+  return math.ceil(span / bar_length(bars["frequency"]))
+
+# Bars per year used to annualize returns and volatility
+def periods_per_year(bars):
+  bars = bars or DAILY
+  if is_daily(bars):
+    return bars["trading_days"]
+  if session_bounds(bars) is None:
+    return 365 * bars_per_day(bars)
+  return bars["trading_days"] * bars_per_day(bars)
+
+# metrics.periods_per_year when set, otherwise derived from the bar frequency
+def annual_periods(cfg):
+  return cfg["metrics"].get("periods_per_year") or periods_per_year(cfg.get("bars"))
+
+# Start of the bar each timestamp falls in; timestamps outside the session map to NaT
+def bar_labels(timestamps, bars):
+  timestamps = pd.DatetimeIndex(timestamps)
+  days = timestamps.normalize()
+  if is_daily(bars):
+    return days
+  length = bar_length(bars["frequency"])
+  bounds = session_bounds(bars)
+  if bounds is None:
+    return timestamps.floor(length)
+  offset = timestamps - days - bounds[0]
+  labels = days + bounds[0] + (offset // length) * length
+  inside = (offset >= pd.Timedelta(0)) & (offset < bounds[1] - bounds[0])
+  return labels.where(inside)
+
+# The last bar's date followed by the dates of the next n_steps bars
+def bar_dates(last, n_steps, bars=None):
+  last = pd.Timestamp(last)
+  if is_daily(bars):
+    return pd.date_range(start=last, periods=n_steps + 1, freq="B")
+  length = bar_length(bars["frequency"])
+  bounds = session_bounds(bars)
+  if bounds is None:
+    return pd.date_range(start=last, periods=n_steps + 1, freq=length)
+  per_day = bars_per_day(bars)
+  days = pd.bdate_range(last.normalize(), periods=n_steps // per_day + 2)
+  offsets = pd.timedelta_range(bounds[0], periods=per_day, freq=length)
+  stamps = days.repeat(per_day) + np.tile(offsets, len(days))
+  stamps = stamps[stamps > last][:n_steps]
+  return pd.DatetimeIndex([last]).append(stamps)
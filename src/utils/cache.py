@@ -0,0 +1,97 @@
+import hashlib
+import json
+import shutil
+import time
+from pathlib import Path
+
+# Content-addressed cache of pipeline stage outputs. Each entry lives in <cache_dir>/<key>/ and
+# holds a copy of the stage outputs next to a manifest.json; the manifest's mtime is the entry's
+# last use and drives LRU eviction. Outputs may be directories (columnar tables), copied whole.
+
+# Feeds a file's bytes into a running hash, or a marker when the file does not exist. A directory is
+# hashed as the names and bytes of the files in it.
+def _update_with_file(h, path):
+  p = Path(path)
+  h.update(str(path).encode())
+  if not p.exists():
+    h.update(b"<missing>")
+    return
+  if p.is_dir():
+    for f in sorted(f for f in p.rglob("*") if f.is_file()):
+      _update_with_file(h, f)
+    return
+  with open(p, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+      h.update(chunk)
+
+def _copy(src, dst):
+  if Path(src).is_dir():
+    shutil.rmtree(dst, ignore_errors=True)
+    shutil.copytree(src, dst)
+  else:
+    shutil.copy2(src, dst)
+
+# Hashes everything a stage depends on: its source code, its input files and its config values
+def stage_key(name, sources, inputs, config_values):
+  h = hashlib.sha256(name.encode())
+  for path in sources:
+    _update_with_file(h, path)
+  for path in inputs:
+    _update_with_file(h, path)
+  # Round-trip through JSON first so mixed int/str keys (e.g. strategy positions) become sortable strings
+  normalized = json.loads(json.dumps(config_values, default=str))
+  h.update(json.dumps(normalized, sort_keys=True).encode())
+  return h.hexdigest()
+
+# Copies a cached entry's outputs back into place, returns False on a cache miss
+def restore(cache_dir, key, outputs):
+  entry = Path(cache_dir) / key
+  manifest = entry / "manifest.json"
+  if not manifest.exists():
+    return False
+  stored = json.loads(manifest.read_text())["outputs"]
+  if sorted(stored) != sorted(str(p) for p in outputs):
+    return False
+  for i, path in enumerate(stored):
+    dst = Path(path)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    _copy(entry / str(i), dst)
+  manifest.touch()
+  return True
+
+# Stores a stage's outputs under its key
+def store(cache_dir, key, outputs):
+  entry = Path(cache_dir) / key
+  tmp = entry.with_name(key + ".tmp")
+  shutil.rmtree(tmp, ignore_errors=True)
+  tmp.mkdir(parents=True)
+  for i, path in enumerate(outputs):
+    _copy(path, tmp / str(i))
+  (tmp / "manifest.json").write_text(json.dumps({
+    "outputs": [str(p) for p in outputs],
+    "created_at": time.time()
+  }, indent=2))
+  shutil.rmtree(entry, ignore_errors=True)
+  tmp.rename(entry)
+
+# Deletes the least recently used entries until the cache fits in max_bytes
+def evict(cache_dir, max_bytes):
+  root = Path(cache_dir)
+  if max_bytes is None or not root.exists():
+    return []
+  entries = []
+  for entry in root.iterdir():
+    manifest = entry / "manifest.json"
+    if not manifest.exists():
+      continue
+    size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+    entries.append((manifest.stat().st_mtime, size, entry))
+  total = sum(size for _, size, _ in entries)
+  evicted = []
+  for _, size, entry in sorted(entries):
+    if total <= max_bytes:
+      break
+    shutil.rmtree(entry, ignore_errors=True)
+    total -= size
+    evicted.append(entry.name)
+  return evicted
@@ -0,0 +1,223 @@
+import io
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils.trace import count_csv_rows
+
+# Columnar storage for the tables stages hand to each other (processed data, model inputs,
+# probabilities and states). A table lives in a directory next to its CSV name, e.g.
+# reports/QQQ/tables/QQQ_probs_states.cols/, holding one raw binary file per column and a
+# manifest.json with the row count and each column's dtypes. Columns are read with np.memmap, so a
+# stage only touches the columns it asks for and nothing is parsed from text.
+#
+# Storage dtypes are as small as round-trips exactly: integers take the narrowest int type that
+# holds their range, and floats with a fixed number of decimals (prices, say) are stored as float32
+# and rounded back to those decimals on load. Every column loads back with its original dtype and
+# values. Appending rows only writes the new bytes and the manifest.
+#
+# The "storage" config section picks the format; CSV copies stay available for reading by hand.
+
+FORMAT_VERSION = 1
+MAX_DECIMALS = 6
+
+def table_dir(csv_path):
+  return Path(csv_path).with_suffix(".cols")
+
+# Narrowest storage of a column and the spec needed to restore it
+def _encode(values):
+  values = np.asarray(values)
+  spec = {"dtype": values.dtype.str}
+  if values.dtype.kind == "M":
+    return values.view(np.int64), {**spec, "stored": "<i8"}
+  if values.dtype.kind in "iu" and values.size:
+    for dt in (np.int8, np.int16, np.int32, np.int64):
+      info = np.iinfo(dt)
+      if info.min <= values.min() and values.max() <= info.max:
+        return values.astype(dt), {**spec, "stored": np.dtype(dt).str}
+  if values.dtype.kind == "f" and values.size:
+    finite = values[np.isfinite(values)]
+    for d in range(MAX_DECIMALS + 1):
+      if np.array_equal(np.round(finite, d), finite):
+        small = values.astype(np.float32)
+        restored = np.round(small.astype(values.dtype), d)
+        if np.array_equal(restored, values, equal_nan=True):
+          return small, {**spec, "stored": "<f4", "decimals": d}
+        break
+  if values.dtype.kind not in "biufM":
+    raise ValueError(f"Columnar tables hold numbers and dates only, got dtype {values.dtype}.")
+  return values, {**spec, "stored": values.dtype.str}
+
+def _decode(raw, spec):
+  if np.dtype(spec["dtype"]).kind == "M":
+    return raw.view(spec["dtype"])
+  if "decimals" in spec:
+    return np.round(raw.astype(spec["dtype"]), spec["decimals"])
+  return raw.astype(spec["dtype"], copy=False)
+
+def _write_manifest(path, manifest):
+  tmp = path / "manifest.json.tmp"
+  tmp.write_text(json.dumps(manifest, indent=2))
+  os.replace(tmp, path / "manifest.json")
+
+def read_manifest(csv_path):
+  return json.loads((table_dir(csv_path) / "manifest.json").read_text())
+
+# Writes a DataFrame, index included, as a columnar table replacing any previous one
+def write_table(df, csv_path):
+  path = table_dir(csv_path)
+  tmp = path.with_name(path.name + ".tmp")
+  shutil.rmtree(tmp, ignore_errors=True)
+  tmp.mkdir(parents=True)
+  frame = df.reset_index()
+  manifest = {"version": FORMAT_VERSION, "n_rows": len(frame), "index": df.index.name or "index", "columns": []}
+  for i, name in enumerate(frame.columns):
+    stored, spec = _encode(frame[name].values)
+    file = f"{i}.bin"
+    np.ascontiguousarray(stored).tofile(tmp / file)
+    manifest["columns"].append({"name": str(name), "file": file, **spec})
+  _write_manifest(tmp, manifest)
+  shutil.rmtree(path, ignore_errors=True)
+  tmp.rename(path)
+
+# Memory-mapped raw columns of a table, decoded to their original dtypes. rows is a slice, so the
+# last few rows of a long table can be read without touching the rest.
+def read_columns(csv_path, columns=None, rows=slice(None)):
+  path = table_dir(csv_path)
+  manifest = read_manifest(csv_path)
+  specs = {c["name"]: c for c in manifest["columns"]}
+  names = [manifest["index"]] + [c for c in (columns if columns is not None else specs) if c != manifest["index"]]
+  missing = [c for c in names if c not in specs]
+  if missing:
+    raise KeyError(f"Columns {missing} not found in {path}.")
+  out = {}
+  for name in names:
+    spec = specs[name]
+    if manifest["n_rows"] == 0:
+      raw = np.empty(0, dtype=spec["stored"])
+    else:
+      raw = np.memmap(path / spec["file"], dtype=spec["stored"], mode="r", shape=(manifest["n_rows"],))
+    out[name] = _decode(raw[rows], spec)
+  return out
+
+# Loads a columnar table as a DataFrame indexed like the one that was written
+def read_table(csv_path, columns=None, rows=slice(None)):
+  data = read_columns(csv_path, columns, rows)
+  index_name = next(iter(data))
+  index = pd.Index(data.pop(index_name), name=index_name)
+  return pd.DataFrame(data, index=index)
+
+# Appends rows to a columnar table. New values are cast to each column's dtype; if they do not fit
+# it losslessly (an int column meeting NaN, a price with more decimals), the table is rewritten. The
+# manifest is updated last, so it only counts rows that were written in full.
+def append_table(df, csv_path):
+  path = table_dir(csv_path)
+  manifest = read_manifest(csv_path)
+  frame = df.reset_index()
+  specs = manifest["columns"]
+  if [c["name"] for c in specs] != [str(c) for c in frame.columns]:
+    raise ValueError(f"Appended columns {list(frame.columns)} do not match the table {path}.")
+
+  encoded = []
+  for spec, name in zip(specs, frame.columns):
+    values = frame[name].values
+    try:
+      cast = values.astype(spec["dtype"])
+    except (ValueError, TypeError):
+      cast = None
+    if cast is None or not np.array_equal(cast.astype(values.dtype), values, equal_nan=values.dtype.kind == "f"):
+      return write_table(pd.concat([read_table(csv_path), df]), csv_path)
+    stored = _encode_with(cast, spec)
+    if stored is None:
+      return write_table(pd.concat([read_table(csv_path), df]), csv_path)
+    encoded.append((spec, stored))
+
+  # Rows past the manifest's count are left over from an append that died before updating it
+  for spec, stored in encoded:
+    with open(path / spec["file"], "r+b") as f:
+      f.seek(manifest["n_rows"] * np.dtype(spec["stored"]).itemsize)
+      f.truncate()
+      np.ascontiguousarray(stored).tofile(f)
+  manifest["n_rows"] += len(frame)
+  _write_manifest(path, manifest)
+
+# Stores values with an existing column spec, or None when they would not round-trip
+def _encode_with(values, spec):
+  if np.dtype(spec["dtype"]).kind == "M":
+    return values.view(np.int64)
+  stored = values.astype(spec["stored"])
+  if not np.array_equal(_decode(stored, spec), values, equal_nan=values.dtype.kind == "f"):
+    return None
+  return stored
+
+# Writes a table in the configured format(s). Without a storage config it is a plain CSV.
+def save_table(df, csv_path, storage=None):
+  Path(csv_path).parent.mkdir(parents=True, exist_ok=True)
+  if storage and storage["format"] == "columnar":
+    write_table(df, csv_path)
+  if not storage or storage["format"] == "csv" or storage["export_csv"]:
+    df.to_csv(csv_path, index=True)
+
+# Loads a table written by save_table, from the columnar copy when there is one
+def load_table(csv_path, storage=None, columns=None):
+  if storage and storage["format"] == "columnar" and table_dir(csv_path).exists():
+    return read_table(csv_path, columns)
+  usecols = None if columns is None else ["date", *columns]
+  return pd.read_csv(csv_path, parse_dates=["date"], usecols=usecols).set_index("date")
+
+# Yields the lines of a binary file from the last to the first, reading it backwards in blocks
+def reversed_lines(f, block=1 << 16):
+  pos = f.seek(0, 2)
+  rest = b""
+  while pos > 0:
+    step = min(block, pos)
+    pos -= step
+    f.seek(pos)
+    lines = (f.read(step) + rest).split(b"\n")
+    rest = lines[0]
+    for line in reversed(lines[1:]):
+      if line.strip():
+        yield line.rstrip(b"\r")
+  if rest.strip():
+    yield rest.rstrip(b"\r")
+
+# The last n rows of a table, read without loading the rest of it
+def tail_table(csv_path, storage=None, n=1):
+  if storage and storage["format"] == "columnar" and table_dir(csv_path).exists():
+    n_rows = read_manifest(csv_path)["n_rows"]
+    return read_table(csv_path, rows=slice(max(n_rows - n, 0), n_rows))
+  with open(csv_path, "rb") as f:
+    header = f.readline()
+    lines = []
+    for line in reversed_lines(f):
+      if len(lines) == n or line == header.rstrip(b"\r\n"):
+        break
+      lines.append(line)
+  text = header + b"\n".join(lines[::-1]) + b"\n"
+  return pd.read_csv(io.BytesIO(text), parse_dates=["date"]).set_index("date")
+
+# Number of rows of a table, from the manifest or by counting the CSV's lines
+def table_rows(csv_path, storage=None):
+  if storage and storage["format"] == "columnar" and table_dir(csv_path).exists():
+    return read_manifest(csv_path)["n_rows"]
+  return count_csv_rows(csv_path)
+
+# Appends rows to every stored copy of a table
+def append_rows(df, csv_path, storage=None):
+  if storage and storage["format"] == "columnar" and table_dir(csv_path).exists():
+    append_table(df, csv_path)
+  if Path(csv_path).exists() and (not storage or storage["format"] == "csv" or storage["export_csv"]):
+    df.to_csv(csv_path, mode="a", header=False, index=True)
+
+# Every file or directory save_table writes for a table, as listed in a stage's inputs and outputs
+def table_files(csv_path, storage=None):
+  files = []
+  if storage and storage["format"] == "columnar":
+    files.append(str(table_dir(csv_path)))
+  if not storage or storage["format"] == "csv" or storage["export_csv"]:
+    files.append(str(csv_path))
+  return files
@@ -1,6 +1,28 @@
+import os
 import yaml
 from pathlib import Path
 
 def load_config(path="config/base.yaml"):
   with open(path, "r") as f:
-    return yaml.safe_load(f)
\ No newline at end of file
+    cfg = yaml.safe_load(f)
+  # Universe runs select the symbol for each worker through the environment
+  symbol = os.environ.get("HMM_SYMBOL")
+  if symbol:
+    apply_symbol(cfg, symbol)
+  return cfg
+
+# Points the data section of the config at another symbol using the universe path templates
+def apply_symbol(cfg, symbol):
+  universe = cfg.get("universe") or {}
+  cfg["data"]["symbol"] = symbol
+  cfg["data"]["raw_path"] = universe.get("raw_path", "data/raw/{symbol}.csv").format(symbol=symbol)
+  cfg["data"]["processed_path"] = universe.get("processed_path", "data/processed/{symbol}_processed.csv").format(symbol=symbol)
+  return cfg
+
+# Lists the symbols of a universe run, either given explicitly or globbed from raw CSV files
+def universe_symbols(cfg):
+  universe = cfg.get("universe") or {}
+  symbols = list(universe.get("symbols") or [])
+  if universe.get("glob"):
+    symbols += [p.stem for p in sorted(Path().glob(universe["glob"]))]
+  return list(dict.fromkeys(symbols))
@@ -0,0 +1,99 @@
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+# Fitted HMMs are persisted as a single .npz holding the state-reordered parameters and a JSON
+# metadata record. Bump ARTIFACT_VERSION whenever the layout changes so stale artifacts are refused.
+ARTIFACT_VERSION = 1
+
+def model_path(symbol):
+  return Path(f"models/{symbol}/{symbol}_hmm.npz")
+
+# Hash of a config section, used to tell which settings an artifact was fitted with
+def config_hash(section):
+  return hashlib.sha256(json.dumps(section, sort_keys=True, default=str).encode()).hexdigest()
+
+# Hash of the training matrix, used to tell which data an artifact was fitted on
+def data_fingerprint(X):
+  X = np.ascontiguousarray(X, dtype=float)
+  return hashlib.sha256(str(X.shape).encode() + X.tobytes()).hexdigest()
+
+# Saves the parameters of a fitted GaussianHMM together with its provenance
+def save_model(model, path, model_cfg, X_train):
+  import hmmlearn
+
+  meta = {
+    "artifact_version": ARTIFACT_VERSION,
+    "n_components": int(model.n_components),
+    "covariance_type": model.covariance_type,
+    "config_hash": config_hash(model_cfg),
+    "data_fingerprint": data_fingerprint(X_train),
+    "n_train": int(len(X_train)),
+    "hmmlearn_version": hmmlearn.__version__,
+    "n_iter": int(model.monitor_.iter),
+    "converged": bool(model.monitor_.converged),
+    "log_likelihood": float(model.monitor_.history[-1]) if model.monitor_.history else None,
+    "created_at": datetime.now().isoformat()
+  }
+  p = Path(path)
+  p.parent.mkdir(parents=True, exist_ok=True)
+  with open(p, "wb") as f:
+    np.savez(
+      f,
+      startprob=model.startprob_,
+      transmat=model.transmat_,
+      means=model.means_,
+      covars=model._covars_,
+      meta=np.array(json.dumps(meta))
+    )
+  return meta
+
+# Loads the raw parameter arrays and metadata of an artifact without importing hmmlearn
+def load_params(path):
+  with np.load(path) as f:
+    params = {k: f[k] for k in ("startprob", "transmat", "means", "covars")}
+    meta = json.loads(str(f["meta"]))
+  if meta["artifact_version"] != ARTIFACT_VERSION:
+    raise ValueError(f"Model artifact {path} has version {meta['artifact_version']}, expected {ARTIFACT_VERSION}. Refit the model.")
+  return params, meta
+
+# Copies saved parameters onto a GaussianHMM with the same shape
+def set_params(model, params):
+  model.startprob_ = params["startprob"]
+  model.transmat_ = params["transmat"]
+  model.means_ = params["means"]
+  model.covars_ = params["covars"]
+  return model
+
+# Variance of the first feature (the return) in every state, read from hmmlearn's internal covariance
+# parameters. Models fitted on several features still name their regimes after the return's volatility.
+def state_variances(model):
+  covars = model._covars_
+  if model.covariance_type == "full":
+    return covars[:, 0, 0]
+  if model.covariance_type == "tied":
+    return np.zeros(model.n_components)  # one covariance shared by every state
+  return covars.reshape(model.n_components, -1)[:, 0]
+
+# Reorders the states of a fitted GaussianHMM from lowest to highest return variance in place, so
+# state 0 is always the calmest regime
+def order_states(model):
+  order = np.argsort(state_variances(model), kind="stable")
+  model.means_ = model.means_[order]
+  if model.covariance_type != "tied":
+    model.covars_ = model._covars_[order]
+  model.startprob_ = model.startprob_[order]
+  model.transmat_ = model.transmat_[np.ix_(order, order)]
+  return model
+
+# Rebuilds the fitted GaussianHMM stored in an artifact
+def load_model(path):
+  from hmmlearn.hmm import GaussianHMM
+
+  params, meta = load_params(path)
+  model = GaussianHMM(n_components=meta["n_components"], covariance_type=meta["covariance_type"])
+  model.n_features = params["means"].shape[1]
+  return set_params(model, params), meta
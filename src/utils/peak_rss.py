@@ -0,0 +1,60 @@
+import os
+import resource
+import runpy
+import sys
+from pathlib import Path
+
+# Peak resident memory of the current process, and a runner that makes a child process report its own.
+# ru_maxrss, of getrusage or os.wait4 alike, carries over the RSS a child inherited from its parent at
+# fork even after exec, so a small stage started by a large runner would report the runner's size.
+# VmHWM in /proc/self/status is the high-water mark of the process's current address space instead,
+# and writing 5 to /proc/self/clear_refs lowers it to the current RSS.
+#   python src/utils/peak_rss.py script.py [args]     (or -m module / -c code, as python takes them)
+# runs the script as python would and, on exit, writes its peak RSS in MB to the file named by
+# $PEAK_RSS_PATH. This module imports nothing from the project, as it starts with src/utils on sys.path.
+
+ENV = "PEAK_RSS_PATH"
+STATUS = "/proc/self/status"
+CLEAR_REFS = "/proc/self/clear_refs"
+
+# Peak RSS of this process in MB: VmHWM on Linux, ru_maxrss (KiB on Linux) where /proc is missing
+def peak_rss_mb():
+  try:
+    with open(STATUS) as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Lowers this process's peak RSS to its current RSS, returns False where that is not supported
+def reset_peak_rss():
+  try:
+    with open(CLEAR_REFS, "w") as f:
+      f.write("5")
+    return True
+  except OSError:
+    return False
+
+# Runs `script [args]`, `-m module [args]` or `-c code [args]` with the sys.argv and sys.path[0]
+# python would give it, then reports the peak RSS, also when it exits with an error
+def run(argv):
+  report = os.environ.pop(ENV, None)  # Not inherited by processes the script starts
+  try:
+    if argv[0] == "-m":
+      sys.argv, sys.path[0] = argv[1:], os.getcwd()
+      runpy.run_module(argv[1], run_name="__main__", alter_sys=True)
+    elif argv[0] == "-c":
+      sys.argv, sys.path[0] = argv[1:], ""
+      sys.argv[0] = "-c"
+      exec(compile(argv[1], "<string>", "exec"), {"__name__": "__main__"})
+    else:
+      sys.argv, sys.path[0] = argv, os.path.dirname(os.path.abspath(argv[0]))
+      runpy.run_path(argv[0], run_name="__main__")
+  finally:
+    if report:
+      Path(report).write_text(f"{peak_rss_mb():.1f}")
+
+if __name__ == "__main__":
+  run(sys.argv[1:])
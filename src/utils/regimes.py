@@ -0,0 +1,31 @@
+# Names and plot colours of the regimes of a K-state model. States are ordered from lowest to
+# highest variance (see model_store.order_states), so state 0 is always low_vol and the last
+# state is always high_vol. A single state has no regimes to tell apart, so models need at least 2.
+
+def regime_labels(n_states):
+  if n_states < 2:
+    raise ValueError(f"Regime models need at least 2 states, got {n_states}.")
+  if n_states == 2:
+    return ["low_vol", "high_vol"]
+  if n_states == 3:
+    return ["low_vol", "mid_vol", "high_vol"]
+  return ["low_vol"] + [f"vol_{i}" for i in range(1, n_states - 1)] + ["high_vol"]
+
+def prob_columns(n_states):
+  return [f"{label}_prob" for label in regime_labels(n_states)]
+
+# Plot colours running from green (low volatility) to red (high volatility)
+def regime_colors(n_states):
+  if n_states < 2:
+    raise ValueError(f"Regime models need at least 2 states, got {n_states}.")
+  if n_states == 2:
+    return ["green", "red"]
+  if n_states == 3:
+    return ["green", "orange", "red"]
+  import matplotlib.pyplot as plt
+  cmap = plt.get_cmap("RdYlGn_r")
+  return [cmap(i / (n_states - 1)) for i in range(n_states)]
+
+# Legend label of a regime, e.g. low_vol -> Low Volatility
+def regime_title(label):
+  return label.replace("_vol", " Volatility").replace("_", " ").title()
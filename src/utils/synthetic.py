@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic OHLCV bars drawn from a known Gaussian HMM on log returns, used by the benchmarks to time
+# the pipeline at any size and to check that a fit recovers the parameters it was generated with.
+# States are listed from lowest to highest volatility, matching the order run_model.py fits them in.
+TRUE_PARAMS = {
+  "startprob": [1.0, 0.0],
+  "transmat": [[0.99, 0.01], [0.03, 0.97]],
+  "means": [0.0006, -0.0010],
+  "stds": [0.009, 0.025],
+}
+
+# Dates start the day after the 2000-03-20 cutoff of process_returns.load_prices. Business days run
+# out of pandas' date range past ~60k bars, so longer series use minute bars.
+START_DATE = "2000-03-21"
+MAX_DAILY_BARS = 50_000
+
+# State path of a Markov chain, drawn one regime spell at a time (spell lengths are geometric), so a
+# 10M-bar path only loops over its few hundred thousand spells
+def simulate_states(rng, n_bars, startprob, transmat):
+  transmat = np.asarray(transmat, dtype=float)
+  states = np.empty(n_bars, dtype=np.int64)
+  state = rng.choice(len(startprob), p=startprob)
+  t = 0
+  while t < n_bars:
+    stay = transmat[state, state]
+    length = rng.geometric(1 - stay) if stay < 1 else n_bars
+    states[t:t + length] = state
+    t += length
+    leave = transmat[state].copy()
+    leave[state] = 0.0
+    if leave.sum() > 0:
+      state = rng.choice(len(leave), p=leave / leave.sum())
+  return states
+
+# n_bars of OHLCV data and the true state of every bar. The close follows the HMM's log returns,
+# open/high/low are noise around it and volume rises with the state's volatility.
+def generate_ohlcv(n_bars, seed=0, params=TRUE_PARAMS):
+  rng = np.random.default_rng(seed)
+  means = np.asarray(params["means"], dtype=float)
+  stds = np.asarray(params["stds"], dtype=float)
+  states = simulate_states(rng, n_bars, params["startprob"], params["transmat"])
+
+  sigma = stds[states]
+  log_ret = means[states] + sigma * rng.standard_normal(n_bars)
+  log_ret[0] = 0.0
+  close = 100.0 * np.exp(np.cumsum(log_ret))
+  prev_close = np.concatenate([[close[0]], close[:-1]])
+  open_ = prev_close * np.exp(0.2 * sigma * rng.standard_normal(n_bars))
+  high = np.maximum(open_, close) * np.exp(0.5 * sigma * np.abs(rng.standard_normal(n_bars)))
+  low = np.minimum(open_, close) * np.exp(-0.5 * sigma * np.abs(rng.standard_normal(n_bars)))
+  volume = np.round(np.exp(np.log(1e6) + sigma / stds.min() * 0.3 + 0.25 * rng.standard_normal(n_bars)))
+
+  freq = "B" if n_bars <= MAX_DAILY_BARS else "min"
+  df = pd.DataFrame({
+    "date": pd.date_range(START_DATE, periods=n_bars, freq=freq),
+    "open": open_, "high": high, "low": low, "close": close, "adj_close": close,
+    "volume": volume.astype(np.int64)
+  })
+  return df, states
+
+# Compares fitted parameters and decoded states with the generator's, matching states by order
+def recovery_errors(means, stds, transmat, true_states, fitted_states, params=TRUE_PARAMS):
+  true_means = np.asarray(params["means"], dtype=float)
+  true_stds = np.asarray(params["stds"], dtype=float)
+  true_transmat = np.asarray(params["transmat"], dtype=float)
+  return {
+    "mean_abs_err": float(np.abs(np.ravel(means) - true_means).max()),
+    "std_rel_err": float((np.abs(np.ravel(stds) - true_stds) / true_stds).max()),
+    "transmat_abs_err": float(np.abs(np.asarray(transmat) - true_transmat).max()),
+    "state_accuracy": float(np.mean(np.asarray(true_states) == np.asarray(fitted_states))),
+  }
@@ -0,0 +1,153 @@
+import io
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+
+from utils import peak_rss
+
+# Per-stage instrumentation for the pipeline runner. Stages run as functions in the runner's process,
+# or as child processes reaped with os.wait4 so their own CPU time is read back alongside the wall
+# time. Peak RSS is measured in the process that ran the stage (see utils.peak_rss). Every stage
+# becomes one trace entry; the runner collects them into a JSON trace file per run.
+
+# Runs a command like subprocess.run(capture_output=True, text=True) and also returns its resource use.
+# Peak RSS is the one the child reports when started through probed_command, None otherwise.
+def run_process(cmd, env=None, cwd=None):
+  # Output goes to files: a full pipe would block the child while we wait on it
+  with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err, tempfile.TemporaryDirectory() as tmp:
+    report = Path(tmp) / "peak_rss"
+    env = {**(os.environ if env is None else env), peak_rss.ENV: str(report)}
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=out, stderr=err, env=env, cwd=cwd)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    out.seek(0)
+    err.seek(0)
+    result = subprocess.CompletedProcess(cmd, proc.returncode, out.read().decode(errors="replace"), err.read().decode(errors="replace"))
+    max_rss = float(report.read_text()) if report.exists() else None
+  return result, {
+    "wall_s": round(wall, 4),
+    "cpu_user_s": round(usage.ru_utime, 4),
+    "cpu_sys_s": round(usage.ru_stime, 4),
+    "max_rss_mb": max_rss
+  }
+
+# Calls a stage function in this process the way run_process runs a script: its output is captured,
+# and an exception becomes return code 1 with the traceback as stderr. Returns the result, the
+# function's return value and its resource use. CPU time includes worker processes the function
+# waited for. Peak RSS is this process's peak while the function ran, which counts what earlier
+# stages still hold; where it cannot be reset (outside Linux) it is the peak of the whole run so far.
+def run_inline(fn, *args, profile_path=None, **kwargs):
+  out, err = io.StringIO(), io.StringIO()
+  profiler = None
+  if profile_path:
+    import cProfile
+
+    Path(profile_path).parent.mkdir(parents=True, exist_ok=True)
+    profiler = cProfile.Profile()
+  peak_rss.reset_peak_rss()
+  before = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+  start = time.perf_counter()
+  value, returncode = None, 0
+  with redirect_stdout(out), redirect_stderr(err):
+    try:
+      value = profiler.runcall(fn, *args, **kwargs) if profiler else fn(*args, **kwargs)
+    except Exception:
+      traceback.print_exc()
+      returncode = 1
+  wall = time.perf_counter() - start
+  after = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+  max_rss = peak_rss.peak_rss_mb()
+  if profiler:
+    profiler.dump_stats(profile_path)
+  result = subprocess.CompletedProcess(fn.__name__, returncode, out.getvalue(), err.getvalue())
+  return result, value, {
+    "wall_s": round(wall, 4),
+    "cpu_user_s": round(sum(a.ru_utime - b.ru_utime for a, b in zip(after, before)), 4),
+    "cpu_sys_s": round(sum(a.ru_stime - b.ru_stime for a, b in zip(after, before)), 4),
+    "max_rss_mb": round(max_rss, 1)
+  }
+
+# Command that runs a Python script (or -m module, -c code) and reports its peak RSS to run_process
+def probed_command(python, *args):
+  return [python, peak_rss.__file__, *args]
+
+# Command that runs a stage script, optionally under a profiler writing to profile_path
+def profiled_command(python, script, profiler=None, profile_path=None):
+  if profiler is None:
+    return probed_command(python, script)
+  Path(profile_path).parent.mkdir(parents=True, exist_ok=True)
+  if profiler == "cprofile":
+    return probed_command(python, "-m", "cProfile", "-o", str(profile_path), script)
+  if profiler == "py-spy":
+    return ["py-spy", "record", "--format", "speedscope", "-o", str(profile_path), "--"] + probed_command(python, script)
+  raise ValueError(f"Unknown profiler '{profiler}', expected 'cprofile' or 'py-spy'.")
+
+# Number of data rows of a CSV file (lines minus the header), counted without parsing it
+def count_csv_rows(path):
+  lines, last = 0, b"\n"
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+      lines += chunk.count(b"\n")
+      last = chunk[-1:]
+  return max(lines + (last != b"\n") - 1, 0)
+
+# Size and, for CSV files and columnar tables, row count of every file. A CSV exported next to its
+# columnar table is not counted again.
+def file_stats(paths, count_rows=True):
+  tables = {Path(p) for p in paths if Path(p).is_dir()}
+  stats = []
+  for path in paths:
+    p = Path(path)
+    entry = {"path": str(path), "bytes": p.stat().st_size if p.exists() else None, "rows": None}
+    if p.is_dir():
+      entry["bytes"] = sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+      if (p / "manifest.json").exists():
+        entry["rows"] = json.loads((p / "manifest.json").read_text())["n_rows"]
+    elif count_rows and p.suffix == ".csv" and p.exists() and p.with_suffix(".cols") not in tables:
+      entry["rows"] = count_csv_rows(p)
+    stats.append(entry)
+  return stats
+
+# Fit statistics of the model artifacts among a stage's outputs
+def model_stats(paths):
+  from utils.model_store import load_params
+
+  for path in paths:
+    if str(path).endswith(".npz") and Path(path).exists():
+      _, meta = load_params(path)
+      return {k: meta.get(k) for k in ("n_components", "covariance_type", "n_iter", "converged", "log_likelihood", "n_train")}
+  return None
+
+# One trace entry: the stage's resource use plus what it read and wrote
+def stage_entry(stage, symbol, status, usage, inputs, outputs, count_rows=True, profile=None):
+  entry = {"stage": stage, "symbol": symbol, "status": status, **usage}
+  entry["inputs"] = file_stats(inputs, count_rows)
+  entry["outputs"] = file_stats(outputs, count_rows) if status != "failed" else []
+  for side in ("inputs", "outputs"):
+    entry[f"{side[:-1]}_bytes"] = sum(f["bytes"] or 0 for f in entry[side])
+    entry[f"{side[:-1]}_rows"] = sum(f["rows"] or 0 for f in entry[side])
+  if status != "failed":
+    model = model_stats(outputs)
+    if model:
+      entry["model"] = model
+  if profile:
+    entry["profile"] = str(profile)
+  return entry
+
+# Writes a run's trace to <trace_dir>/<run_id>.json and mirrors it to latest.json
+def write_trace(trace_dir, run):
+  root = Path(trace_dir)
+  root.mkdir(parents=True, exist_ok=True)
+  text = json.dumps(run, indent=2, default=str)
+  path = root / f"{run['run_id']}.json"
+  path.write_text(text)
+  (root / "latest.json").write_text(text)
+  return path
@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from hmmlearn.hmm import GaussianHMM
+
+from utils.model_store import order_states, set_params
+
+# Walk-forward regime labelling. The HMM is refit on an expanding or rolling window that ends at the
+# start of each out-of-sample block (e.g. each month). The block is then labelled by forward
+# filtering only, so no label depends on data after its own bar. The blocks are stitched into one
+# out-of-sample probability table.
+#
+# Every refit warm-starts from the initial window's fit, so the blocks are independent of each other
+# and fitted in parallel. The number of workers only changes the scheduling, never the labels.
+
+# Start and end positions of every out-of-sample block, one block per calendar period after the
+# initial training window
+def block_bounds(index, first_test, freq):
+  periods = index[first_test:].to_period(freq)
+  starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]]) + first_test
+  ends = np.r_[starts[1:], len(index)]
+  return list(zip(starts.tolist(), ends.tolist()))
+
+# Forward-filters a block of observations starting from the filtered probabilities of the bar
+# before it. Works in log space so any covariance type of the model is supported.
+def forward_filter(model, X, prev_probs):
+  log_b = model._compute_log_likelihood(X)
+  log_a = np.log(model.transmat_)
+  log_alpha = np.log(np.maximum(prev_probs, 1e-300))
+  out = np.empty((len(X), model.n_components))
+  for t in range(len(X)):
+    log_alpha = np.logaddexp.reduce(log_alpha[:, None] + log_a, axis=0) + log_b[t]
+    log_alpha -= np.logaddexp.reduce(log_alpha)
+    out[t] = np.exp(log_alpha)
+  return out
+
+def fit_window(X, model_kwargs, init_params=None):
+  model = GaussianHMM(**model_kwargs)
+  if init_params is not None:
+    set_params(model, init_params)
+    model.init_params = ""
+  model.fit(X)
+  return order_states(model)
+
+def get_params(model):
+  return {"startprob": model.startprob_, "transmat": model.transmat_, "means": model.means_, "covars": model._covars_}
+
+# Fits the window before one block, warm-started from the anchor fit, and filters the block
+def _run_block(args):
+  X, (start, end), window, rolling_bars, model_kwargs, anchor = args
+  train_start = max(0, start - rolling_bars) if window == "rolling" else 0
+  model = fit_window(X[train_start:start], model_kwargs, anchor)
+  prev_probs = model.predict_proba(X[train_start:start])[-1]
+  return forward_filter(model, X[start:end], prev_probs), model, (train_start, start)
+
+# Runs the walk-forward over X (rows aligned with index). Returns the out-of-sample filtered
+# probabilities as a DataFrame, the last window's model and that window's (start, end) training rows.
+def walk_forward(X, index, first_test, model_kwargs, freq="M", window="expanding", rolling_bars=None, workers=None):
+  if window not in ("expanding", "rolling"):
+    raise ValueError(f"Unknown walk-forward window '{window}', expected 'expanding' or 'rolling'.")
+  blocks = block_bounds(index, first_test, freq)
+  train_start = max(0, first_test - rolling_bars) if window == "rolling" else 0
+  anchor = get_params(fit_window(X[train_start:first_test], model_kwargs))
+
+  workers = min(workers or os.cpu_count(), len(blocks))
+  tasks = [(X, block, window, rolling_bars, model_kwargs, anchor) for block in blocks]
+  if workers > 1:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      results = list(pool.map(_run_block, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+  else:
+    results = [_run_block(task) for task in tasks]
+
+  probs = np.concatenate([r[0] for r in results])
+  return pd.DataFrame(probs, index=index[first_test:]), results[-1][1], results[-1][2]
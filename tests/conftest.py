@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# The pipeline scripts import their helpers as top-level modules (e.g. utils.config), as they do
+# when run from src/, so make src importable the same way for the tests.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+# Fits a 2-state GaussianHMM, with its states ordered from calmest to most volatile unless ordered=False
+@pytest.fixture
+def fit_hmm():
+    from hmmlearn.hmm import GaussianHMM
+    from utils.model_store import order_states
+
+    def fit(X, covariance_type="diag", n_iter=50, seed=0, ordered=True):
+        model = GaussianHMM(n_components=2, covariance_type=covariance_type, n_iter=n_iter, random_state=seed).fit(X)
+        return order_states(model) if ordered else model
+    return fit
+
+# Generated bars as process_returns.py leaves them: indexed by date, prices rounded to cents, with the
+# simple and log close-to-close returns, plus the true state of every bar
+def processed_bars(n_bars, seed=0):
+    from utils.synthetic import generate_ohlcv
+
+    df, states = generate_ohlcv(n_bars, seed=seed)
+    df = df.set_index("date")
+    prices = ["open", "high", "low", "close", "adj_close"]
+    df[prices] = df[prices].round(2)
+    df["simple_ret"] = df["close"] / df["close"].shift(1) - 1.0
+    df["log_ret"] = np.log(df["close"]).diff()
+    df["state"] = states
+    return df
+
+# Zero-mean returns in spells of known volatility, one (n_bars, std) pair per spell, shaped
+# (bars, n_features) for fitting an HMM
+def regime_returns(spells=((300, 0.01), (100, 0.03), (100, 0.01)), n_features=1, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.normal(0, std, (n, n_features)) for n, std in spells])
+
+# Geometric random-walk prices starting at 100, one column per path (a 1-D array without n_paths)
+def random_walk(n_bars, n_paths=None, drift=0.0, vol=0.01, seed=0):
+    shape = n_bars if n_paths is None else (n_bars, n_paths)
+    return 100 * np.exp(np.cumsum(np.random.default_rng(seed).normal(drift, vol, shape), axis=0))
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+from src.backtest_engine import cost_mask, equity_curve, parameter_sweep, position_mask, run_strategies, threshold_positions
+from src.metrics_engine import summary_metrics
+from conftest import random_walk
+
+STRATEGIES = {
+    "buy_and_hold": {"positions": {0: 1, 1: 1}},
+    "risk_averse": {"positions": {0: 1, 1: 0}},
+    "risk_seeking": {"positions": {0: 0, 1: 1}},
+    "dollar_cost_averaging": {"type": "dca"},
+}
+
+# Random prices and states, 30% of them volatile
+def make_series(n=500, seed=0):
+    return pd.Series(random_walk(n, seed=seed)), (np.random.default_rng(seed + 1).random(n) < 0.3).astype(int)
+
+# Per-day reference implementation of the original backtest loop
+def legacy_backtest(prices, states, cost):
+    px = prices.values
+    init_money = px[0] * (1 - cost)
+    ra = np.full(len(px), init_money)
+    rs = np.full(len(px), init_money)
+    for day in range(1, len(px)):
+        ratio = px[day] / px[day - 1]
+        prev, cur = states[day - 1], states[day]
+        ra[day] = ra[day - 1] * (ratio if prev == 0 else 1) * ((1 - cost) if prev != cur else 1)
+        rs[day] = rs[day - 1] * (ratio if prev == 1 else 1) * ((1 - cost) if prev != cur else 1)
+    invest_per_day = init_money / len(px)
+    shares = 0
+    dca = np.full(len(px), invest_per_day)
+    for day in range(1, len(px)):
+        shares += (invest_per_day * (1 - cost)) / px[day]
+        dca[day] = shares * px[day]
+    bh = px * (init_money / px[0])
+    return {"buy_and_hold": bh, "risk_averse": ra, "risk_seeking": rs, "dollar_cost_averaging": dca}
+
+# Makes sure the vectorized strategies reproduce the per-day loop
+def test_matches_legacy_loop():
+    prices, states = make_series()
+    cost = 0.001
+    curves = run_strategies(prices, states, STRATEGIES, prices.iloc[0] * (1 - cost), default_cost=cost)
+    expected = legacy_backtest(prices, states, cost)
+    for name, values in expected.items():
+        np.testing.assert_allclose(curves[name].values, values, rtol=1e-12)
+    assert curves.index.equals(prices.index)
+
+# Makes sure costs are only charged on bars where the exposure changes
+def test_cost_mask_charges_turnover():
+    pos = position_mask(np.array([0, 0, 1, 1, 0]), {0: 1, 1: 0})
+    np.testing.assert_array_equal(pos, [1, 1, 0, 0, 1])
+    np.testing.assert_allclose(cost_mask(pos, 0.01), [1, 1, 0.99, 1, 0.99])
+
+# Makes sure a flat strategy never moves away from its initial value
+def test_flat_strategy_is_constant():
+    prices, states = make_series(n=50)
+    curve = equity_curve(prices, states, {0: 0, 1: 0}, cost=0.01, init_money=10.0)
+    np.testing.assert_allclose(curve, 10.0)
+
+
+# Makes sure threshold rules enter at the entry threshold, exit at the exit threshold and hold in between
+def test_threshold_positions_hysteresis():
+    prob = np.array([0.5, 0.8, 0.7, 0.65, 0.55, 0.9, 0.6])
+    pos = threshold_positions(prob, np.array([0.75, 0.75]), np.array([0.75, 0.6]))
+    np.testing.assert_array_equal(pos[:, 0], [0, 1, 0, 0, 0, 1, 0])
+    np.testing.assert_array_equal(pos[:, 1], [0, 1, 1, 1, 0, 1, 0])
+
+# Makes sure every sweep cell matches the metrics of the same rule run through equity_curve
+def test_sweep_matches_single_runs():
+    prices, _ = make_series(n=400)
+    prob = pd.Series(np.random.default_rng(1).random(400)).rolling(10, min_periods=1).mean().values
+    costs = [0.0, 0.002]
+    table = parameter_sweep(prices.values, prob, [0.45, 0.5, 0.55], {"start": 0.0, "stop": 0.1, "num": 3}, costs, 100.0, prices.iloc[0], max_chunk_mb=0.01)
+    assert len(table) == 3 * 3 * 2
+    for _, row in table.iterrows():
+        pos = threshold_positions(prob, np.array([row["entry"]]), np.array([row["exit"]]))[:, 0]
+        curve = equity_curve(prices, (pos == 0).astype(int), {0: 1, 1: 0}, row["cost"], 100.0)
+        expected = summary_metrics(curve[:, None], prices.iloc[0])
+        for name, value in expected.items():
+            assert np.isclose(row[name], value[0], atol=1e-9, equal_nan=True)
+        assert row["Trades"] == np.abs(np.diff(pos)).sum()
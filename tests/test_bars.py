@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+from utils.bars import bar_dates, bar_labels, periods_per_year
+
+DAILY = {"frequency": "1d", "session": None, "trading_days": 252}
+FIVE_MIN = {"frequency": "5m", "session": "09:30-16:00", "trading_days": 252}
+
+# Makes sure annualization follows the bar frequency and the session length
+def test_periods_per_year():
+    assert periods_per_year(DAILY) == 252
+    assert periods_per_year(FIVE_MIN) == 252 * 78
+    assert periods_per_year({**FIVE_MIN, "frequency": "1h"}) == 252 * 7
+    assert periods_per_year({**FIVE_MIN, "frequency": "1h", "session": None}) == 365 * 24
+    with pytest.raises(ValueError):
+        periods_per_year({**DAILY, "frequency": "1w"})
+
+# Makes sure daily forecast dates are the business days they always were, and intraday ones skip
+# from the session close to the next business day's open
+def test_bar_dates():
+    last = pd.Timestamp("2024-01-05")
+    pd.testing.assert_index_equal(bar_dates(last, 10), pd.date_range(last, periods=11, freq="B"))
+    dates = bar_dates(pd.Timestamp("2024-01-05 15:50"), 3, FIVE_MIN)
+    assert list(dates.strftime("%a %H:%M")) == ["Fri 15:50", "Fri 15:55", "Mon 09:30", "Mon 09:35"]
+    dates = bar_dates(pd.Timestamp("2024-01-05 15:55"), 200, FIVE_MIN)
+    assert len(dates) == 201 and dates.is_unique and (bar_labels(dates, FIVE_MIN) == dates).all()
+
+# Makes sure intraday bars are labelled from the session open and ticks outside the session dropped
+def test_bar_labels():
+    stamps = pd.DatetimeIndex(["2024-01-05 09:29:59", "2024-01-05 10:29:59", "2024-01-05 10:30:00", "2024-01-05 16:00:00"])
+    labels = bar_labels(stamps, {**FIVE_MIN, "frequency": "1h"})
+    assert labels[0] is pd.NaT and labels[3] is pd.NaT
+    assert list(labels[1:3].strftime("%H:%M")) == ["09:30", "10:30"]
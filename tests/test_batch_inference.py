@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from batch_inference import score_batch
+from conftest import regime_returns
+
+# Makes sure batched ragged scoring agrees with hmmlearn for every series and covariance type
+@pytest.mark.parametrize("covariance_type,n_features", [("diag", 1), ("full", 2), ("spherical", 2), ("tied", 2)])
+def test_matches_hmmlearn(covariance_type, n_features, fit_hmm):
+    series = [regime_returns([(n // 2, 0.01), (n - n // 2, 0.03), (n // 4, 0.01)], n_features, seed) for seed, n in enumerate([400, 250, 330])]
+    models = [fit_hmm(X, covariance_type, n_iter=30, seed=seed) for seed, X in enumerate(series)]
+    params = [{"startprob": m.startprob_, "transmat": m.transmat_, "means": m.means_, "covars": m._covars_} for m in models]
+    metas = [{"covariance_type": covariance_type}] * len(models)
+    results = score_batch(series, params, metas)
+    for X, model, (posteriors, states, log_likelihood) in zip(series, models, results):
+        assert posteriors.shape == (len(X), 2)
+        np.testing.assert_allclose(posteriors, model.predict_proba(X), atol=1e-8)
+        np.testing.assert_array_equal(states, model.predict(X))
+        np.testing.assert_allclose(log_likelihood, model.score(X), rtol=1e-10)
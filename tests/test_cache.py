@@ -0,0 +1,35 @@
+import os
+
+from src.utils import cache
+
+# Makes sure a stored stage can be restored and that changing an input changes its key
+def test_store_and_restore(tmp_path):
+    src = tmp_path / "input.csv"
+    out = tmp_path / "out" / "result.csv"
+    src.write_text("a,b\n1,2\n")
+    out.parent.mkdir()
+    out.write_text("result")
+    key = cache.stage_key("stage", [], [src], {"model.n_iter": 10})
+    cache.store(tmp_path / "cache", key, [out])
+
+    out.unlink()
+    assert cache.restore(tmp_path / "cache", key, [out])
+    assert out.read_text() == "result"
+
+    src.write_text("a,b\n1,3\n")
+    assert cache.stage_key("stage", [], [src], {"model.n_iter": 10}) != key
+    assert cache.stage_key("stage", [], [src], {"model.n_iter": 11}) != cache.stage_key("stage", [], [src], {"model.n_iter": 10})
+    assert not cache.restore(tmp_path / "cache", "missing", [out])
+
+# Makes sure eviction removes the least recently used entries first
+def test_evict_least_recently_used(tmp_path):
+    out = tmp_path / "result.bin"
+    out.write_bytes(b"x" * 100)
+    for i, key in enumerate(["old", "mid", "new"]):
+        cache.store(tmp_path / "cache", key, [out])
+        os.utime(tmp_path / "cache" / key / "manifest.json", (i, i))
+
+    kept_size = sum(f.stat().st_size for key in ["mid", "new"] for f in (tmp_path / "cache" / key).iterdir())
+    evicted = cache.evict(tmp_path / "cache", kept_size)
+    assert evicted == ["old"]
+    assert sorted(p.name for p in (tmp_path / "cache").iterdir()) == ["mid", "new"]
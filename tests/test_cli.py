@@ -0,0 +1,54 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from main import STAGE_GROUPS, parse_args, path_fields, stage_names, stage_paths, stages
+from utils.config import load_config
+
+# Makes sure plain `main.py [options]` still runs the whole pipeline and subcommands parse their options
+def test_parse_args():
+    args = parse_args([])
+    assert args.command == "run" and not args.force and args.from_stage is None
+    args = parse_args(["--force", "--isolated"])
+    assert args.command == "run" and args.force and args.isolated
+    args = parse_args(["ingest", "--append", "--symbol", "SPY"])
+    assert args.command == "ingest" and args.append and args.symbol == "SPY"
+    args = parse_args(["filter", "bars.csv", "--lag", "3"])
+    assert args.source == "bars.csv" and args.lag == 3
+
+# Makes sure every stage is in one group, and in-memory frames are given before they are taken
+def test_stage_groups_and_frames():
+    grouped = [name for group, names in STAGE_GROUPS.items() if group != "run" for name in names]
+    assert sorted(grouped) == sorted(stage_names) and STAGE_GROUPS["run"] == stage_names
+    given = set()
+    for stage in stages:
+        assert set(stage["takes"]) <= given
+        given |= set(stage["gives"])
+
+# Makes sure the CLI starts without importing the heavy libraries of the stages
+def test_lazy_imports():
+    root = Path(__file__).resolve().parent.parent
+    code = "import sys, main; print(sorted({m.split('.')[0] for m in sys.modules} & {'hmmlearn', 'matplotlib', 'scipy'}))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
+
+# Makes sure optional outputs, the sweep table and the resampled raw file, are tracked only when written
+def test_optional_outputs():
+    cfg = load_config(Path(__file__).resolve().parent.parent / "config" / "base.yaml")
+    backtest = stages[stage_names.index("backtest")]
+    resample = stages[stage_names.index("resample_bars")]
+    run_model = stages[stage_names.index("run_model")]
+    cfg["backtest"]["sweep"]["enabled"] = False
+    cfg["bars"]["resample"]["enabled"] = False
+    cfg["model_selection"]["enabled"] = False
+    fields = path_fields(cfg)
+    assert not any(p.endswith("_sweep.csv") for p in stage_paths(backtest["outputs"], fields, cfg["storage"]))
+    assert stage_paths(resample["outputs"], fields, cfg["storage"]) == []
+    assert not any(p.endswith("_model_selection.csv") for p in stage_paths(run_model["outputs"], fields, cfg["storage"]))
+    cfg["backtest"]["sweep"]["enabled"] = True
+    cfg["bars"]["resample"]["enabled"] = True
+    cfg["model_selection"]["enabled"] = True
+    fields = path_fields(cfg)
+    assert f"reports/{cfg['data']['symbol']}/tables/{cfg['data']['symbol']}_sweep.csv" in stage_paths(backtest["outputs"], fields, cfg["storage"])
+    assert stage_paths(resample["outputs"], fields, cfg["storage"]) == [cfg["data"]["raw_path"]]
+    assert f"reports/{cfg['data']['symbol']}/tables/{cfg['data']['symbol']}_model_selection.csv" in stage_paths(run_model["outputs"], fields, cfg["storage"])
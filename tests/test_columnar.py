@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.columnar import append_rows, load_table, read_manifest, save_table, tail_table, table_dir
+from conftest import processed_bars
+
+STORAGE = {"format": "columnar", "export_csv": True}
+
+# Makes sure every column loads back with its dtype and exact values, stored as small as it allows
+def test_round_trip_is_exact(tmp_path):
+    df = processed_bars(500)
+    path = tmp_path / "table.csv"
+    save_table(df, path, STORAGE)
+    pd.testing.assert_frame_equal(load_table(path, STORAGE), df)
+    specs = {c["name"]: c for c in read_manifest(path)["columns"]}
+    assert specs["close"]["stored"] == "<f4" and specs["close"]["decimals"] == 2
+    assert specs["state"]["stored"] == "|i1"
+    assert specs["log_ret"]["stored"] == "<f8"
+    # The CSV copy is the same table
+    pd.testing.assert_frame_equal(load_table(path), df, check_freq=False)
+
+# Makes sure a selection of columns and the last rows come back without the rest
+def test_column_and_tail_reads(tmp_path):
+    df = processed_bars(300)
+    path = tmp_path / "table.csv"
+    save_table(df, path, STORAGE)
+    pd.testing.assert_frame_equal(load_table(path, STORAGE, columns=["state", "close"]), df[["state", "close"]])
+    pd.testing.assert_frame_equal(tail_table(path, STORAGE, n=3), df.iloc[-3:])
+    pd.testing.assert_frame_equal(tail_table(path, n=3), df.iloc[-3:], check_freq=False, check_index_type=False)
+    with pytest.raises(KeyError):
+        load_table(path, STORAGE, columns=["missing"])
+
+# Makes sure appended rows match writing the whole table at once, including rows that do not fit the
+# stored dtypes (a float32 price with more decimals, an int column meeting a NaN)
+def test_append_matches_full_write(tmp_path):
+    df = processed_bars(400, seed=1)
+    full, appended = tmp_path / "full.csv", tmp_path / "appended.csv"
+    save_table(df, full, STORAGE)
+    save_table(df.iloc[:300], appended, STORAGE)
+    append_rows(df.iloc[300:350], appended, STORAGE)
+    pd.testing.assert_frame_equal(load_table(appended, STORAGE), df.iloc[:350], check_freq=False)
+
+    extra = df.iloc[350:].copy()
+    extra.iloc[0, extra.columns.get_loc("close")] = 123.456789
+    extra["state"] = extra["state"].astype(float)
+    extra.iloc[-1, extra.columns.get_loc("state")] = np.nan
+    append_rows(extra, appended, STORAGE)
+    expected = pd.concat([df.iloc[:350].astype({"state": float}), extra])
+    pd.testing.assert_frame_equal(load_table(appended, STORAGE), expected, check_freq=False)
+    assert read_manifest(appended)["n_rows"] == len(df)
+
+# Makes sure bytes left in the column files by an append that died before updating the manifest
+# are dropped by the next append
+def test_append_after_interrupted_append(tmp_path):
+    df = processed_bars(300)
+    path = tmp_path / "table.csv"
+    save_table(df.iloc[:200], path, {"format": "columnar", "export_csv": False})
+    for spec in read_manifest(path)["columns"]:
+        with open(table_dir(path) / spec["file"], "ab") as f:
+            f.write(b"\x07" * 13)
+    append_rows(df.iloc[200:], path, {"format": "columnar", "export_csv": False})
+    pd.testing.assert_frame_equal(load_table(path, STORAGE), df, check_freq=False)
+    for spec in read_manifest(path)["columns"]:
+        assert (table_dir(path) / spec["file"]).stat().st_size == len(df) * np.dtype(spec["stored"]).itemsize
+
+# Makes sure CSV-only storage writes no columnar directory
+def test_csv_format(tmp_path):
+    df = processed_bars(50)
+    path = tmp_path / "table.csv"
+    save_table(df, path, {"format": "csv", "export_csv": False})
+    assert path.exists() and not table_dir(path).exists()
+    pd.testing.assert_frame_equal(load_table(path, STORAGE), df, check_freq=False)
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import compute_features, feature_name, rolling_sum, update_features
+from utils.columnar import load_table, save_table
+from conftest import processed_bars
+
+SPECS = [
+    {"type": "column", "column": "log_ret"},
+    {"type": "realized_vol", "window": 21},
+    {"type": "parkinson_vol", "window": 10},
+    {"type": "garman_klass_vol", "window": 10},
+    {"type": "volume_z", "window": 63},
+    {"type": "return", "horizon": 5},
+]
+
+# Makes sure the running-sum windows match pandas, NaN included
+def test_rolling_sum_matches_pandas():
+    x = np.random.default_rng(0).standard_normal(500)
+    x[[0, 100, 101]] = np.nan
+    for window in (1, 5, 63):
+        expected = pd.Series(x).rolling(window).sum().values
+        np.testing.assert_allclose(rolling_sum(x, window), expected, rtol=1e-10, equal_nan=True)
+    assert np.isnan(rolling_sum(x[:3], 5)).all()
+
+def test_features_match_definitions():
+    df = processed_bars(300)
+    features = compute_features(df, SPECS, price="close")
+    assert list(features.columns) == [feature_name(s) for s in SPECS]
+    expected_rv = np.sqrt((df["log_ret"] ** 2).rolling(21).mean())
+    np.testing.assert_allclose(features["realized_vol_21"], expected_rv, rtol=1e-10, equal_nan=True)
+    log_v = np.log(df["volume"])
+    expected_z = (log_v - log_v.rolling(63).mean()) / log_v.rolling(63).std()
+    np.testing.assert_allclose(features["volume_z_63"], expected_z, rtol=1e-8, equal_nan=True)
+    np.testing.assert_allclose(features["return_5"], np.log(df["close"] / df["close"].shift(5)), rtol=1e-10, equal_nan=True)
+
+# Makes sure extending the stored features with new bars gives the same table as computing all of them
+@pytest.mark.parametrize("storage", [{"format": "columnar", "export_csv": False}, {"format": "csv", "export_csv": False}])
+def test_incremental_matches_full(tmp_path, storage):
+    df = processed_bars(1_000, seed=2)
+    processed_path, features_path = tmp_path / "processed.csv", tmp_path / "features.csv"
+    save_table(df.iloc[:800], processed_path, storage)
+    assert update_features(processed_path, features_path, SPECS, storage) == (800, False)
+    save_table(df, processed_path, storage)
+    assert update_features(processed_path, features_path, SPECS, storage) == (200, True)
+    assert update_features(processed_path, features_path, SPECS, storage) == (0, True)
+    stored = load_table(features_path, storage)
+    pd.testing.assert_frame_equal(stored, compute_features(df, SPECS), check_freq=False, check_exact=False, rtol=1e-9)
+
+    # A different feature list recomputes the table
+    assert update_features(processed_path, features_path, SPECS[:2], storage) == (1_000, False)
+    assert list(load_table(features_path, storage).columns) == ["log_ret", "realized_vol_21"]
+
+def test_unknown_feature():
+    with pytest.raises(ValueError):
+        feature_name({"type": "momentum", "window": 5})
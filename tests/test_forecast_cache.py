@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from forecast_cache import cached_forecast_bands, evict, record, stats
+from forecast_engine import forecast_bands
+
+P0 = np.array([0.7, 0.3])
+TRANSMAT = np.array([[0.98, 0.02], [0.05, 0.95]])
+MEANS = np.array([0.0005, -0.001])
+STDS = np.array([0.01, 0.03])
+
+def settings(cache_dir, method="monte_carlo", reuse_longer=False):
+    return {
+        "method": method, "n_sims": 500, "seed": 3, "max_chunk_mb": 64, "workers": 1, "grid_points": 1024, "extra_quantiles": [0.01],
+        "cache": {"enabled": True, "dir": str(cache_dir), "max_size_mb": 16, "reuse_longer": reuse_longer},
+    }
+
+# Makes sure a repeated forecast is served from the cache, scaled to the last price, and that any
+# changed input is a miss
+def test_hit_and_miss(tmp_path):
+    fc = settings(tmp_path)
+    bands, outcome = cached_forecast_bands(fc, 100.0, P0, TRANSMAT, MEANS, STDS, 50)
+    assert outcome == "miss"
+    np.testing.assert_allclose(bands, forecast_bands(fc, 100.0, P0, TRANSMAT, MEANS, STDS, 50), rtol=1e-12)
+
+    again, outcome = cached_forecast_bands(fc, 200.0, P0, TRANSMAT, MEANS, STDS, 50)
+    assert outcome == "hit"
+    np.testing.assert_allclose(again, 2 * bands, rtol=1e-12)
+
+    assert cached_forecast_bands(fc, 100.0, [0.6, 0.4], TRANSMAT, MEANS, STDS, 50)[1] == "miss"
+    assert cached_forecast_bands({**fc, "seed": 4}, 100.0, P0, TRANSMAT, MEANS, STDS, 50)[1] == "miss"
+    assert cached_forecast_bands({**fc, "workers": 2}, 100.0, P0, TRANSMAT, MEANS, STDS, 50)[1] == "hit"
+    assert stats(tmp_path) == {"hit": 2, "sliced": 0, "miss": 3}
+
+# Makes sure a shorter horizon is sliced from a cached longer one only when reuse_longer is set
+def test_reuse_longer(tmp_path):
+    long_bands, _ = cached_forecast_bands(settings(tmp_path, "density"), 1.0, P0, TRANSMAT, MEANS, STDS, 80)
+    assert cached_forecast_bands(settings(tmp_path, "density"), 1.0, P0, TRANSMAT, MEANS, STDS, 20)[1] == "miss"
+    bands, outcome = cached_forecast_bands(settings(tmp_path, "density", reuse_longer=True), 1.0, P0, TRANSMAT, MEANS, STDS, 30)
+    assert outcome == "sliced"
+    np.testing.assert_array_equal(bands, long_bands[:31])
+
+# Makes sure eviction removes the least recently used forecasts first
+def test_evict_least_recently_used(tmp_path):
+    fc = settings(tmp_path, "density")
+    for i, n_steps in enumerate([10, 20, 30]):
+        cached_forecast_bands(fc, 1.0, P0, TRANSMAT, MEANS, STDS, n_steps)
+        for path in tmp_path.glob(f"*_{n_steps}.npy"):
+            os.utime(path, (i, i))
+    sizes = {p.name: p.stat().st_size for p in tmp_path.glob("*.npy")}
+    evicted = evict(tmp_path, sum(sizes.values()) - 1)
+    assert len(evicted) == 1 and evicted[0].endswith("_10.npy")
+
+def record_many(cache_dir, outcome, n):
+    for _ in range(n):
+        record(cache_dir, outcome)
+
+# Makes sure processes counting at the same time never lose each other's counts, and that a count
+# file which cannot be parsed is skipped
+def test_stats_across_processes(tmp_path):
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(record_many, [tmp_path] * 8, ["hit", "miss"] * 4, [50] * 8))
+    (tmp_path / "stats-0.json").write_text('{"hit": 1')
+    assert stats(tmp_path) == {"hit": 200, "sliced": 0, "miss": 200}
@@ -0,0 +1,65 @@
+import numpy as np
+
+from forecast_engine import density_bands, monte_carlo_bands, quantile_label, regime_path, simulate_log_paths, stress_bands
+
+TRANSMAT = np.array([[0.98, 0.02], [0.05, 0.95]])
+MEANS = np.array([0.0005, -0.001])
+STDS = np.array([0.01, 0.03])
+
+# Makes sure each path keeps its regime when the transition matrix never switches
+def test_paths_follow_regime_chains():
+    rng = np.random.default_rng(0)
+    log_paths = simulate_log_paths(rng, 2000, 50, np.array([1.0, 0.0]), np.eye(2), MEANS, STDS)
+    steps = np.diff(log_paths, axis=0)
+    np.testing.assert_allclose(steps.std(), STDS[0], rtol=0.02)
+    np.testing.assert_allclose(steps.mean(), MEANS[0], atol=2e-4)
+
+# Makes sure the same seed reproduces the same bands
+def test_seeded_runs_are_reproducible():
+    a = monte_carlo_bands(100.0, [0.5, 0.5], TRANSMAT, MEANS, STDS, n_steps=20, n_sims=500, seed=7)
+    b = monte_carlo_bands(100.0, [0.5, 0.5], TRANSMAT, MEANS, STDS, n_steps=20, n_sims=500, seed=7)
+    np.testing.assert_array_equal(a, b)
+    assert (a[0] == 100.0).all()
+
+# Makes sure chunked histogram bands agree with the exact bands of a single in-memory run
+def test_chunked_bands_match_exact():
+    kwargs = dict(n_steps=40, n_sims=200_000, seed=3)
+    exact = monte_carlo_bands(100.0, [0.7, 0.3], TRANSMAT, MEANS, STDS, **kwargs)
+    chunked = monte_carlo_bands(100.0, [0.7, 0.3], TRANSMAT, MEANS, STDS, max_chunk_mb=5, workers=2, **kwargs)
+    np.testing.assert_allclose(chunked, exact, rtol=5e-3)
+
+# Makes sure the reported regime probabilities follow p0 @ A^t
+def test_regime_path():
+    path = regime_path(np.array([1.0, 0.0]), TRANSMAT, 3)
+    np.testing.assert_allclose(path[3], np.array([1.0, 0.0]) @ np.linalg.matrix_power(TRANSMAT, 3))
+
+# Makes sure density propagation matches the analytic bands of a single Gaussian regime
+def test_density_matches_single_regime():
+    from scipy.stats import norm
+
+    bands = density_bands(100.0, [1.0, 0.0], np.eye(2), MEANS, STDS, n_steps=50)
+    for t in (1, 10, 50):
+        expected = 100.0 * np.exp(t * MEANS[0] + np.sqrt(t) * STDS[0] * norm.ppf([0.5, 0.05, 0.95]))
+        np.testing.assert_allclose(bands[t, 1:], expected, rtol=1e-5)
+        np.testing.assert_allclose(bands[t, 0], 100.0 * np.exp(t * (MEANS[0] + STDS[0] ** 2 / 2)))
+
+# Makes sure density propagation agrees with a large Monte Carlo run of the full regime chain
+def test_density_matches_monte_carlo():
+    quantiles = (0.5, 0.05, 0.95, 0.01)
+    density = density_bands(100.0, [0.6, 0.4], TRANSMAT, MEANS, STDS, n_steps=30, quantiles=quantiles)
+    mc = monte_carlo_bands(100.0, [0.6, 0.4], TRANSMAT, MEANS, STDS, n_steps=30, n_sims=200_000, seed=5, quantiles=quantiles)
+    np.testing.assert_allclose(density, mc, rtol=5e-3)
+    assert quantile_label(0.01) == "p01" and quantile_label(0.995) == "p99_5"
+
+# Makes sure batched draws with identical parameters agree with one run, chunked or not
+def test_stress_bands_match_single_model():
+    n_draws = 40
+    kwargs = dict(n_steps=30, paths_per_draw=2500, seed=5)
+    draws = (np.repeat(TRANSMAT[None], n_draws, 0), np.repeat(MEANS[None], n_draws, 0), np.repeat(STDS[None], n_draws, 0))
+    bands, draw_bands, shortfall = stress_bands(100.0, [0.7, 0.3], *draws, **kwargs)
+    chunked, _, _ = stress_bands(100.0, [0.7, 0.3], *draws, max_chunk_mb=1, **kwargs)
+    exact = monte_carlo_bands(100.0, [0.7, 0.3], TRANSMAT, MEANS, STDS, n_steps=30, n_sims=100_000, seed=5)
+    np.testing.assert_allclose(bands, exact, rtol=5e-3)
+    np.testing.assert_allclose(chunked, exact, rtol=5e-3)
+    np.testing.assert_allclose(draw_bands[:, -1].mean(axis=0), exact[-1], rtol=5e-3)
+    assert draw_bands.shape == (n_draws, 31, 4) and (shortfall < draw_bands[:, -1, 2]).all()
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from metrics_engine import bootstrap_metrics, rolling_drawdown, rolling_sharpe, strategy_title, summary_metrics
+from conftest import random_walk
+
+# Per-strategy reference implementation of the original metrics loop
+def legacy_metrics(curve, base):
+    s = pd.Series(curve)
+    out = {
+        "Final Value ($)": round(s.iloc[-1], 2),
+        "Total Log Return (%)": round((s.iloc[-1] / base - 1) * 100, 2),
+        "Volatility (%)": round(np.std(np.log(s / s.shift(1)).dropna()) * np.sqrt(252) * 100, 2),
+        "CAGR (%)": round(((s.iloc[-1] / base) ** (1 / (len(s) / 252)) - 1) * 100, 2),
+    }
+    max_drawdown = (s / s.cummax() - 1.0).cummin().min()
+    out["Max Drawdown (%)"] = round(max_drawdown * 100, 1)
+    out["Calmar Ratio"] = round(out["CAGR (%)"] / abs(max_drawdown * 100), 3)
+    return out
+
+# Makes sure the vectorized metrics reproduce the per-strategy loop
+def test_matches_legacy_loop():
+    curves = random_walk(600, 3, drift=0.0003)
+    metrics = summary_metrics(curves, 95.0)
+    for j in range(curves.shape[1]):
+        for name, value in legacy_metrics(curves[:, j], 95.0).items():
+            assert np.isclose(metrics[name][j], value, rtol=1e-12)
+
+# Makes sure a (T, symbols, strategies) array scores every curve like its own column, NaN padding included
+def test_three_dimensional_with_padding():
+    curves = random_walk(600, 6, drift=0.0003).reshape(600, 2, 3)
+    curves[:100, 1] = np.nan
+    bases = np.array([[90.0], [110.0]])
+    metrics = summary_metrics(curves, bases)
+    assert metrics["CAGR (%)"].shape == (2, 3)
+    for i in range(2):
+        for j in range(3):
+            curve = curves[:, i, j]
+            expected = legacy_metrics(curve[~np.isnan(curve)], bases[i, 0])
+            for name, value in expected.items():
+                assert np.isclose(metrics[name][i, j], value, rtol=1e-12)
+
+# Makes sure the rolling metrics match pandas rolling windows
+def test_rolling_metrics():
+    curves = random_walk(600, 3, drift=0.0003)
+    window = 50
+    r = pd.DataFrame(np.log(curves[1:] / curves[:-1]))
+    expected = (r.rolling(window).mean() / r.rolling(window).std(ddof=0) * np.sqrt(252)).values
+    np.testing.assert_allclose(rolling_sharpe(curves, window)[1:], expected, rtol=1e-8, atol=1e-10)
+    assert np.isnan(rolling_sharpe(curves, window)[:window]).all()
+    peak = pd.DataFrame(curves).rolling(window, min_periods=1).max().values
+    np.testing.assert_allclose(rolling_drawdown(curves, window), curves / peak - 1.0)
+
+# Makes sure the bootstrap is reproducible, independent of the batch size, and brackets its estimate
+def test_bootstrap_batches():
+    curves = random_walk(400, 3, drift=0.0003)
+    a = bootstrap_metrics(curves, n_resamples=60, block_size=15, batch_size=7, seed=3)
+    b = bootstrap_metrics(curves, n_resamples=60, block_size=15, batch_size=60, seed=3)
+    for name in a:
+        np.testing.assert_allclose(a[name]["low"], b[name]["low"])
+        np.testing.assert_allclose(a[name]["high"], b[name]["high"])
+        assert (a[name]["low"] <= a[name]["high"]).all()
+    r = np.log(curves[1:] / curves[:-1])
+    np.testing.assert_allclose(a["Volatility (%)"]["estimate"], r.std(axis=0) * np.sqrt(252) * 100)
+    log_path = np.cumsum(r, axis=0)
+    worst = (log_path - np.maximum(np.maximum.accumulate(log_path, axis=0), 0)).min(axis=0)
+    np.testing.assert_allclose(a["Max Drawdown (%)"]["estimate"], (np.exp(worst) - 1) * 100)
+
+# Makes sure strategy keys become the original table labels
+def test_strategy_title():
+    assert strategy_title("buy_and_hold") == "Buy and Hold"
+    assert strategy_title("dollar_cost_averaging") == "Dollar Cost Averaging"
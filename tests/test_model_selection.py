@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from hmmlearn.hmm import GaussianHMM
+
+from model_selection import _em_round, n_parameters, select_model
+
+# Makes sure the free parameter counts follow the covariance structure
+def test_n_parameters():
+    # 1 start + 2 transition + 2 means + 2 variances
+    assert n_parameters(2, 1, "diag") == 7
+    assert n_parameters(3, 2, "full") == 2 + 6 + 6 + 9
+    assert n_parameters(3, 2, "tied") == 2 + 6 + 6 + 3
+    assert n_parameters(3, 2, "spherical") == 2 + 6 + 6 + 3
+
+# Makes sure BIC picks two regimes for data generated from two regimes
+def test_selects_true_number_of_states():
+    rng = np.random.default_rng(0)
+    X = np.concatenate([rng.normal(0, 0.01, 400), rng.normal(0, 0.04, 200), rng.normal(0, 0.01, 400)]).reshape(-1, 1)
+    model, table = select_model(X, [2, 3], ["diag"], n_restarts=4, n_iter=200, check_every=5, workers=1)
+    assert model.n_components == 2
+    assert table["selected"].sum() == 1
+    assert table.loc[table["selected"], "n_components"].item() == 2
+    assert (table["n_restarts"] == 4).all()
+
+# Makes sure a single-state model, which has no regimes to label, is refused up front
+def test_rejects_single_state():
+    X = np.random.default_rng(0).normal(0, 0.01, (100, 1))
+    with pytest.raises(ValueError, match="at least 2"):
+        select_model(X, [1, 2], ["diag"], n_restarts=2, workers=1)
+
+# Makes sure a round runs all of its iterations past hmmlearn's default of 10, and only reports
+# convergence when the log-likelihood stopped improving
+def test_em_round_runs_every_iteration():
+    X = np.random.default_rng(0).normal(0, 0.01, (300, 1))
+    model, _, converged = _em_round((X, GaussianHMM(n_components=2, tol=-np.inf, random_state=0), 25))
+    assert model.monitor_.iter == 25 and not converged
+    model, _, converged = _em_round((X, model, 25))
+    assert model.monitor_.iter == 25 and not converged
+    _, _, converged = _em_round((X, GaussianHMM(n_components=2, tol=1e3, random_state=0), 25))
+    assert converged
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from src.utils import model_store
+from conftest import regime_returns
+
+SPELLS = [(300, 0.01), (200, 0.03)]
+
+# Makes sure a saved model predicts exactly like the fitted one after loading
+def test_round_trip(tmp_path, fit_hmm):
+    X = regime_returns(SPELLS)
+    model = fit_hmm(X, ordered=False)
+    path = tmp_path / "model.npz"
+    meta = model_store.save_model(model, path, {"n_iter": 50}, X)
+    loaded, loaded_meta = model_store.load_model(path)
+
+    assert loaded_meta == meta
+    assert meta["data_fingerprint"] == model_store.data_fingerprint(X)
+    np.testing.assert_allclose(loaded.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_array_equal(loaded.predict(X), model.predict(X))
+
+# Makes sure artifacts written with another layout version are refused
+def test_rejects_other_versions(tmp_path, monkeypatch, fit_hmm):
+    X = regime_returns(SPELLS)
+    model = fit_hmm(X, ordered=False)
+    path = tmp_path / "model.npz"
+    model_store.save_model(model, path, {}, X)
+    monkeypatch.setattr(model_store, "ARTIFACT_VERSION", model_store.ARTIFACT_VERSION + 1)
+    with pytest.raises(ValueError):
+        model_store.load_params(path)
+
+# Makes sure spherical and tied models are reordered consistently. hmmlearn's covars_ getter returns
+# n_components * n_features matrices for spherical models, which order_states used to index past.
+@pytest.mark.parametrize("covariance_type", ["spherical", "tied"])
+def test_order_states_spherical_and_tied(covariance_type, fit_hmm):
+    X = regime_returns([(200, 0.03), (200, 0.01)], n_features=2)
+    model = fit_hmm(X, covariance_type, n_iter=30, ordered=False)
+    score = model.score(X)
+    model_store.order_states(model)
+    np.testing.assert_allclose(model.score(X), score, rtol=1e-10)
+    if covariance_type == "spherical":
+        assert np.all(model._covars_[0] < model._covars_[1])
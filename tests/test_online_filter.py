@@ -0,0 +1,28 @@
+import numpy as np
+
+from online_filter import RegimeFilter
+from conftest import regime_returns
+
+# Makes sure the incremental filter agrees with predict_proba on the last bar of every prefix
+def test_update_matches_batch_filtering(fit_hmm):
+    X = regime_returns()
+    model = fit_hmm(X)
+    start = 250
+    filt = RegimeFilter(model.transmat_, model.means_, model._covars_, model.predict_proba(X[:start])[-1])
+    for t in range(start, start + 60):
+        *probs, state = filt.update(X[t, 0])
+        expected = model.predict_proba(X[:t + 1])[-1]
+        np.testing.assert_allclose(probs, expected, atol=1e-10)
+        assert state == int(np.argmax(expected))
+
+# Makes sure the fixed-lag smoother revises the window like full smoothing over the same prefix
+def test_fixed_lag_smoother(fit_hmm):
+    X = regime_returns()
+    model = fit_hmm(X)
+    start, lag = 280, 5
+    filt = RegimeFilter(model.transmat_, model.means_, model._covars_, model.predict_proba(X[:start])[-1], lag=lag)
+    for t in range(start, start + 40):
+        filt.update(X[t, 0])
+    t = start + 39
+    expected = model.predict_proba(X[:t + 1])[t - lag:t + 1]
+    np.testing.assert_allclose(filt.smoothed(), expected, atol=1e-10)
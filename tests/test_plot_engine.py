@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from plot_engine import decimate, regime_figure, render, run_lengths, stored_hash
+
+# Makes sure decimation keeps the endpoints and every bucket's extremes, so the plotted range is unchanged
+def test_decimate_keeps_extremes():
+    y = np.random.default_rng(0).standard_normal(100_000).cumsum()
+    idx = decimate(y, 1_000)
+    assert len(idx) <= 1_002 and np.all(np.diff(idx) > 0)
+    assert idx[0] == 0 and idx[-1] == len(y) - 1
+    assert y[idx].min() == y.min() and y[idx].max() == y.max()
+    assert np.array_equal(decimate(y[:500], 1_000), np.arange(500))
+    assert np.array_equal(decimate(y, None), np.arange(len(y)))
+
+def test_run_lengths():
+    starts, ends, values = run_lengths([0, 0, 1, 1, 1, 0, 2])
+    assert starts.tolist() == [0, 2, 5, 6]
+    assert ends.tolist() == [2, 5, 6, 7]
+    assert values.tolist() == [0, 1, 0, 2]
+    assert len(run_lengths([])[0]) == 0
+
+# Makes sure a figure is only redrawn when its data changes
+def test_render_skips_unchanged_data(tmp_path):
+    n = 3_000
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        "low_vol_prob": rng.random(n), "high_vol_prob": rng.random(n), "state": rng.integers(0, 2, n),
+        "close": 100 + rng.standard_normal(n).cumsum(), "volume": rng.integers(1_000, 2_000, n), "log_ret": rng.standard_normal(n) / 100
+    }, index=pd.date_range("2010-01-01", periods=n, freq="B", name="date"))
+    path = tmp_path / "figure.png"
+    params = dict(symbol="TEST", price="close", returns="log_ret", max_points=500)
+    assert render(path, regime_figure, df, **params)
+    digest = stored_hash(path)
+    assert digest is not None
+    assert not render(path, regime_figure, df, **params)
+    df.iloc[-1, df.columns.get_loc("close")] += 1
+    assert render(path, regime_figure, df, **params)
+    assert stored_hash(path) != digest
+    assert render(path, regime_figure, df, skip_unchanged=False, **params)
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from process_returns import append_prices, compute_returns, load_prices, save_processed
+from utils.synthetic import generate_ohlcv
+
+SCHEMA = {"open": "float64", "high": "float64", "low": "float64", "close": "float64", "adj_close": "float64", "volume": "int64"}
+
+def write_raw(path, df, newest_first=False):
+    df = df.iloc[::-1] if newest_first else df
+    df.rename(columns={"date": "Date", "close": "Close"}).to_csv(path, index=False)
+
+def process(raw, out, **kwargs):
+    save_processed(compute_returns(load_prices(raw, schema=SCHEMA, **kwargs), price="close"), out)
+
+# Makes sure chunked reads give the same frame as one read, whatever order the raw rows are in
+def test_chunked_matches_whole_read(tmp_path):
+    df, _ = generate_ohlcv(2_500, seed=3)
+    for newest_first in (False, True):
+        raw = tmp_path / "raw.csv"
+        write_raw(raw, df, newest_first)
+        whole = load_prices(raw, schema=SCHEMA)
+        pd.testing.assert_frame_equal(load_prices(raw, schema=SCHEMA, chunk_rows=300), whole)
+        assert whole.index.is_monotonic_increasing and len(whole) == len(df)
+        assert whole["volume"].dtype == "int64"
+
+# Makes sure appending the new raw rows gives the same processed file as reprocessing everything
+def test_append_matches_full_reprocess(tmp_path):
+    df, _ = generate_ohlcv(1_200, seed=4)
+    for newest_first in (False, True):
+        raw, appended, full = tmp_path / "raw.csv", tmp_path / "appended.csv", tmp_path / "full.csv"
+        write_raw(raw, df.iloc[:1_000], newest_first)
+        process(raw, appended)
+        write_raw(raw, df, newest_first)
+        assert append_prices(raw, appended, price="close", schema=SCHEMA) == 200
+        assert append_prices(raw, appended, price="close", schema=SCHEMA) == 0
+        process(raw, full)
+        assert appended.read_text() == full.read_text()
+
+# Makes sure values that do not fit the schema are coerced to NaN instead of failing the load
+def test_unparseable_values_are_coerced(tmp_path):
+    raw = tmp_path / "raw.csv"
+    raw.write_text("date,open,close,volume\n2020-01-02,100,100.5,10\n2020-01-03,100.4,oops,\n2020-01-06,100.9,101.0,12\n2020-01-07,,,\n1999-01-04,99,99.0,5\n")
+    df = load_prices(raw, schema=SCHEMA)
+    assert list(df.index.strftime("%Y-%m-%d")) == ["2020-01-02", "2020-01-03", "2020-01-06"]
+    assert pd.isna(df.loc["2020-01-03", "close"]) and pd.isna(df.loc["2020-01-03", "volume"])
+    assert df["close"].dtype == "float64"
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import regime_service
+from forecast_cache import cached_forecast_bands
+from regime_service import RegimeService, start_server
+from utils.columnar import save_table
+from utils.model_store import model_path, save_model
+from conftest import regime_returns
+
+STORAGE = {"format": "columnar", "export_csv": False}
+FORECASTING = {"method": "density", "n_steps": 20, "n_sims": 100, "seed": 0, "max_chunk_mb": 64, "workers": 1, "grid_points": 1024, "extra_quantiles": []}
+
+# Fits a small 2-state model for a symbol and saves it with its probability table in the working directory
+def fit_symbol(fit_hmm, symbol, seed=0):
+    X = regime_returns(seed=seed)
+    model = fit_hmm(X, seed=seed)
+    save_model(model, model_path(symbol), {}, X)
+    dates = pd.bdate_range("2020-01-01", periods=len(X), name="date")
+    df = pd.DataFrame(model.predict_proba(X), index=dates, columns=["low_vol_prob", "high_vol_prob"])
+    df["state"] = model.predict(X)
+    df["close"] = 100 * np.exp(np.cumsum(X[:, 0]))
+    df["log_ret"] = X[:, 0]
+    save_table(df, f"reports/{symbol}/tables/{symbol}_probs_states.csv", STORAGE)
+    return model, X, df
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = {
+        "data": {"price_col": "close"},
+        "model": {"target_col": "log_ret"},
+        "storage": STORAGE,
+        "forecasting": FORECASTING,
+        "service": {"max_symbols": 2, "max_steps": 100},
+    }
+    return RegimeService(cfg)
+
+# Makes sure the regime, distribution and forecast queries answer from the saved model and table
+def test_queries(service, fit_hmm):
+    model, X, df = fit_symbol(fit_hmm, "AAA")
+    status, regime = service.handle("GET", "/regime/AAA")
+    assert status == 200 and regime["state"] == df["state"].iloc[-1]
+    np.testing.assert_allclose(list(regime["probs"].values()), df[["low_vol_prob", "high_vol_prob"]].iloc[-1])
+
+    status, dist = service.handle("GET", "/distribution/AAA?steps=5")
+    expected = df[["low_vol_prob", "high_vol_prob"]].iloc[-1].values @ np.linalg.matrix_power(model.transmat_, 5)
+    np.testing.assert_allclose(list(dist["probs"].values()), expected)
+
+    status, fc = service.handle("GET", "/forecast/AAA?steps=10")
+    assert status == 200 and len(fc["dates"]) == 11 and len(fc["bands"]["p95"]) == 11
+    assert service.handle("GET", "/forecast/AAA?steps=10")[1] is fc
+    assert service.handle("GET", "/health")[1]["hits"] == 3
+
+    assert service.handle("GET", "/regime/MISSING")[0] == 404
+    assert service.handle("GET", "/distribution/AAA?steps=0")[0] == 400
+    assert service.handle("GET", "/forecast/AAA?steps=101")[0] == 400
+
+# Makes sure pushed bars advance the cached probabilities like filtering the longer history
+def test_push_bars(service, fit_hmm):
+    model, X, df = fit_symbol(fit_hmm, "AAA")
+    prices = df["close"].iloc[-1] * np.exp(np.cumsum([0.04, -0.05, 0.03]))
+    dates = pd.bdate_range(df.index[-1], periods=4)[1:]
+    bars = [{"date": d.isoformat(), "close": float(p)} for d, p in zip(dates, prices)]
+    service.handle("GET", "/forecast/AAA?steps=5")
+    status, regime = service.handle("POST", "/bars/AAA", json.dumps({"bars": bars + bars[:1]}).encode())
+    assert status == 200 and regime["applied"] == 3
+    returns = np.log(np.concatenate([[df["close"].iloc[-1]], prices]))
+    expected = model.predict_proba(np.concatenate([X[:, 0], np.diff(returns)]).reshape(-1, 1))[-1]
+    np.testing.assert_allclose(list(regime["probs"].values()), expected, atol=1e-10)
+    assert not service.get("AAA").forecasts
+
+# Makes sure the least recently used symbol is dropped beyond max_symbols
+def test_lru_eviction(service, fit_hmm):
+    for symbol in ("AAA", "BBB", "CCC"):
+        fit_symbol(fit_hmm, symbol)
+    service.handle("GET", "/regime/AAA")
+    service.handle("GET", "/regime/BBB")
+    service.handle("GET", "/regime/AAA")
+    service.handle("GET", "/regime/CCC")
+    assert list(service.symbols) == ["AAA", "CCC"]
+
+# Makes sure the asyncio server answers HTTP requests on a local port
+def test_http_round_trip(service, fit_hmm):
+    fit_symbol(fit_hmm, "AAA")
+
+    async def query():
+        server = await start_server(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /regime/AAA HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(query()).partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200") and json.loads(body)["symbol"] == "AAA"
+
+# Makes sure a refit symbol is reloaded from disk on its next query, dropping its cached forecasts
+def test_reload_after_refit(service, fit_hmm):
+    fit_symbol(fit_hmm, "AAA")
+    _, before = service.handle("GET", "/regime/AAA")
+    forecast = service.handle("GET", "/forecast/AAA?steps=5")[1]
+    _, _, df = fit_symbol(fit_hmm, "AAA", seed=3)
+    _, after = service.handle("GET", "/regime/AAA")
+    np.testing.assert_allclose(list(after["probs"].values()), df[["low_vol_prob", "high_vol_prob"]].iloc[-1])
+    assert after["probs"] != before["probs"]
+    assert service.handle("GET", "/forecast/AAA?steps=5")[1] is not forecast
+    assert service.handle("GET", "/health")[1]["misses"] == 2
+
+# Makes sure a malformed payload is a client error and any other failure a server error, over HTTP too
+def test_error_statuses(service, fit_hmm, monkeypatch):
+    fit_symbol(fit_hmm, "AAA")
+    status, payload = service.handle("POST", "/bars/AAA", json.dumps({"bars": [{"close": 101.0}]}).encode())
+    assert status == 400 and "date" in payload["error"]
+    assert service.handle("POST", "/bars/AAA", b"{not json")[0] == 400
+    assert service.handle("GET", "/unknown/AAA")[0] == 404
+
+    def failing(*args):
+        raise np.linalg.LinAlgError("Singular matrix")
+    monkeypatch.setattr(regime_service, "cached_forecast_bands", failing)
+    status, payload = service.handle("GET", "/forecast/AAA?steps=7")
+    assert status == 500 and payload["error"] == "LinAlgError: Singular matrix"
+    assert asyncio.run(service.handle_async("GET", "/forecast/AAA?steps=8"))[0] == 500
+
+# Makes sure a slow forecast miss does not hold up other queries, and concurrent requests for the same
+# forecast compute it once
+def test_forecast_miss_runs_off_the_event_loop(service, fit_hmm, monkeypatch):
+    fit_symbol(fit_hmm, "AAA")
+    calls = []
+
+    def slow_bands(*args):
+        calls.append(time.perf_counter())
+        time.sleep(0.5)
+        return cached_forecast_bands(*args)
+    monkeypatch.setattr(regime_service, "cached_forecast_bands", slow_bands)
+
+    async def query():
+        first = asyncio.create_task(service.handle_async("GET", "/forecast/AAA?steps=10"))
+        second = asyncio.create_task(service.handle_async("GET", "/forecast/AAA?steps=10"))
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        status, _ = await service.handle_async("GET", "/regime/AAA")
+        elapsed = time.perf_counter() - start
+        return status, elapsed, await first, await second
+
+    status, elapsed, first, second = asyncio.run(query())
+    assert status == 200 and elapsed < 0.1
+    assert first[0] == second[0] == 200 and first[1] == second[1]
+    assert len(calls) == 1
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample_bars import write_bars
+
+BARS = {"frequency": "5m", "session": "09:30-16:00", "trading_days": 252}
+
+# Random ticks over a few business days, some of them outside the session
+def write_ticks(path, n=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range("2024-01-05", periods=4)
+    stamps = days[rng.integers(0, len(days), n)] + pd.to_timedelta(rng.uniform(8, 17.5, n), unit="h")
+    ticks = pd.DataFrame({
+        "timestamp": stamps.sort_values().floor("ms"),
+        "price": 100 + np.cumsum(rng.normal(0, 0.05, n)),
+        "size": rng.integers(1, 500, n),
+    })
+    ticks.to_csv(path, index=False)
+    return ticks.set_index("timestamp")
+
+# Makes sure bars streamed in small chunks equal a one-shot pandas resample of the session's ticks
+def test_chunked_matches_one_shot(tmp_path):
+    ticks = write_ticks(tmp_path / "ticks.csv")
+    n_rows, n_bars = write_bars(tmp_path / "ticks.csv", tmp_path / "bars.csv", BARS, chunk_rows=733)
+    bars = pd.read_csv(tmp_path / "bars.csv", parse_dates=["date"], index_col="date")
+
+    session = ticks.between_time("09:30", "16:00", inclusive="left")
+    expected = session["price"].resample("5min").ohlc().assign(volume=session["size"].resample("5min").sum()).dropna()
+    expected.index = expected.index.astype(bars.index.dtype).rename("date")
+    assert n_rows == len(ticks) and n_bars == len(expected)
+    pd.testing.assert_frame_equal(bars, expected, check_freq=False)
+
+# Makes sure minute bars aggregate into the same hourly bars as the ticks they came from
+def test_minute_bars_aggregate_like_ticks(tmp_path):
+    write_ticks(tmp_path / "ticks.csv", seed=1)
+    hourly = {**BARS, "frequency": "1h"}
+    write_bars(tmp_path / "ticks.csv", tmp_path / "minutes.csv", {**BARS, "frequency": "1m"}, chunk_rows=1_000)
+    write_bars(tmp_path / "minutes.csv", tmp_path / "from_minutes.csv", hourly, chunk_rows=97)
+    write_bars(tmp_path / "ticks.csv", tmp_path / "from_ticks.csv", hourly, chunk_rows=5_000)
+    assert (tmp_path / "from_minutes.csv").read_text() == (tmp_path / "from_ticks.csv").read_text()
+    assert (tmp_path / "from_ticks.csv").read_text().splitlines()[1].startswith("2024-01-05 09:30:00,")
+
+# Makes sure a source out of time order fails instead of producing split bars
+def test_unsorted_source_fails(tmp_path):
+    ticks = write_ticks(tmp_path / "ticks.csv", n=2_000)
+    ticks.iloc[::-1].reset_index().to_csv(tmp_path / "ticks.csv", index=False)
+    with pytest.raises(ValueError, match="time order"):
+        write_bars(tmp_path / "ticks.csv", tmp_path / "bars.csv", BARS, chunk_rows=500)
@@ -0,0 +1,34 @@
+import numpy as np
+
+from stress_forecast import bootstrap_blocks, bootstrap_draws, perturb_draws
+from conftest import regime_returns
+
+TRANSMAT = np.array([[0.98, 0.02], [0.05, 0.95]])
+MEANS = np.array([0.0005, -0.001])
+STDS = np.array([0.01, 0.03])
+
+# Makes sure perturbed draws are valid, ordered models that tighten around the fit with more data
+def test_perturb_draws():
+    rng = np.random.default_rng(0)
+    transmats, means, stds = perturb_draws(rng, 500, TRANSMAT, MEANS, STDS, [5000, 50])
+    np.testing.assert_allclose(transmats.sum(axis=2), 1.0)
+    assert (np.diff(stds, axis=1) >= 0).all()
+    np.testing.assert_allclose(stds.mean(axis=0), STDS, rtol=0.05)
+    # The rarely visited regime is far less certain than the common one
+    assert stds[:, 1].std() / STDS[1] > 5 * stds[:, 0].std() / STDS[0]
+    _, _, tight = perturb_draws(rng, 500, TRANSMAT, MEANS, STDS, [50000, 5000])
+    assert tight[:, 1].std() < stds[:, 1].std() / 3
+
+# Makes sure bootstrap blocks cover the series length and refits stay close to the fitted model
+def test_bootstrap_draws(fit_hmm):
+    rng = np.random.default_rng(1)
+    starts, lengths = bootstrap_blocks(rng, 1000, 21)
+    assert lengths.sum() == 1000 and len(starts) == len(lengths) and (starts < 1000).all()
+
+    X = regime_returns([(600, 0.01), (200, 0.03), (200, 0.01)], seed=1)
+    model = fit_hmm(X)
+    params = {"startprob": model.startprob_, "transmat": model.transmat_, "means": model.means_, "covars": model._covars_}
+    meta = {"n_components": 2, "covariance_type": "diag"}
+    transmats, means, stds = bootstrap_draws(rng, 4, X, params, meta, block_size=50, n_iter=10, workers=1)
+    assert transmats.shape == (4, 2, 2) and means.shape == stds.shape == (4, 2)
+    np.testing.assert_allclose(stds.mean(axis=0), np.sqrt(model.covars_[:, 0, 0]), rtol=0.2)
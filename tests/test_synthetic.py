@@ -0,0 +1,34 @@
+import numpy as np
+from hmmlearn.hmm import GaussianHMM
+
+from utils.model_store import order_states
+from utils.synthetic import TRUE_PARAMS, generate_ohlcv, recovery_errors, simulate_states
+
+# Makes sure the bars are well-formed OHLCV on a strictly increasing date index
+def test_ohlcv_is_consistent():
+    df, states = generate_ohlcv(5_000, seed=1)
+    assert len(df) == len(states) == 5_000
+    assert df["date"].is_monotonic_increasing and df["date"].is_unique
+    assert (df["high"] >= df[["open", "close"]].max(axis=1)).all()
+    assert (df["low"] <= df[["open", "close"]].min(axis=1)).all()
+    assert (df["volume"] > 0).all()
+
+# Makes sure the spell-by-spell state path has the chain's stationary occupancy and switching rate
+def test_states_follow_transition_matrix():
+    transmat = np.array(TRUE_PARAMS["transmat"])
+    states = simulate_states(np.random.default_rng(0), 400_000, [1.0, 0.0], transmat)
+    stationary = np.array([transmat[1, 0], transmat[0, 1]]) / (transmat[0, 1] + transmat[1, 0])
+    assert np.allclose(np.bincount(states) / len(states), stationary, atol=0.02)
+    stays = states[1:][states[:-1] == 0] == 0
+    assert abs(stays.mean() - transmat[0, 0]) < 0.002
+
+# Makes sure a plain fit on the generated returns recovers the generator's parameters
+def test_fit_recovers_parameters():
+    df, states = generate_ohlcv(20_000, seed=2)
+    X = np.diff(np.log(df["close"].values)).reshape(-1, 1)
+    model = order_states(GaussianHMM(n_components=2, covariance_type="diag", n_iter=200, random_state=0).fit(X))
+    stds = np.sqrt(model._covars_[:, 0])
+    errors = recovery_errors(model.means_[:, 0], stds, model.transmat_, states[1:], model.predict(X))
+    assert errors["std_rel_err"] < 0.1
+    assert errors["transmat_abs_err"] < 0.02
+    assert errors["state_accuracy"] > 0.9
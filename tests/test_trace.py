@@ -0,0 +1,75 @@
+import sys
+
+import pytest
+
+from trace_diff import diff_traces
+from utils import peak_rss, trace
+
+# Makes sure a child's output, exit code and resource use are all captured
+def test_run_process_reports_usage():
+    code = "import sys; x = bytearray(64 * 2**20); print('hi'); sys.stderr.write('warn'); sys.exit(3)"
+    result, usage = trace.run_process(trace.probed_command(sys.executable, "-c", code))
+    assert result.returncode == 3
+    assert result.stdout.strip() == "hi" and result.stderr == "warn"
+    assert usage["max_rss_mb"] >= 64
+    assert usage["wall_s"] > 0
+
+# Makes sure a child's peak RSS is its own, not what it inherited from a larger parent at fork
+def test_run_process_peak_rss_is_the_childs():
+    held = bytearray(256 * 2**20)
+    held[::4096] = b"\x01" * len(held[::4096])
+    _, usage = trace.run_process(trace.probed_command(sys.executable, "-c", "pass"))
+    assert usage["max_rss_mb"] < 128
+    _, usage = trace.run_process([sys.executable, "-c", "pass"])
+    assert usage["max_rss_mb"] is None
+
+# Makes sure an in-process stage's output, return value and exceptions are captured like a child's
+def test_run_inline_captures_output(tmp_path):
+    def stage(n, scale=1):
+        print("hi")
+        return n * scale
+
+    def failing():
+        raise ValueError("bad input")
+
+    result, value, usage = trace.run_inline(stage, 2, scale=3)
+    assert result.returncode == 0 and result.stdout.strip() == "hi" and value == 6
+    assert usage["wall_s"] >= 0 and usage["max_rss_mb"] > 0
+    result, value, _ = trace.run_inline(failing)
+    assert result.returncode == 1 and value is None
+    assert result.stderr.strip().splitlines()[-1] == "ValueError: bad input"
+    trace.run_inline(stage, 1, profile_path=tmp_path / "prof" / "stage.prof")
+    assert (tmp_path / "prof" / "stage.prof").exists()
+
+# Makes sure an in-process stage's peak RSS does not include the peak of a stage before it
+@pytest.mark.skipif(not peak_rss.reset_peak_rss(), reason="peak RSS cannot be reset on this platform")
+def test_run_inline_peak_rss_is_the_stages():
+    def large():
+        x = bytearray(256 * 2**20)
+        x[::4096] = b"\x01" * len(x[::4096])
+
+    _, _, large_usage = trace.run_inline(large)
+    _, _, small_usage = trace.run_inline(lambda: None)
+    assert large_usage["max_rss_mb"] - small_usage["max_rss_mb"] >= 200
+
+# Makes sure CSV rows are counted with or without a trailing newline, and missing files have no size
+def test_file_stats(tmp_path):
+    (tmp_path / "a.csv").write_text("date,x\n2020-01-01,1\n2020-01-02,2\n")
+    (tmp_path / "b.csv").write_text("date,x\n2020-01-01,1")
+    stats = trace.file_stats([tmp_path / "a.csv", tmp_path / "b.csv", tmp_path / "missing.csv"])
+    assert [s["rows"] for s in stats] == [2, 1, None]
+    assert stats[2]["bytes"] is None
+
+def make_run(run_id, wall, rss, status="ok"):
+    stage = {"stage": "run_model", "symbol": "QQQ", "status": status, "wall_s": wall, "cpu_user_s": wall, "cpu_sys_s": 0.0,
+             "max_rss_mb": rss, "input_rows": 10, "output_rows": 10, "output_bytes": 100,
+             "model": {"n_iter": 5, "log_likelihood": 1.0}}
+    return {"run_id": run_id, "wall_s": wall, "stages": [stage]}
+
+# Makes sure only stages that ran in both traces and grew past the threshold are flagged
+def test_diff_flags_regressions():
+    diff = diff_traces(make_run("a", 1.0, 100), make_run("b", 1.5, 100), threshold=0.2)
+    assert diff.loc[("QQQ", "run_model"), "regressed"]
+    assert diff.loc[("QQQ", "run_model"), "wall_s_ratio"] == 1.5
+    diff = diff_traces(make_run("a", 1.0, 100), make_run("b", 0.0, 0, status="cached"))
+    assert not diff.loc[("QQQ", "run_model"), "regressed"]
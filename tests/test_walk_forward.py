@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from conftest import regime_returns
+from walk_forward import block_bounds, forward_filter, walk_forward
+
+MODEL_KWARGS = dict(n_components=2, covariance_type="diag", n_iter=50, random_state=0)
+
+def make_data(seed=0):
+    X = regime_returns([(300, 0.01), (60, 0.03), (200, 0.01)], seed=seed)
+    index = pd.bdate_range("2020-01-01", periods=len(X))
+    return X, index
+
+# Makes sure the out-of-sample blocks are whole calendar months after the training window
+def test_blocks_follow_periods():
+    _, index = make_data()
+    blocks = block_bounds(index, 250, "M")
+    assert blocks[0][0] == 250 and blocks[-1][1] == len(index)
+    for start, end in blocks[1:]:
+        assert index[start].month != index[start - 1].month
+        assert index[start].month == index[end - 1].month
+
+# Makes sure no out-of-sample label changes when later data changes
+def test_no_lookahead():
+    X, index = make_data()
+    probs, model, (fit_start, fit_end) = walk_forward(X, index, 250, MODEL_KWARGS, workers=1)
+    assert probs.index[0] == index[250] and len(probs) == len(X) - 250
+    np.testing.assert_allclose(probs.sum(axis=1), 1.0)
+
+    cutoff = block_bounds(index, 250, "M")[-2][0]
+    X_changed = X.copy()
+    X_changed[cutoff:] *= 3
+    changed, _, _ = walk_forward(X_changed, index, 250, MODEL_KWARGS, workers=1)
+    np.testing.assert_allclose(changed.loc[:index[cutoff - 1]], probs.loc[:index[cutoff - 1]])
+
+# Makes sure the labels and the final model do not depend on how many workers fit the blocks
+def test_independent_of_workers():
+    X, index = make_data()
+    probs, model, bounds = walk_forward(X, index, 250, MODEL_KWARGS, workers=1)
+    parallel, parallel_model, parallel_bounds = walk_forward(X, index, 250, MODEL_KWARGS, workers=3)
+    pd.testing.assert_frame_equal(parallel, probs)
+    np.testing.assert_array_equal(parallel_model.means_, model.means_)
+    assert parallel_bounds == bounds
+
+# Makes sure block filtering agrees with batch filtering of every prefix
+def test_forward_filter_matches_predict_proba(fit_hmm):
+    X, _ = make_data()
+    model = fit_hmm(X)
+    probs = forward_filter(model, X[300:320], model.predict_proba(X[:300])[-1])
+    for i, t in enumerate(range(300, 320)):
+        np.testing.assert_allclose(probs[i], model.predict_proba(X[:t + 1])[-1], atol=1e-10)